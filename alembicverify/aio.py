@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Asyncio counterparts of the helpers in :mod:`alembicverify.util`.
+
+They need Python 3 and SQLAlchemy 1.4 or later, with an async driver
+such as ``asyncpg`` or ``aiosqlite``.
+"""
+import asyncio
+import weakref
+
+from alembic.migration import MigrationContext
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from alembicverify.util import load_script_directory, upgrade
+
+
+_migration_locks = weakref.WeakKeyDictionary()
+
+
+async def prepare_schema_from_migrations(uri, config, revision="head"):
+    """Applies migrations to a database, through an async engine.
+
+    The migrations run in :meth:`AsyncConnection.run_sync`, with the
+    synchronous connection in ``config.attributes['connection']`` while
+    ``env.py`` runs, so ``env.py`` must use it (see
+    :func:`alembicverify.util.prepare_schema_from_migrations`).
+
+    Alembic keeps the running migration context in module globals, so
+    the migrations of concurrent calls on the same event loop run one
+    after the other.
+
+    :param string uri: The URI for the database, with an async driver.
+    :param config: A :class:`alembic.config.Config` instance.
+    :param revision: The revision to upgrade to.
+    :return: An ``(engine, script)`` tuple, where ``engine`` is a new
+        :class:`sqlalchemy.ext.asyncio.AsyncEngine` that the caller
+        should dispose.
+    """
+    engine = create_async_engine(uri)
+    script = load_script_directory(config)
+
+    async with _get_migration_lock():
+        async with engine.begin() as conn:
+            await conn.run_sync(_upgrade, config, revision, script)
+
+    return engine, script
+
+
+async def get_current_revision(config, engine, script):
+    """Inspection helper. Get the current revision of a set of migrations.
+
+    The version table is read on a connection of its own, so many
+    inspections can run concurrently with :func:`asyncio.gather`.
+
+    :param engine: A :class:`sqlalchemy.ext.asyncio.AsyncEngine`.
+    """
+    async with engine.connect() as conn:
+        return await conn.run_sync(_read_revision)
+
+
+async def get_head_revision(config, engine, script):
+    """Inspection helper. Get the head revision of a set of migrations.
+
+    The head only depends on ``script``, so the database is not queried.
+    """
+    return script.as_revision_number('head')
+
+
+def _get_migration_lock():
+    loop = asyncio.get_event_loop()
+    if loop not in _migration_locks:
+        _migration_locks[loop] = asyncio.Lock()
+    return _migration_locks[loop]
+
+
+def _upgrade(conn, config, revision, script):
+    missing = object()
+    previous = config.attributes.get('connection', missing)
+    config.attributes['connection'] = conn
+    try:
+        upgrade(config, revision, script=script)
+    finally:
+        if previous is missing:
+            del config.attributes['connection']
+        else:
+            config.attributes['connection'] = previous
+
+
+def _read_revision(conn):
+    # A bare migration context does not touch the ``alembic.context``
+    # globals, so concurrent reads do not interfere.
+    migration_context = MigrationContext.configure(
+        conn, opts={'version_table': 'alembic_version'})
+    return migration_context.get_current_revision()
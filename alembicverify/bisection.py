@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+from sqlalchemy import MetaData
+
+from alembicverify.cache import get_snapshot_path, load_snapshot, save_snapshot
+from alembicverify.comparer import compare_to_metadata
+from alembicverify.util import (
+    get_connection,
+    load_script_directory,
+)
+from alembicverify.walker import UPGRADE, migrate
+
+
+Divergence = namedtuple(
+    'Divergence', ['revision', 'previous', 'result', 'probes'])
+"""The earliest revision that diverges from the models, as returned by
+:func:`bisect_revisions`.
+
+``previous`` is the revision before it (``None`` for base), ``result``
+is the :class:`sqlalchemydiff.util.CompareResult` of the comparison at
+``revision``, and ``probes`` is the number of revisions compared.
+"""
+
+
+def bisect_revisions(uri, config, metadata, ignores=None):
+    """Find the first revision whose schema diverges from ``metadata``.
+
+    The schema at a revision before the head is a match if everything
+    it has is also in the models, in the same form: the only
+    differences allowed are tables, columns, indexes and constraints
+    that are added by later revisions.  The schema at the head revision
+    must match the models exactly.
+
+    The head revision is compared first, and ``None`` is returned if it
+    matches, even if earlier revisions add tables that later ones drop.
+    Otherwise the revisions are binary-searched, so only a logarithmic
+    number of schemas are compared.  This assumes that once a revision
+    diverges, the following ones do not bring the schema back in line.
+    The database is only migrated upwards: when the search moves back, the
+    database is emptied and restored from the snapshot of the last
+    matching revision (see :mod:`alembicverify.cache`), then upgraded
+    from there.  The snapshots are kept in ``config.attributes
+    ['snapshot_dir']`` if there is one, so they are reused by later
+    runs, or in a temporary folder otherwise.
+
+    The migrations run without ``env.py`` (see
+    :func:`alembicverify.walker.migrate`), on the connection in
+    ``config.attributes['connection']``.  The revision chain must have a
+    single head.
+
+    :param string uri: The URI for the database.  Its content is
+        dropped.
+    :param config: A :class:`alembic.config.Config` instance.
+    :param metadata: The :class:`sqlalchemy.MetaData` of the models.
+    :param iterable ignores: Names of the tables to leave out of the
+        comparison.
+    :return: A :class:`Divergence`, or ``None`` if the head revision
+        matches the models.
+    """
+    script = load_script_directory(config)
+    script.get_current_head()  # Fail early if there are several heads.
+    revisions = [sc.revision for sc in script.walk_revisions()]
+    revisions.reverse()
+
+    if 'connection' not in config.attributes:
+        config.attributes['connection'] = get_connection(uri)
+    snapshot_dir = config.attributes.get('snapshot_dir')
+    temp_dir = None
+    if snapshot_dir is None:
+        snapshot_dir = temp_dir = tempfile.mkdtemp(prefix='alembicverify-')
+
+    try:
+        bisector = _Bisector(
+            uri, config, script, revisions, metadata, ignores, snapshot_dir)
+        return bisector.run()
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir)
+
+
+def is_prefix_compatible(errors):
+    """Tell whether the ``errors`` of a comparison only list items that
+    are in the models but not yet in the database. """
+    for key, value in errors.items():
+        if key in ('left_only', 'diff', 'other'):
+            return False
+        if isinstance(value, dict) and not is_prefix_compatible(value):
+            return False
+    return True
+
+
+class _Bisector(object):
+
+    def __init__(self, uri, config, script, revisions, metadata, ignores,
+                 snapshot_dir):
+        self.uri = uri
+        self.config = config
+        self.script = script
+        self.revisions = revisions
+        self.metadata = metadata
+        self.ignores = ignores
+        self.snapshot_dir = snapshot_dir
+        self.conn = config.attributes['connection']
+        # Index in ``revisions`` of the current revision of the database
+        # (-1 for base), or ``None`` when it is not known.
+        self.position = None
+        self.results = {}
+        self.snapshots = {}
+
+    def run(self):
+        last = len(self.revisions) - 1
+        if self.matches(last):
+            return None
+
+        low, high = 0, last
+        while low < high:
+            middle = (low + high) // 2
+            if self.matches(middle):
+                low = middle + 1
+            else:
+                high = middle
+
+        return Divergence(
+            revision=self.revisions[low],
+            previous=self.revisions[low - 1] if low else None,
+            result=self.results[low],
+            probes=len(self.results),
+        )
+
+    def matches(self, index):
+        self.move_to(index)
+        result = compare_to_metadata(
+            self.uri, self.metadata, ignores=self.ignores,
+            connection=self.conn)
+        self.results[index] = result
+
+        if index == len(self.revisions) - 1:
+            return result.is_match
+        return is_prefix_compatible(result.errors)
+
+    def move_to(self, index):
+        if self.position is None or self.position > index:
+            self.restore(index)
+
+        if self.position < index:
+            migrate(self.config, self.script, self.conn, UPGRADE,
+                    self.revisions[index])
+            self.position = index
+            self.save(index)
+
+    def restore(self, index):
+        # Start again from the closest snapshot at or below ``index``.
+        self.reset()
+        self.position = -1
+        candidates = set(self.snapshots) | set([index])
+        for candidate in sorted(candidates, reverse=True):
+            if candidate > index:
+                continue
+            path = self.snapshot_path(candidate)
+            if os.path.exists(path):
+                load_snapshot(self.conn, path)
+                self.position = candidate
+                return
+
+    def reset(self):
+        metadata = MetaData()
+        metadata.reflect(bind=self.conn)
+        metadata.drop_all(bind=self.conn)
+
+    def save(self, index):
+        # ``move_to`` only migrates to revisions without a snapshot.
+        save_snapshot(self.conn, self.snapshot_path(index))
+
+    def snapshot_path(self, index):
+        if index not in self.snapshots:
+            self.snapshots[index] = get_snapshot_path(
+                self.snapshot_dir, self.script, self.revisions[index],
+                self.conn.dialect.name)
+        return self.snapshots[index]
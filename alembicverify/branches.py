@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+
+from sqlalchemydiff.util import destroy_database, new_db
+
+from alembicverify.comparer import compare_to_metadata
+from alembicverify.database import get_temporary_uri
+from alembicverify.util import (
+    config_from_options,
+    dispose_engines,
+    get_config_options,
+    load_script_directory,
+    make_pool,
+    prepare_schema_from_migrations,
+)
+
+
+BranchResult = namedtuple(
+    'BranchResult', ['head', 'branch_labels', 'result', 'error'])
+"""The verification of one head revision, as found by
+:func:`verify_heads`.
+
+``branch_labels`` is the sorted tuple of the branch labels of the head,
+``result`` is the :class:`sqlalchemydiff.util.CompareResult` of the
+comparison with the models, and ``error`` describes the error that
+prevented the comparison (``result`` is then ``None``).
+"""
+
+
+class HeadsReport(object):
+
+    """The aggregated results of :func:`verify_heads`.
+
+    :attr:`results` is the list of :class:`BranchResult`, one per head
+    revision, in order of head revision.
+    """
+
+    def __init__(self, results):
+        self.results = results
+
+    @property
+    def is_match(self):
+        """Tell if all the heads match their models. """
+        return all(
+            result.error is None and result.result.is_match
+            for result in self.results
+        )
+
+    @property
+    def errors(self):
+        """Map each head that does not match to its comparison errors,
+        or to its error message. """
+        errors = {}
+        for result in self.results:
+            if result.error is not None:
+                errors[result.head] = result.error
+            elif not result.result.is_match:
+                errors[result.head] = result.result.errors
+        return errors
+
+
+def verify_heads(uri, config, metadata, ignores=None, processes=True):
+    """Upgrade each head revision in its own database and compare it with
+    its models.
+
+    Each head (for example each independent branch) is upgraded in a new
+    temporary database on the server of ``uri``, which is destroyed
+    afterwards.  The heads are verified in parallel worker processes:
+    Alembic keeps the running migration context in module globals, so it
+    cannot run several migrations in threads.  The configuration is
+    rebuilt in the workers from its options (see
+    :func:`alembicverify.util.get_config_options`).
+
+    :param string uri: A URI on the server where the temporary databases
+        are created.
+    :param config: A :class:`alembic.config.Config` instance.
+    :param metadata: The :class:`sqlalchemy.MetaData` to compare every
+        head with, or a dict mapping head revisions or branch labels to
+        the ``MetaData`` of that head.
+    :param iterable ignores: Names of the tables to leave out of the
+        comparisons.
+    :param bool processes: Verify the heads in worker processes.  If
+        ``False``, they are verified one after the other.
+    :return: A :class:`HeadsReport` instance.
+    :raises KeyError: If ``metadata`` is a dict without an entry for
+        one of the heads.
+    """
+    script = load_script_directory(config)
+    options = get_config_options(config)
+    ignores = list(ignores or [])
+
+    tasks = []
+    for head in sorted(script.get_heads()):
+        branch_labels = tuple(sorted(script.get_revision(head).branch_labels))
+        tasks.append((
+            uri, options, head, branch_labels,
+            _get_metadata(metadata, head, branch_labels), ignores,
+        ))
+
+    if not processes:
+        return HeadsReport([_verify_head(*task) for task in tasks])
+
+    pool = make_pool(max(1, len(tasks)), processes=True)
+    try:
+        results = [pool.apply_async(_verify_head, task) for task in tasks]
+        return HeadsReport([result.get() for result in results])
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _get_metadata(metadata, head, branch_labels):
+    if not isinstance(metadata, dict):
+        return metadata
+    for key in (head, ) + branch_labels:
+        if key in metadata:
+            return metadata[key]
+    raise KeyError('No metadata for head {}'.format(head))
+
+
+def _verify_head(uri, options, head, branch_labels, metadata, ignores):
+    branch_uri = get_temporary_uri(uri)
+    try:
+        new_db(branch_uri)
+        config = config_from_options(options)
+        # For the env.py files that connect on their own.
+        config.set_main_option('sqlalchemy.url', branch_uri)
+        prepare_schema_from_migrations(branch_uri, config, head)
+        result = compare_to_metadata(branch_uri, metadata, ignores=ignores)
+    except Exception as exc:
+        return BranchResult(
+            head, branch_labels, None,
+            '{}: {}'.format(type(exc).__name__, exc))
+    finally:
+        dispose_engines(branch_uri)
+        destroy_database(branch_uri)
+    return BranchResult(head, branch_labels, result, None)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import os
+import pickle
+from contextlib import contextmanager
+
+from sqlalchemy import Integer, MetaData, text
+from sqlalchemy.engine import Engine
+
+
+SNAPSHOT_PROTOCOL = 2
+"""Pickle protocol used for the snapshots, so that they can be shared
+between Python 2 and Python 3 processes. """
+
+SNAPSHOT_FORMAT = 2
+"""Version of the content of the snapshots.  It is part of their paths,
+so snapshots in an older format are not loaded. """
+
+
+def hash_migration_files(folders):
+    """Compute a digest of all the Python files found in ``folders``.
+
+    Both the relative path and the content of each file are hashed, so
+    that renaming, adding, removing or editing a revision file (or the
+    ``env.py`` script) produces a different digest.
+    """
+    digest = hashlib.sha1()
+    for folder in folders:
+        for path in iter_python_files(folder):
+            relative_path = os.path.relpath(path, folder)
+            digest.update(relative_path.replace(os.sep, '/').encode('utf-8'))
+            with open(path, 'rb') as stream:
+                digest.update(stream.read())
+    return digest.hexdigest()
+
+
+def get_migration_folders(script):
+    """Return the folders containing the migration files of ``script``.
+    """
+    folders = [script.dir]
+    for location in getattr(script, 'version_locations', None) or []:
+        if os.path.isdir(location) and location not in folders:
+            folders.append(location)
+    return folders
+
+
+def get_snapshot_path(snapshot_dir, script, revision, dialect_name):
+    """Return the path of the snapshot for a set of migrations.
+
+    The snapshot is content-addressed: its name is a hash of the
+    migration files, the target ``revision`` and the ``dialect_name``,
+    so any change to the migrations produces a cache miss.
+    """
+    digest = hashlib.sha1()
+    digest.update(hash_migration_files(get_migration_folders(script))
+                  .encode('utf-8'))
+    digest.update(revision.encode('utf-8'))
+    digest.update(dialect_name.encode('utf-8'))
+    digest.update(str(SNAPSHOT_FORMAT).encode('utf-8'))
+    return os.path.join(
+        snapshot_dir, '{}.snapshot'.format(digest.hexdigest()))
+
+
+def save_snapshot(bind, path):
+    """Reflect the schema of ``bind`` and store it in ``path``, with
+    the rows of all the tables (including the version table, so that
+    the restored database reports the right current revision).
+
+    The schema is what SQLAlchemy reflects: tables, columns, keys,
+    indexes and constraints.  Other objects created by the migrations,
+    like views, triggers, stored procedures or PostgreSQL enums and
+    sequences not owned by a column, are not restored, and neither are
+    server defaults that cannot be reflected.  Do not use snapshots
+    with migrations that create such objects.
+
+    :param bind: An engine, or a connection, which is used in its
+        current transaction, if any.
+    """
+    metadata = MetaData()
+    metadata.reflect(bind=bind)
+
+    rows = {}
+    with _connect(bind) as conn:
+        for table in metadata.sorted_tables:
+            result = conn.execute(table.select())
+            keys = list(result.keys())
+            rows[table.name] = [dict(zip(keys, row)) for row in result]
+
+    snapshot = {'metadata': metadata, 'rows': rows}
+    with open_atomically(path, 'wb') as stream:
+        pickle.dump(snapshot, stream, SNAPSHOT_PROTOCOL)
+
+
+def load_snapshot(bind, path):
+    """Restore the snapshot stored in ``path`` into ``bind``, an engine
+    or a connection (see :func:`save_snapshot`).
+
+    The rows are inserted with their primary keys, so on PostgreSQL the
+    sequences of the columns are then moved past the restored values,
+    as if the migrations had inserted the rows.
+    """
+    with open(path, 'rb') as stream:
+        snapshot = pickle.load(stream)
+
+    metadata = snapshot['metadata']
+    with _connect(bind, transaction=True) as conn:
+        metadata.create_all(conn)
+        for table in metadata.sorted_tables:
+            rows = snapshot['rows'].get(table.name)
+            if rows:
+                conn.execute(table.insert(), rows)
+        if conn.dialect.name == 'postgresql':
+            reset_sequences(conn, [
+                table for table in metadata.sorted_tables
+                if snapshot['rows'].get(table.name)
+            ])
+
+
+def reset_sequences(conn, tables):
+    """Move the PostgreSQL sequences of the columns of ``tables`` past
+    the values in the columns, for example after inserting rows with
+    their primary keys. """
+    preparer = conn.dialect.identifier_preparer
+    for table in tables:
+        table_name = preparer.format_table(table)
+        for column in table.columns:
+            if not isinstance(column.type, Integer):
+                continue
+            sequence = conn.execute(
+                text('SELECT pg_get_serial_sequence(:table, :column)'),
+                {'table': table_name, 'column': column.name}).scalar()
+            if sequence is None:
+                continue
+            # With an empty column, the next value is 1.
+            conn.execute(text(
+                'SELECT setval(:sequence, COALESCE(MAX({column}), 1), '
+                'MAX({column}) IS NOT NULL) FROM {table}'.format(
+                    column=preparer.quote(column.name), table=table_name)
+            ), {'sequence': sequence})
+
+
+@contextmanager
+def _connect(bind, transaction=False):
+    if not isinstance(bind, Engine):
+        yield bind
+        return
+    with (bind.begin() if transaction else bind.connect()) as conn:
+        yield conn
+
+
+@contextmanager
+def open_atomically(path, mode='w'):
+    """Open a temporary file next to ``path`` for writing, and rename it
+    to ``path`` once the block is done, so that concurrent readers never
+    see a partially written file.
+
+    The folder of ``path`` is created if needed.  If the block raises,
+    the temporary file is removed and ``path`` is left untouched.
+    """
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(temp_path, mode) as stream:
+            yield stream
+        os.rename(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def iter_python_files(folder):
+    """Yield the paths of the Python files in ``folder``, recursively and
+    in a stable order.  ``__pycache__`` folders are skipped. """
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+        for filename in sorted(files):
+            if filename.endswith('.py'):
+                yield os.path.join(root, filename)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from sqlalchemydiff.util import CompareResult
+
+from alembicverify.util import get_connection
+
+
+def compare_to_metadata(uri, metadata, ignores=None, connection=None,
+                        **context_opts):
+    """Compare the database at ``uri`` against a ``MetaData`` object.
+
+    This uses the Alembic autogenerate comparison, so there is no need
+    to create a second database from the models and reflect it.
+
+    The result follows the conventions of :func:`sqlalchemydiff.compare`
+    where the database is the *left* side and ``metadata`` is the
+    *right* side: for example a table that is only in the models is
+    listed in ``errors['tables']['right_only']``.  Column differences
+    are listed under ``diff`` with the key of the changed attribute.
+    Differences that do not fit this structure are listed as strings
+    under ``errors['other']``.
+
+    :param string uri: The URI for the database.
+    :param metadata: The :class:`sqlalchemy.MetaData` of the models.
+    :param iterable ignores: Names of the tables to leave out of the
+        comparison.  The Alembic version table is always left out.
+    :param connection: The connection to use.  It defaults to the one
+        returned by :func:`alembicverify.util.get_connection`.
+    :param context_opts: Extra options for the migration context, like
+        ``compare_server_default``.  ``compare_type`` defaults to
+        ``True``.
+    :return: A :class:`sqlalchemydiff.util.CompareResult` instance.
+    """
+    if connection is None:
+        connection = get_connection(uri)
+
+    ignores = set(ignores or [])
+
+    def include_object(object_, name, type_, reflected, compare_to):
+        return not (type_ == 'table' and name in ignores)
+
+    opts = {'compare_type': True, 'include_object': include_object}
+    opts.update(context_opts)
+    migration_context = MigrationContext.configure(connection, opts=opts)
+    diffs = compare_metadata(migration_context, metadata)
+
+    info = {
+        'uris': {'left': uri, 'right': None},
+        'diffs': [repr(diff) for diff in diffs],
+    }
+    errors = get_errors(diffs, connection.dialect)
+    if errors:
+        errors['uris'] = info['uris']
+    return CompareResult(info, errors)
+
+
+def get_errors(diffs, dialect):
+    """Turn a list of autogenerate differences into an ``errors`` dict
+    shaped like the one returned by :func:`sqlalchemydiff.compare`. """
+    errors = {}
+    for diff in diffs:
+        if isinstance(diff, list):
+            for modification in diff:
+                _add_modification(errors, modification, dialect)
+        else:
+            _add_difference(errors, diff, dialect)
+    return errors
+
+
+def _add_difference(errors, diff, dialect):
+    op = diff[0]
+    side = 'right_only' if op.startswith('add_') else 'left_only'
+
+    if op in ('add_table', 'remove_table'):
+        _append(errors, ['tables', side], diff[1].name)
+    elif op in ('add_column', 'remove_column'):
+        _append(
+            errors, ['tables_data', diff[2], 'columns', side],
+            _column_info(diff[3], dialect)
+        )
+    elif op in ('add_index', 'remove_index'):
+        index = diff[1]
+        _append(
+            errors, ['tables_data', index.table.name, 'indexes', side],
+            {
+                'name': index.name,
+                'column_names': [col.name for col in index.columns],
+                'unique': bool(index.unique),
+            }
+        )
+    elif op in ('add_fk', 'remove_fk'):
+        fk = diff[1]
+        _append(
+            errors, ['tables_data', fk.parent.name, 'foreign_keys', side],
+            {
+                'name': fk.name,
+                'constrained_columns': [col.name for col in fk.columns],
+                'referred_table': fk.referred_table.name,
+                'referred_columns': [
+                    element.column.name for element in fk.elements],
+            }
+        )
+    elif op in ('add_constraint', 'remove_constraint'):
+        constraint = diff[1]
+        _append(
+            errors,
+            ['tables_data', constraint.table.name, 'unique_constraints',
+             side],
+            {
+                'name': constraint.name,
+                'column_names': [col.name for col in constraint.columns],
+            }
+        )
+    else:
+        _append(errors, ['other'], repr(diff))
+
+
+def _add_modification(errors, modification, dialect):
+    op, _, table_name, column_name, _, left, right = modification
+    key = op[len('modify_'):]
+    if key == 'type':
+        left, right = _type(left, dialect), _type(right, dialect)
+    elif key == 'default':
+        left, right = _default(left), _default(right)
+    _append(
+        errors, ['tables_data', table_name, 'columns', 'diff'],
+        {'key': column_name, 'left': {key: left}, 'right': {key: right}}
+    )
+
+
+def _column_info(column, dialect):
+    return {
+        'name': column.name,
+        'type': _type(column.type, dialect),
+        'nullable': column.nullable,
+        'default': _default(column.server_default),
+    }
+
+
+def _type(type_, dialect):
+    return type_.compile(dialect=dialect)
+
+
+def _default(default):
+    if default is None:
+        return None
+    return str(getattr(default, 'arg', default))
+
+
+def _append(errors, path, item):
+    container = errors
+    for key in path[:-1]:
+        container = container.setdefault(key, {})
+    container.setdefault(path[-1], []).append(item)
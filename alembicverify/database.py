@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+from uuid import uuid4
+
+from alembic.ddl.impl import DefaultImpl
+from sqlalchemy import MetaData, create_engine, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemydiff.util import destroy_database
+
+from alembicverify.cache import reset_sequences
+
+
+def clone_database(template_uri, uri):
+    """Create the database at ``uri`` as a copy of ``template_uri``.
+
+    If a database already exists at ``uri`` it is dropped first.  Both
+    databases must live on the same server.  The copy is done with the
+    fastest mechanism offered by the backend:
+
+    * PostgreSQL: ``CREATE DATABASE ... TEMPLATE ...``.
+    * MySQL: each table is recreated from ``SHOW CREATE TABLE`` and its
+      rows are copied with ``INSERT ... SELECT``.  Databases with views
+      are not supported (``NotImplementedError`` is raised).
+    * SQLite: the database file is copied.
+    """
+    backend = make_url(uri).get_backend_name()
+    cloner = _CLONERS.get(backend)
+    if cloner is None:
+        raise NotImplementedError(
+            'Cloning is not supported for {} databases.'.format(backend))
+
+    destroy_database(uri)
+    cloner(template_uri, uri)
+
+
+def rename_database(uri, new_uri):
+    """Rename the database at ``uri`` so it is found at ``new_uri``.
+
+    If a database already exists at ``new_uri`` it is dropped first.
+    Both databases must live on the same server, and there must be no
+    connection to the database being renamed.
+
+    * PostgreSQL: ``ALTER DATABASE ... RENAME TO ...``.
+    * SQLite: the database file is renamed.
+
+    MySQL has no statement to rename a database.
+    """
+    backend = make_url(uri).get_backend_name()
+    renamer = _RENAMERS.get(backend)
+    if renamer is None:
+        raise NotImplementedError(
+            'Renaming is not supported for {} databases.'.format(backend))
+
+    destroy_database(new_uri)
+    renamer(uri, new_uri)
+
+
+def truncate_tables(uri, exclude=('alembic_version', ), rows=None):
+    """Delete the rows of all the tables of the database at ``uri``.
+
+    The schema is left untouched, which is much faster than dropping and
+    creating the database again.  The fastest statement offered by the
+    backend is used:
+
+    * PostgreSQL: a single ``TRUNCATE ... RESTART IDENTITY CASCADE``.
+    * MySQL: ``TRUNCATE TABLE`` on each table, with the foreign key
+      checks disabled.
+    * Other backends: ``DELETE`` on each table, dependent tables first.
+
+    :param iterable exclude: Names of the tables to leave alone.  The
+        Alembic version table is left alone by default.
+    :param dict rows: Rows to insert once the tables are empty, by table
+        name, like the ones returned by :func:`get_table_rows`.  On
+        PostgreSQL, the sequences are then moved past them.
+    """
+    engine = create_engine(uri)
+    truncater = _TRUNCATERS.get(engine.dialect.name, _delete_rows)
+    try:
+        with engine.begin() as conn:
+            metadata = MetaData()
+            metadata.reflect(bind=conn)
+            tables = [
+                table for table in metadata.sorted_tables
+                if table.name not in exclude
+            ]
+            if tables:
+                truncater(conn, tables)
+            if rows:
+                _insert_rows(conn, tables, rows)
+    finally:
+        engine.dispose()
+
+
+def get_table_rows(uri, exclude=('alembic_version', )):
+    """Return the rows of the tables of the database at ``uri``, as
+    lists of dicts by table name.  Empty tables are left out.
+
+    Use it with :func:`truncate_tables` to empty a database but keep the
+    rows inserted by data migrations.
+
+    :param iterable exclude: Names of the tables to leave out.  The
+        Alembic version table is left out by default.
+    """
+    engine = create_engine(uri)
+    rows = {}
+    try:
+        with engine.connect() as conn:
+            metadata = MetaData()
+            metadata.reflect(bind=conn)
+            for table in metadata.sorted_tables:
+                if table.name in exclude:
+                    continue
+                result = conn.execute(table.select())
+                keys = list(result.keys())
+                table_rows = [dict(zip(keys, row)) for row in result]
+                if table_rows:
+                    rows[table.name] = table_rows
+    finally:
+        engine.dispose()
+    return rows
+
+
+def create_schema(uri, name):
+    """Create the schema ``name`` in the database at ``uri``.
+
+    Only PostgreSQL is supported: in MySQL a schema is a database.
+    """
+    _execute_schema_statement(uri, 'CREATE SCHEMA {}', name)
+
+
+def drop_schema(uri, name):
+    """Drop the schema ``name``, and everything in it, from the
+    database at ``uri``. """
+    _execute_schema_statement(uri, 'DROP SCHEMA {} CASCADE', name)
+
+
+def supports_transactional_ddl(uri):
+    """Return whether schema changes on the backend of ``uri`` can be
+    rolled back, according to Alembic (PostgreSQL and SQL Server can,
+    MySQL and SQLite cannot). """
+    dialect = make_url(uri).get_dialect()()
+    return DefaultImpl.get_by_dialect(dialect).transactional_ddl
+
+
+def supports_renaming(uri):
+    """Return whether :func:`rename_database` supports the backend of
+    ``uri`` (PostgreSQL and SQLite do, MySQL does not). """
+    return make_url(uri).get_backend_name() in _RENAMERS
+
+
+def get_database_name(uri):
+    """Return the name of the database ``uri`` points to. """
+    return make_url(uri).database
+
+
+def replace_database_name(uri, name):
+    """Return ``uri`` with its database name replaced by ``name``.
+
+    The URI is parsed, so the query string, and a host given in it (like
+    ``postgresql://user@/name?host=/var/run/postgresql``), are kept.
+    """
+    url = make_url(uri)
+    if not hasattr(url, 'set'):
+        # SQLAlchemy < 1.4, where URLs are mutable.
+        url.database = name
+        return str(url)
+    return url.set(database=name).render_as_string(hide_password=False)
+
+
+def get_server_uri(uri):
+    """Return ``uri`` without its database name, to tell which server
+    the database lives on.  For SQLite, the folder of the database file
+    stands for the server. """
+    name = ''
+    if make_url(uri).get_backend_name() == 'sqlite':
+        name = os.path.dirname(get_database_name(uri) or '')
+    return replace_database_name(uri, name)
+
+
+def get_temporary_uri(uri):
+    """Return ``uri`` with a random database name, on the same server.
+
+    For SQLite, the database file is in the same folder.
+    """
+    name = 'temp_{}'.format(uuid4().hex)
+    if make_url(uri).get_backend_name() == 'sqlite':
+        name = os.path.join(
+            os.path.dirname(get_database_name(uri) or ''), name)
+    return replace_database_name(uri, name)
+
+
+def get_worker_uri(uri, worker_id):
+    """Return ``uri`` with ``worker_id`` appended to the database name,
+    so that each pytest-xdist worker uses its own databases.
+
+    ``uri`` is returned unchanged if ``worker_id`` is ``None``, or if
+    it has no database name (like an in-memory SQLite database).  For
+    SQLite, the id goes before the extension of the file name.
+    """
+    name = get_database_name(uri)
+    if worker_id is None or not name:
+        return uri
+    extension = ''
+    if make_url(uri).get_backend_name() == 'sqlite':
+        name, extension = os.path.splitext(name)
+    return replace_database_name(
+        uri, '{}_{}{}'.format(name, worker_id, extension))
+
+
+def _execute_schema_statement(uri, statement, name):
+    backend = make_url(uri).get_backend_name()
+    if backend != 'postgresql':
+        raise NotImplementedError(
+            'Schemas are not supported for {} databases.'.format(backend))
+
+    engine = create_engine(uri, isolation_level='AUTOCOMMIT')
+    quote = engine.dialect.identifier_preparer.quote
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(statement.format(quote(name))))
+    finally:
+        engine.dispose()
+
+
+def _clone_sqlite(template_uri, uri):
+    shutil.copyfile(get_database_name(template_uri), get_database_name(uri))
+
+
+def _clone_postgresql(template_uri, uri):
+    engine = create_engine(
+        replace_database_name(uri, 'postgres'), isolation_level='AUTOCOMMIT')
+    quote = engine.dialect.identifier_preparer.quote
+    try:
+        with engine.connect() as conn:
+            conn.execute(text('CREATE DATABASE {} TEMPLATE {}'.format(
+                quote(get_database_name(uri)),
+                quote(get_database_name(template_uri)),
+            )))
+    finally:
+        engine.dispose()
+
+
+def _clone_mysql(template_uri, uri):
+    engine = create_engine(template_uri)
+    quote = engine.dialect.identifier_preparer.quote
+    source = quote(get_database_name(template_uri))
+    target = quote(get_database_name(uri))
+    try:
+        with engine.connect() as conn:
+            tables = []
+            for name, table_type in conn.execute(text('SHOW FULL TABLES')):
+                if table_type != 'BASE TABLE':
+                    raise NotImplementedError(
+                        'Cloning is not supported for MySQL databases with '
+                        'views: {}'.format(name))
+                tables.append(name)
+
+            conn.execute(text('CREATE DATABASE {}'.format(target)))
+            conn.execute(text('SET FOREIGN_KEY_CHECKS = 0'))
+            try:
+                conn.execute(text('USE {}'.format(target)))
+                for table in tables:
+                    create_table = conn.execute(text(
+                        'SHOW CREATE TABLE {}.{}'.format(source, quote(table))
+                    )).fetchone()[1]
+                    # Colons would be taken as bind parameters by ``text``.
+                    conn.execute(text(create_table.replace(':', r'\:')))
+                    conn.execute(text(
+                        'INSERT INTO {table} SELECT * FROM {source}.{table}'
+                        .format(table=quote(table), source=source)
+                    ))
+            finally:
+                conn.execute(text('SET FOREIGN_KEY_CHECKS = 1'))
+    finally:
+        engine.dispose()
+
+
+_CLONERS = {
+    'mysql': _clone_mysql,
+    'postgresql': _clone_postgresql,
+    'sqlite': _clone_sqlite,
+}
+
+
+def _rename_sqlite(uri, new_uri):
+    os.rename(get_database_name(uri), get_database_name(new_uri))
+
+
+def _rename_postgresql(uri, new_uri):
+    engine = create_engine(
+        replace_database_name(uri, 'postgres'), isolation_level='AUTOCOMMIT')
+    quote = engine.dialect.identifier_preparer.quote
+    try:
+        with engine.connect() as conn:
+            conn.execute(text('ALTER DATABASE {} RENAME TO {}'.format(
+                quote(get_database_name(uri)),
+                quote(get_database_name(new_uri)),
+            )))
+    finally:
+        engine.dispose()
+
+
+_RENAMERS = {
+    'postgresql': _rename_postgresql,
+    'sqlite': _rename_sqlite,
+}
+
+
+def _insert_rows(conn, tables, rows):
+    tables = [table for table in tables if rows.get(table.name)]
+    for table in tables:
+        conn.execute(table.insert(), rows[table.name])
+    if conn.dialect.name == 'postgresql':
+        reset_sequences(conn, tables)
+
+
+def _truncate_postgresql(conn, tables):
+    quote = conn.dialect.identifier_preparer.quote
+    conn.execute(text('TRUNCATE TABLE {} RESTART IDENTITY CASCADE'.format(
+        ', '.join(quote(table.name) for table in tables))))
+
+
+def _truncate_mysql(conn, tables):
+    quote = conn.dialect.identifier_preparer.quote
+    conn.execute(text('SET FOREIGN_KEY_CHECKS = 0'))
+    for table in tables:
+        conn.execute(text('TRUNCATE TABLE {}'.format(quote(table.name))))
+    conn.execute(text('SET FOREIGN_KEY_CHECKS = 1'))
+
+
+def _delete_rows(conn, tables):
+    for table in reversed(tables):
+        conn.execute(table.delete())
+
+
+_TRUNCATERS = {
+    'mysql': _truncate_mysql,
+    'postgresql': _truncate_postgresql,
+}
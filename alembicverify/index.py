@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+import ast
+import hashlib
+import json
+import os
+import re
+
+from alembic.script import Script
+from alembic.script.revision import RevisionMap
+from alembic.util import load_python_file
+
+from alembicverify.cache import open_atomically
+
+
+INDEX_FILENAME = '.alembicverify-index.json'
+"""Name of the index file written in each versions folder. """
+
+INDEX_FORMAT = 1
+
+REVISION_ATTRIBUTES = ('revision', 'down_revision', 'branch_labels',
+                       'depends_on')
+
+_revision_file = re.compile(r'(?!\.\#|__init__).*\.py$')
+
+
+def use_revision_index(script):
+    """Make ``script`` build its revision map from the revision index.
+
+    The revision identifiers of each file are read from the index kept
+    in each versions folder (see :func:`load_index`), so no revision
+    module is imported to build the revision map.  A module is only
+    imported when something other than its identifiers is needed, for
+    example when its ``upgrade`` or ``downgrade`` function runs.
+
+    Version folders are not scanned recursively, and ``sourceless``
+    revision files are not supported.
+
+    :param script: A :class:`alembic.script.ScriptDirectory` instance,
+        whose revision map must not have been built yet.
+    :return: ``script`` itself.
+    """
+    def load_revisions():
+        for folder in get_version_folders(script):
+            for filename, entry in sorted(load_index(folder).items()):
+                path = os.path.join(folder, filename)
+                yield Script(
+                    LazyRevisionModule(folder, filename, entry),
+                    entry['revision'],
+                    path,
+                )
+
+    script.revision_map = RevisionMap(load_revisions)
+    return script
+
+
+def get_version_folders(script):
+    """Return the folders containing the revision files of ``script``. """
+    if script.version_locations:
+        return [
+            os.path.abspath(location)
+            for location in script.version_locations
+            if os.path.isdir(location)
+        ]
+    return [script.versions]
+
+
+def load_index(folder):
+    """Return the revision index of ``folder``, updating it if needed.
+
+    The index maps each revision file name to its ``revision``,
+    ``down_revision``, ``branch_labels`` and ``depends_on`` values, and
+    to the size, modification time and SHA1 hash of the file.  Entries
+    whose file has changed are rebuilt by parsing the file (the module
+    is only imported if its identifiers are not plain literals), and
+    the index is saved again in ``folder`` if anything changed.  Failing
+    to save it is not an error.
+    """
+    path = os.path.join(folder, INDEX_FILENAME)
+    stored = _read_index(path)
+    index = {}
+    changed = False
+
+    for filename in sorted(os.listdir(folder)):
+        if not _revision_file.match(filename):
+            continue
+        file_path = os.path.join(folder, filename)
+        stat = os.stat(file_path)
+        entry = stored.get(filename)
+        if not (entry and entry['mtime'] == stat.st_mtime and
+                entry['size'] == stat.st_size):
+            entry = _build_entry(folder, filename, stat, entry)
+            changed = True
+        index[filename] = entry
+
+    if changed or set(index) != set(stored):
+        _write_index(path, index)
+    return index
+
+
+class LazyRevisionModule(object):
+    # A stand-in for a revision module, which knows the revision
+    # identifiers from the index and imports the real module on first
+    # access to anything else.
+
+    def __init__(self, folder, filename, entry):
+        self._folder = folder
+        self._filename = filename
+        self._module = None
+        for name in REVISION_ATTRIBUTES:
+            setattr(self, name, entry[name])
+
+    @property
+    def __doc__(self):
+        return self._load().__doc__
+
+    def __getattr__(self, name):
+        if name.startswith('__') and name.endswith('__'):
+            raise AttributeError(name)
+        return getattr(self._load(), name)
+
+    def _load(self):
+        if self._module is None:
+            self._module = load_python_file(self._folder, self._filename)
+        return self._module
+
+
+def _build_entry(folder, filename, stat, previous):
+    with open(os.path.join(folder, filename), 'rb') as stream:
+        source = stream.read()
+    sha1 = hashlib.sha1(source).hexdigest()
+
+    if previous and previous['sha1'] == sha1:
+        identifiers = dict(
+            (name, previous[name]) for name in REVISION_ATTRIBUTES)
+    else:
+        identifiers = _parse_identifiers(source)
+        if identifiers is None:
+            identifiers = _import_identifiers(folder, filename)
+
+    entry = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha1': sha1}
+    entry.update(identifiers)
+    return entry
+
+
+def _parse_identifiers(source):
+    """Read the revision identifiers from the module source, without
+    importing it.  Return ``None`` if they are not all literals. """
+    values = {}
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1:
+            target = node.targets[0]
+        elif type(node).__name__ == 'AnnAssign' and node.value is not None:
+            target = node.target
+        else:
+            continue
+        if isinstance(target, ast.Name) and target.id in REVISION_ATTRIBUTES:
+            try:
+                values[target.id] = ast.literal_eval(node.value)
+            except ValueError:
+                return None
+
+    if 'revision' not in values or 'down_revision' not in values:
+        return None
+    return _normalize(values)
+
+
+def _import_identifiers(folder, filename):
+    module = load_python_file(folder, filename)
+    return _normalize(dict(
+        (name, getattr(module, name, None)) for name in REVISION_ATTRIBUTES))
+
+
+def _normalize(values):
+    # Lists and tuples are stored as JSON lists, and given back as tuples.
+    identifiers = {}
+    for name in REVISION_ATTRIBUTES:
+        value = values.get(name)
+        if isinstance(value, (list, tuple)):
+            value = tuple(value)
+        identifiers[name] = value
+    return identifiers
+
+
+def _read_index(path):
+    try:
+        with open(path) as stream:
+            data = json.load(stream)
+    except (IOError, OSError, ValueError):
+        return {}
+    if data.get('format') != INDEX_FORMAT:
+        return {}
+
+    files = data['files']
+    for entry in files.values():
+        entry.update(_normalize(entry))
+    return files
+
+
+def _write_index(path, index):
+    data = {'format': INDEX_FORMAT, 'files': index}
+    try:
+        with open_atomically(path) as stream:
+            json.dump(data, stream, indent=1, sort_keys=True)
+    except (IOError, OSError):
+        pass
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from six.moves import queue
+from sqlalchemydiff.util import destroy_database, new_db
+
+from alembicverify.database import get_temporary_uri, rename_database
+
+
+class DatabasePool(object):
+
+    """Keep spare databases ready, so that getting one does not wait for
+    the database server.
+
+    A background thread creates up to ``size`` temporary databases on
+    the server of ``uri`` and keeps them in a queue.  :meth:`acquire`
+    takes one and renames it to the URI the caller asked for, which is
+    much faster than creating it, and the thread creates another one in
+    the meantime.  Renaming is supported by PostgreSQL and SQLite (see
+    :func:`alembicverify.database.rename_database`).
+
+    The thread does not run migrations, as Alembic keeps its context in
+    globals: to get databases at the head revision, pass a ``create``
+    function cloning a template (see
+    :func:`alembicverify.database.clone_database`).
+
+    :param string uri: A database URI, giving the server to create the
+        databases on.
+    :param int size: The number of spare databases.
+    :param create: A function creating the database at the URI it is
+        given.  It defaults to :func:`sqlalchemydiff.util.new_db`, which
+        creates empty databases.
+    """
+
+    # How often, in seconds, waiting calls check for errors and closing.
+    poll_interval = 0.1
+
+    def __init__(self, uri, size, create=None):
+        self.uri = uri
+        self.size = size
+        self._create = create or new_db
+        self._ready = queue.Queue(maxsize=size)
+        self._closed = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=self._fill)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def acquire(self, uri):
+        """Move a spare database to ``uri``, waiting for one if needed.
+
+        Any database at ``uri`` is dropped first.  An error raised while
+        creating the spare databases is raised here.  If renaming fails,
+        the spare database goes back to the pool.
+        """
+        while True:
+            if self._error is not None:
+                raise self._error
+            try:
+                temp_uri = self._ready.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            try:
+                rename_database(temp_uri, uri)
+            except Exception:
+                self._give_back(temp_uri)
+                raise
+            return uri
+
+    def close(self):
+        """Stop the background thread, and destroy the spare databases.
+        """
+        self._closed.set()
+        self._thread.join()
+        while True:
+            try:
+                temp_uri = self._ready.get_nowait()
+            except queue.Empty:
+                break
+            destroy_database(temp_uri)
+
+    def _give_back(self, temp_uri):
+        # The thread may have filled the free slot meanwhile, in which
+        # case the pool has enough spare databases already.
+        try:
+            self._ready.put_nowait(temp_uri)
+        except queue.Full:
+            destroy_database(temp_uri)
+
+    def _fill(self):
+        while not self._closed.is_set():
+            temp_uri = get_temporary_uri(self.uri)
+            try:
+                self._create(temp_uri)
+            except Exception as exc:
+                self._error = exc
+                return
+            if not self._put(temp_uri):
+                destroy_database(temp_uri)
+
+    def _put(self, temp_uri):
+        # Wait for a free slot, unless the pool is closed meanwhile.
+        while not self._closed.is_set():
+            try:
+                self._ready.put(temp_uri, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                pass
+        return False
@@ -1,32 +1,569 @@
 # -*- coding: utf-8 -*-
+import functools
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+
 import pytest
 
-from sqlalchemydiff.util import destroy_database, new_db
 
-from alembicverify.util import make_alembic_config
+# This module is loaded by pytest at startup in every project where
+# alembic-verify is installed, so Alembic, SQLAlchemy and the rest of
+# alembicverify are only imported by the hooks and fixtures that need
+# them.
+
+
+DB_SCOPES = ('function', 'module', 'session')
+
+ISOLATIONS = ('database', 'transaction', 'schema')
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('alembic-verify')
+    group.addoption(
+        '--alembic-snapshot-dir',
+        action='store',
+        default=None,
+        help='Cache the schemas obtained from the migrations in this folder.'
+    )
+    group.addoption(
+        '--alembic-template',
+        action='store_true',
+        default=False,
+        help=(
+            'Migrate a template database once per session and create '
+            'new_db_left by cloning it.  The left database is then already '
+            'at the head revision.'
+        )
+    )
+    group.addoption(
+        '--alembic-db-scope',
+        action='store',
+        choices=DB_SCOPES,
+        default='function',
+        help=(
+            'Share the databases of new_db_left and new_db_right between '
+            'the tests of a module or of the session, and empty their '
+            'tables between tests instead of creating them again.  The '
+            'left database is then already at the head revision, and the '
+            'rows inserted by the migrations are put back after emptying '
+            'it.'
+        )
+    )
+    group.addoption(
+        '--alembic-isolation',
+        action='store',
+        choices=ISOLATIONS,
+        default='database',
+        help=(
+            'With "transaction", new_db_left is created once per session '
+            'and each test runs in an outer transaction on it, rolled back '
+            'at the end of the test.  This needs a backend with '
+            'transactional DDL, like PostgreSQL.  With "schema" '
+            '(PostgreSQL only), each test works in its own temporary schema '
+            'of a database created once per session.'
+        )
+    )
+    group.addoption(
+        '--alembic-pool-size',
+        action='store',
+        type=int,
+        default=0,
+        metavar='N',
+        help=(
+            'Keep N spare databases, created in the background, and rename '
+            'one into place for each new database (PostgreSQL and SQLite).  '
+            'With --alembic-template, the spare left databases are clones '
+            'of the template.'
+        )
+    )
+    group.addoption(
+        '--alembic-timing',
+        action='store',
+        type=int,
+        default=None,
+        metavar='N',
+        help='Time each migration and report the N slowest ones (0 for all).'
+    )
+    group.addoption(
+        '--alembic-bisect',
+        action='store_true',
+        default=False,
+        help=(
+            'Run the tests using the alembic_bisect fixture, which look for '
+            'the first revision diverging from the models.'
+        )
+    )
+    group.addoption(
+        '--alembic-verdict-cache',
+        action='store',
+        default=None,
+        metavar='DIR',
+        help=(
+            'Keep the verdicts of alembic_compare_models in this folder, '
+            'and reuse them while the migrations and models are unchanged.'
+        )
+    )
+    group.addoption(
+        '--alembic-force-verify',
+        action='store_true',
+        default=False,
+        help='Ignore the cached verdicts, and verify again.'
+    )
+
+
+def pytest_configure(config):
+    config.alembic_timer = None
+    if config.getoption('alembic_timing') is not None:
+        from alembicverify.timing import MigrationTimer
+        config.alembic_timer = MigrationTimer()
+
+    # Under pytest-xdist, the templates are shared by the workers through
+    # this folder, created by the controller.
+    config.alembic_shared_dir = None
+    workerinput = getattr(config, 'workerinput', None)
+    if workerinput is not None:
+        config.alembic_shared_dir = workerinput.get('alembic_shared_dir')
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_configure_node(node):
+    # Called on the pytest-xdist controller for each worker.
+    try:
+        import fcntl  # noqa: F401
+    except ImportError:
+        # The workers cannot lock the folder: one template each.
+        return
+
+    config = node.config
+    if config.alembic_shared_dir is None:
+        config.alembic_shared_dir = tempfile.mkdtemp(prefix='alembicverify-')
+    node.workerinput['alembic_shared_dir'] = config.alembic_shared_dir
+
+
+def pytest_unconfigure(config):
+    shared_dir = config.alembic_shared_dir
+    if shared_dir is None or hasattr(config, 'workerinput'):
+        return
+
+    from sqlalchemydiff.util import destroy_database
+
+    for name in sorted(os.listdir(shared_dir)):
+        if name.endswith('.template'):
+            with open(os.path.join(shared_dir, name)) as stream:
+                destroy_database(stream.read())
+    shutil.rmtree(shared_dir)
+
+
+def pytest_terminal_summary(terminalreporter):
+    timer = terminalreporter.config.alembic_timer
+    if timer is None:
+        return
+    count = terminalreporter.config.getoption('alembic_timing')
+    terminalreporter.write_sep(
+        '=', 'slowest {} alembic migrations'.format(count))
+    for line in timer.report(count or None):
+        terminalreporter.write_line(line)
+
+
+@pytest.fixture(scope='session')
+def alembic_worker_id(request):
+    """The id of the pytest-xdist worker running the tests, like
+    ``gw0``, or ``None`` without pytest-xdist.  Use it with
+    :func:`alembicverify.database.get_worker_uri` to give each worker
+    its own databases. """
+    return _get_worker_id(request.config)
 
 
 @pytest.fixture
-def alembic_config_left(uri_left, alembic_root):
+def alembic_config_left(uri_left, alembic_root, request):
     """Requires alembic_root fixture to be defined. """
-    return make_alembic_config(uri_left, alembic_root)
+    return _make_config(uri_left, alembic_root, request.config)
 
 
 @pytest.fixture
-def alembic_config_right(uri_right, alembic_root):
+def alembic_config_right(uri_right, alembic_root, request):
     """Requires alembic_root fixture to be defined. """
-    return make_alembic_config(uri_right, alembic_root)
+    return _make_config(uri_right, alembic_root, request.config)
+
+
+@pytest.yield_fixture(scope='session')
+def alembic_templates():
+    """Template databases migrated to head, keyed by server and
+    migrations folder.  They are destroyed at the end of the session. """
+    from sqlalchemydiff.util import destroy_database
+
+    templates = {}
+    yield templates
+    for template_uri in templates.values():
+        destroy_database(template_uri)
+
+
+@pytest.yield_fixture(scope='session')
+def alembic_database_pools(alembic_templates):
+    """The pools of spare databases, with ``--alembic-pool-size``, keyed
+    by server and template.  They are closed, and their spare databases
+    destroyed, at the end of the session (before the templates). """
+    pools = {}
+    yield pools
+    for pool in pools.values():
+        pool.close()
+
+
+@pytest.yield_fixture(scope='module')
+def alembic_module_databases():
+    """The databases shared by the tests of a module, with
+    ``--alembic-db-scope=module``, with the rows to restore in them
+    between tests.  They are destroyed at the end of the module. """
+    databases = {}
+    yield databases
+    _destroy_databases(databases)
+
+
+@pytest.yield_fixture(scope='session')
+def alembic_session_databases():
+    """The databases shared by all the tests, with
+    ``--alembic-db-scope=session``, with the rows to restore in them
+    between tests.  They are destroyed at the end of the session. """
+    databases = {}
+    yield databases
+    _destroy_databases(databases)
 
 
 @pytest.yield_fixture
-def new_db_left(uri_left):
-    new_db(uri_left)
+def new_db_left(uri_left, request):
+    from sqlalchemydiff.util import destroy_database
+
+    from alembicverify.util import dispose_engines
+
+    isolation = request.config.getoption('alembic_isolation')
+    scope = request.config.getoption('alembic_db_scope')
+    transaction = schema = None
+    if isolation == 'transaction':
+        transaction = _begin_transaction(uri_left, request)
+    elif isolation == 'schema':
+        schema = _create_test_schema(uri_left, request)
+    elif scope == 'function':
+        _create_left_database(uri_left, request)
+    else:
+        _reuse_database(
+            uri_left, scope, request, _create_left_database,
+            prepare=_migrate_left_database)
     yield
-    destroy_database(uri_left)
+    if transaction is not None:
+        transaction.rollback()
+    dispose_engines(uri_left)
+    if schema is not None:
+        from alembicverify.database import drop_schema
+        drop_schema(uri_left, schema)
+    if isolation == 'database' and scope == 'function':
+        destroy_database(uri_left)
+
+
+@pytest.fixture
+def alembic_bisect(request):
+    """Return a function finding the first revision whose schema
+    diverges from a ``MetaData``, on the left database (see
+    :func:`alembicverify.bisection.bisect_revisions`).
+
+    Tests using this fixture are skipped unless pytest runs with
+    ``--alembic-bisect``.
+    """
+    if not request.config.getoption('alembic_bisect'):
+        pytest.skip('run with --alembic-bisect to bisect the revisions')
+
+    from alembicverify.bisection import bisect_revisions
+
+    request.getfixturevalue('new_db_left')
+    uri = request.getfixturevalue('uri_left')
+    config = request.getfixturevalue('alembic_config_left')
+
+    def bisect(metadata, ignores=None):
+        return bisect_revisions(uri, config, metadata, ignores=ignores)
+    return bisect
+
+
+@pytest.fixture
+def alembic_compare_models(request):
+    """Return a function comparing the left database, migrated to head,
+    with a ``MetaData`` (see
+    :func:`alembicverify.comparer.compare_to_metadata`).
+
+    With ``--alembic-verdict-cache``, the verdict is stored under a
+    fingerprint of the migrations and of the models, and as long as
+    neither changes, it is returned without touching any database (its
+    ``info`` then has ``cached`` set to ``True``).
+    ``--alembic-force-verify`` ignores the stored verdicts.
+    """
+    def compare(metadata, ignores=None):
+        from alembic.script import ScriptDirectory
+        from sqlalchemydiff.util import CompareResult
+
+        from alembicverify.comparer import compare_to_metadata
+        from alembicverify.util import prepare_schema_from_migrations
+        from alembicverify.verdicts import (
+            VerdictCache,
+            get_dialect,
+            get_fingerprint,
+        )
+
+        uri = request.getfixturevalue('uri_left')
+        config = request.getfixturevalue('alembic_config_left')
+        cache_dir = request.config.getoption('alembic_verdict_cache')
+
+        fingerprint = None
+        if cache_dir is not None:
+            cache = VerdictCache(cache_dir)
+            fingerprint = get_fingerprint(
+                ScriptDirectory.from_config(config), metadata,
+                get_dialect(uri),
+                extra=['models', sorted(ignores or [])],
+            )
+            verdict = None
+            if not request.config.getoption('alembic_force_verify'):
+                verdict = cache.get(fingerprint)
+            if verdict is not None:
+                return CompareResult(
+                    {'cached': True, 'fingerprint': fingerprint},
+                    verdict['errors'])
+
+        request.getfixturevalue('new_db_left')
+        prepare_schema_from_migrations(uri, config)
+        result = compare_to_metadata(uri, metadata, ignores=ignores)
+        result.info['cached'] = False
+        if fingerprint is not None:
+            result.info['fingerprint'] = fingerprint
+            cache.put(fingerprint, result.is_match, result.errors)
+        return result
+    return compare
 
 
 @pytest.yield_fixture
-def new_db_right(uri_right):
-    new_db(uri_right)
+def new_db_right(uri_right, request):
+    from sqlalchemydiff.util import destroy_database
+
+    from alembicverify.util import dispose_engines
+
+    scope = request.config.getoption('alembic_db_scope')
+    if request.config.getoption('alembic_isolation') != 'database':
+        # The models are not created through the registry connection,
+        # so the right database is shared and emptied instead.
+        scope = 'session'
+    if scope == 'function':
+        _create_right_database(uri_right, request)
+    else:
+        _reuse_database(uri_right, scope, request, _create_right_database)
     yield
-    destroy_database(uri_right)
+    dispose_engines(uri_right)
+    if scope == 'function':
+        destroy_database(uri_right)
+
+
+def _create_left_database(uri, request):
+    from sqlalchemydiff.util import new_db
+
+    from alembicverify.database import clone_database
+
+    template_uri = None
+    if request.config.getoption('alembic_template'):
+        template_uri = _get_template(
+            uri,
+            request.getfixturevalue('alembic_root'),
+            request.getfixturevalue('alembic_templates'),
+            request.config,
+        )
+
+    if request.config.getoption('alembic_pool_size'):
+        _get_pool(uri, request, template_uri).acquire(uri)
+    elif template_uri is not None:
+        clone_database(template_uri, uri)
+    else:
+        new_db(uri)
+
+
+def _migrate_left_database(uri, request):
+    from alembicverify.util import (
+        dispose_engines,
+        prepare_schema_from_migrations,
+    )
+
+    prepare_schema_from_migrations(
+        uri,
+        _make_config(
+            uri, request.getfixturevalue('alembic_root'), request.config)
+    )
+    dispose_engines(uri)
+
+
+def _create_right_database(uri, request):
+    from sqlalchemydiff.util import new_db
+
+    if request.config.getoption('alembic_pool_size'):
+        _get_pool(uri, request).acquire(uri)
+    else:
+        new_db(uri)
+
+
+def _get_pool(uri, request, template_uri=None):
+    from alembicverify.database import (
+        clone_database,
+        get_server_uri,
+        supports_renaming,
+    )
+    from alembicverify.pool import DatabasePool
+
+    if not supports_renaming(uri):
+        raise pytest.UsageError(
+            '--alembic-pool-size needs a backend where databases can be '
+            'renamed, like PostgreSQL or SQLite: {}'.format(uri))
+
+    pools = request.getfixturevalue('alembic_database_pools')
+    key = (get_server_uri(uri), template_uri)
+    if key not in pools:
+        create = None
+        if template_uri is not None:
+            create = functools.partial(clone_database, template_uri)
+        pools[key] = DatabasePool(
+            uri, request.config.getoption('alembic_pool_size'),
+            create=create)
+    return pools[key]
+
+
+def _begin_transaction(uri, request):
+    # Begin a transaction on the connection of the registry, which the
+    # helpers and ``env.py`` (through ``config.attributes``) use.
+    from alembicverify.database import supports_transactional_ddl
+    from alembicverify.util import get_connection
+
+    if not supports_transactional_ddl(uri):
+        raise pytest.UsageError(
+            '--alembic-isolation=transaction needs a backend with '
+            'transactional DDL, like PostgreSQL: {}'.format(uri))
+
+    _create_session_database(uri, request, _create_left_database)
+    return get_connection(uri).begin()
+
+
+def _create_test_schema(uri, request):
+    # Create a schema for the test, and make the engine of the registry
+    # use it.
+    from sqlalchemy.engine.url import make_url
+    from sqlalchemydiff.util import new_db
+
+    from alembicverify.database import create_schema
+    from alembicverify.util import use_schema
+
+    if make_url(uri).get_backend_name() != 'postgresql':
+        raise pytest.UsageError(
+            '--alembic-isolation=schema needs PostgreSQL: {}'.format(uri))
+
+    _create_session_database(uri, request, lambda uri, request: new_db(uri))
+    schema = 'test_{}'.format(uuid.uuid4().hex)
+    create_schema(uri, schema)
+    use_schema(uri, schema)
+    return schema
+
+
+def _create_session_database(uri, request, create):
+    databases = request.getfixturevalue('alembic_session_databases')
+    if uri not in databases:
+        create(uri, request)
+        databases[uri] = None
+
+
+def _reuse_database(uri, scope, request, create, prepare=None):
+    # Create the database for the first test of the scope, and empty it
+    # for the following ones.  The rows found after the first preparation
+    # (like the ones inserted by data migrations) are inserted again.
+    from alembicverify.database import get_table_rows, truncate_tables
+
+    databases = request.getfixturevalue('alembic_{}_databases'.format(scope))
+    reused = uri in databases
+    if reused:
+        truncate_tables(uri, rows=databases[uri])
+    else:
+        create(uri, request)
+    if prepare is not None:
+        prepare(uri, request)
+    if not reused:
+        databases[uri] = get_table_rows(uri)
+
+
+def _destroy_databases(uris):
+    from sqlalchemydiff.util import destroy_database
+
+    from alembicverify.util import dispose_engines
+
+    for uri in uris:
+        dispose_engines(uri)
+        destroy_database(uri)
+
+
+def _make_config(uri, alembic_root, pytest_config):
+    from alembicverify.util import make_alembic_config
+
+    config = make_alembic_config(uri, alembic_root)
+    snapshot_dir = pytest_config.getoption('alembic_snapshot_dir')
+    if snapshot_dir is not None:
+        config.attributes['snapshot_dir'] = snapshot_dir
+    if pytest_config.alembic_timer is not None:
+        config.attributes['timer'] = pytest_config.alembic_timer
+    return config
+
+
+def _get_worker_id(pytest_config):
+    workerinput = getattr(pytest_config, 'workerinput', None)
+    if workerinput is not None:
+        return workerinput['workerid']
+    return os.environ.get('PYTEST_XDIST_WORKER')
+
+
+def _get_template(uri, alembic_root, templates, pytest_config):
+    from alembicverify.database import get_server_uri
+
+    key = (get_server_uri(uri), alembic_root)
+    if pytest_config.alembic_shared_dir is not None:
+        return _get_shared_template(uri, alembic_root, key, pytest_config)
+    if key not in templates:
+        templates[key] = _create_template(uri, alembic_root, pytest_config)
+    return templates[key]
+
+
+def _get_shared_template(uri, alembic_root, key, pytest_config):
+    # The first worker to get the lock creates the template, and the
+    # others read its URI.  The controller destroys it at the end.
+    import fcntl
+
+    name = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    path = os.path.join(
+        pytest_config.alembic_shared_dir, '{}.template'.format(name))
+    with open('{}.lock'.format(path), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.exists(path):
+            template_uri = _create_template(uri, alembic_root, pytest_config)
+            with open(path, 'w') as stream:
+                stream.write(template_uri)
+        with open(path) as stream:
+            return stream.read()
+
+
+def _create_template(uri, alembic_root, pytest_config):
+    from sqlalchemydiff.util import new_db
+
+    from alembicverify.database import get_temporary_uri
+    from alembicverify.util import (
+        dispose_engines,
+        prepare_schema_from_migrations,
+    )
+
+    template_uri = get_temporary_uri(uri)
+    new_db(template_uri)
+    prepare_schema_from_migrations(
+        template_uri,
+        _make_config(template_uri, alembic_root, pytest_config)
+    )
+    # The template cannot be cloned while there are connections to it.
+    dispose_engines(template_uri)
+    return template_uri
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+
+from sqlalchemy import inspect
+
+from alembicverify.util import _read_revision
+from alembicverify.walker import DOWNGRADE, UPGRADE, migrate
+
+
+ReversibilityError = namedtuple(
+    'ReversibilityError', ['revision', 'direction', 'differences'])
+"""Represent a revision that is not reversible, as returned by
+:func:`check_reversibility`.
+
+With ``direction`` equal to ``DOWNGRADE``, downgrading ``revision`` did
+not restore the schema of the previous revision.  With ``UPGRADE``,
+upgrading to ``revision`` again after the downgrade did not give the
+same schema as the first upgrade.
+
+``differences`` maps the name of each table that differs to a dict with
+the ``expected`` and ``actual`` information of the table (as returned
+by :func:`reflect_schema`), ``None`` meaning that the table is missing.
+"""
+
+
+def check_reversibility(config, engine, script):
+    """Check that every revision can be downgraded and upgraded again.
+
+    The database is upgraded one revision at a time from its current
+    revision to head.  After each upgrade, the schema is reflected, the
+    revision is downgraded and the schema is compared with the one
+    reflected before the upgrade; then the revision is upgraded again
+    and the schema is compared with the one reflected after the first
+    upgrade.  Each reflected schema is only kept until the next step,
+    and the whole check costs about three upgrades of the chain.
+
+    The migrations run on one connection (the one in
+    ``config.attributes['connection']`` if there is one), without running
+    ``env.py`` (see :func:`alembicverify.walker.migrate`).  The revision
+    chain must have a single head.
+
+    :param config: A :class:`alembic.config.Config` instance.
+    :param engine: The engine for the database to migrate.
+    :param script: A :class:`alembic.script.ScriptDirectory` instance.
+    :return: A list of :class:`ReversibilityError`, empty if all the
+        revisions are reversible.
+    """
+    conn = config.attributes.get('connection')
+    if conn is not None:
+        return _check(config, script, conn)
+
+    with engine.connect() as conn:
+        return _check(config, script, conn)
+
+
+def reflect_schema(conn, version_table='alembic_version'):
+    """Return a comparable description of the schema of ``conn``.
+
+    The result maps the name of each table (except ``version_table``) to
+    its columns, primary key, foreign keys, indexes and unique
+    constraints.
+    """
+    inspector = inspect(conn)
+    schema = {}
+    for table_name in inspector.get_table_names():
+        if table_name == version_table:
+            continue
+        schema[table_name] = {
+            'columns': [
+                {
+                    'name': column['name'],
+                    'type': str(column['type'].compile(dialect=conn.dialect)),
+                    'nullable': column['nullable'],
+                    'default': column.get('default'),
+                }
+                for column in inspector.get_columns(table_name)
+            ],
+            'primary_key': inspector.get_pk_constraint(table_name).get(
+                'constrained_columns'),
+            'foreign_keys': _sorted([
+                {
+                    'name': fk.get('name'),
+                    'constrained_columns': fk['constrained_columns'],
+                    'referred_table': fk['referred_table'],
+                    'referred_columns': fk['referred_columns'],
+                }
+                for fk in inspector.get_foreign_keys(table_name)
+            ]),
+            'indexes': _sorted([
+                {
+                    'name': index.get('name'),
+                    'column_names': index['column_names'],
+                    'unique': bool(index['unique']),
+                }
+                for index in inspector.get_indexes(table_name)
+            ]),
+            'unique_constraints': _sorted([
+                {
+                    'name': constraint.get('name'),
+                    'column_names': constraint['column_names'],
+                }
+                for constraint in inspector.get_unique_constraints(
+                    table_name)
+            ]),
+        }
+    return schema
+
+
+def diff_schemas(expected, actual):
+    """Return the differences between two results of
+    :func:`reflect_schema`, in the format of
+    :attr:`ReversibilityError.differences`. """
+    differences = {}
+    for table_name in set(expected) | set(actual):
+        if expected.get(table_name) != actual.get(table_name):
+            differences[table_name] = {
+                'expected': expected.get(table_name),
+                'actual': actual.get(table_name),
+            }
+    return differences
+
+
+def _check(config, script, conn):
+    head = script.get_current_head()
+    current = _read_revision(config, script, conn)
+    schema = reflect_schema(conn)
+    errors = []
+
+    while current != head:
+        revision = migrate(config, script, conn, UPGRADE, '+1')
+        upgraded_schema = reflect_schema(conn)
+
+        migrate(config, script, conn, DOWNGRADE, '-1')
+        differences = diff_schemas(schema, reflect_schema(conn))
+        if differences:
+            errors.append(
+                ReversibilityError(revision, DOWNGRADE, differences))
+
+        migrate(config, script, conn, UPGRADE, '+1')
+        schema = reflect_schema(conn)
+        differences = diff_schemas(upgraded_schema, schema)
+        if differences:
+            errors.append(ReversibilityError(revision, UPGRADE, differences))
+
+        current = revision
+
+    return errors
+
+
+def _sorted(items):
+    return sorted(items, key=repr)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from alembicverify.timing import make_environment_context
+from alembicverify.util import load_script_directory
+
+
+class MigrationRunner(object):
+
+    """Run migrations on a given connection, without running ``env.py``.
+
+    :func:`alembicverify.util.upgrade` and
+    :func:`alembicverify.util.downgrade` run ``env.py`` on every call,
+    which usually sets up logging again and opens a new connection.  A
+    runner configures the migration context itself instead, with the
+    connection and the target metadata it was given, so the cost of a
+    call is only the cost of the migrations it runs.  This is meant for
+    verification loops running many small migrations on one database.
+
+    Anything ``env.py`` does besides configuring the context (like
+    custom options passed to ``configure``) has to be passed as
+    ``context_opts``.  A :class:`alembicverify.timing.MigrationTimer` in
+    ``config.attributes['timer']`` is honoured as usual.
+
+    :param config: A :class:`alembic.config.Config` instance.
+    :param connection: The connection to run the migrations on.
+    :param target_metadata: The ``MetaData`` of the models, passed to
+        the migration context like ``env.py`` usually does.
+    :param script: A :class:`alembic.script.ScriptDirectory` instance.
+        It defaults to the (cached) one returned by
+        :func:`alembicverify.util.load_script_directory`.
+    :param context_opts: Other keyword arguments for
+        :meth:`alembic.environment.EnvironmentContext.configure`.
+    """
+
+    def __init__(self, config, connection, target_metadata=None,
+                 script=None, **context_opts):
+        if script is None:
+            script = load_script_directory(config)
+        context_opts.setdefault('version_table', 'alembic_version')
+        self.config = config
+        self.connection = connection
+        self.script = script
+        self.target_metadata = target_metadata
+        self.context_opts = context_opts
+
+    def upgrade(self, revision='head'):
+        """Upgrade to ``revision``, which can be relative (like "+1").
+
+        :return: The current revision after the upgrade.
+        """
+        def fn(rev, context):
+            return self.script._upgrade_revs(revision, rev)
+
+        return self._run(fn, revision)
+
+    def downgrade(self, revision):
+        """Downgrade to ``revision``, which can be relative (like "-1").
+
+        :return: The current revision after the downgrade.
+        """
+        def fn(rev, context):
+            return self.script._downgrade_revs(revision, rev)
+
+        return self._run(fn, revision)
+
+    def get_current_revision(self):
+        """Return the current revision of the database (``None`` at
+        base). """
+        return self._run(None, None)
+
+    def _run(self, fn, destination):
+        with make_environment_context(
+                self.config, self.script,
+                fn=fn, destination_rev=destination) as env:
+            env.configure(
+                connection=self.connection,
+                target_metadata=self.target_metadata,
+                **self.context_opts)
+            if fn is not None:
+                with env.begin_transaction():
+                    env.run_migrations()
+            return env.get_context().get_current_revision()
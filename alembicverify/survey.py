@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import time
+from collections import namedtuple
+
+from alembic.migration import MigrationContext
+from alembic.util import CommandError
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+from alembicverify.util import load_script_directory, make_pool
+
+
+DatabaseRevision = namedtuple(
+    'DatabaseRevision', ['uri', 'revisions', 'latency', 'error'])
+"""The state of one database, as found by :func:`survey_revisions`.
+
+``revisions`` is the tuple of the current revisions (empty at base),
+``latency`` is the time in seconds spent reading them, and ``error`` is
+the description of the error that prevented reading them, if any.
+"""
+
+
+SurveyReport = namedtuple(
+    'SurveyReport', ['heads', 'at_head', 'behind', 'unknown'])
+"""The result of :func:`survey_revisions`.
+
+``heads`` is the tuple of head revisions of the migrations, and the
+other items are lists of :class:`DatabaseRevision`, in the order of the
+surveyed URIs: the databases at the head revisions, the ones at older
+revisions, and the ones whose revisions could not be read or are not
+part of the migrations.
+"""
+
+
+def survey_revisions(uris, config, workers=8):
+    """Read the current revisions of many databases sharing one set of
+    migrations.
+
+    The version tables are read concurrently by a pool of ``workers``
+    threads.  Each read uses a bare migration context on a connection
+    that is not pooled, without running ``env.py``, and the script
+    directory is only loaded once.  Errors are not raised: the database
+    is reported as unknown.
+
+    :param iterable uris: The URIs of the databases.
+    :param config: A :class:`alembic.config.Config` instance.
+    :param int workers: The maximum number of databases queried at the
+        same time.
+    :return: A :class:`SurveyReport` instance.
+    """
+    uris = list(uris)
+    script = load_script_directory(config)
+    heads = tuple(script.get_heads())
+
+    pool = make_pool(max(1, min(workers, len(uris))))
+    try:
+        results = pool.map(read_database_revisions, uris)
+    finally:
+        pool.close()
+        pool.join()
+
+    report = SurveyReport(heads, [], [], [])
+    for result in results:
+        if result.error is not None or not _are_known(script, result):
+            report.unknown.append(result)
+        elif set(result.revisions) == set(heads):
+            report.at_head.append(result)
+        else:
+            report.behind.append(result)
+    return report
+
+
+def read_database_revisions(uri):
+    """Return the :class:`DatabaseRevision` of the database at ``uri``.
+    """
+    started = time.time()
+    engine = create_engine(uri, poolclass=NullPool)
+    try:
+        with engine.connect() as conn:
+            migration_context = MigrationContext.configure(
+                conn, opts={'version_table': 'alembic_version'})
+            revisions = migration_context.get_current_heads()
+    except Exception as exc:
+        return DatabaseRevision(
+            uri, None, time.time() - started,
+            '{}: {}'.format(type(exc).__name__, exc))
+    finally:
+        engine.dispose()
+    return DatabaseRevision(uri, tuple(revisions), time.time() - started, None)
+
+
+def _are_known(script, result):
+    try:
+        for revision in result.revisions:
+            script.get_revision(revision)
+    except CommandError:
+        return False
+    return True
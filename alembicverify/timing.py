@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from alembic.environment import EnvironmentContext  # pylint: disable=E0401
+from sqlalchemy import event
+
+
+RevisionTiming = namedtuple(
+    'RevisionTiming', ['revision', 'direction', 'duration', 'statements'])
+"""Represent the time spent running one revision.
+
+``duration`` is in seconds, and ``statements`` is the number of SQL
+statements executed by the revision (including the update of the
+version table).
+"""
+
+
+class MigrationTimer(object):
+
+    """Collect the duration and the number of statements of each
+    migration step.
+
+    Put an instance in ``config.attributes['timer']`` and every
+    migration run by :func:`alembicverify.util.upgrade`,
+    :func:`alembicverify.util.downgrade`,
+    :func:`alembicverify.util.prepare_schema_from_migrations` or
+    :func:`alembicverify.walker.walk_revisions` with that configuration
+    is recorded in :attr:`timings`.
+    """
+
+    def __init__(self):
+        self.timings = []
+        self._lock = threading.Lock()
+
+    def record(self, timing):
+        """Add a :class:`RevisionTiming` to :attr:`timings`. """
+        with self._lock:
+            self.timings.append(timing)
+
+    def slowest(self, count=None):
+        """Return the ``count`` slowest timings, slowest first. """
+        timings = sorted(
+            self.timings, key=lambda timing: timing.duration, reverse=True)
+        return timings[:count]
+
+    def report(self, count=None):
+        """Return a list of lines describing the ``count`` slowest
+        timings. """
+        return [
+            '{0.duration:.4f}s {0.direction} {0.revision} '
+            '({0.statements} statements)'.format(timing)
+            for timing in self.slowest(count)
+        ]
+
+
+@contextmanager
+def make_environment_context(config, script, **kw):
+    """Context manager providing the environment context to run
+    migrations with.
+
+    If there is a :class:`MigrationTimer` in ``config.attributes['timer']``,
+    the time spent on each migration step is recorded into it: a timing
+    callback is added to the ``on_version_apply`` callbacks passed to
+    ``configure``, so this works with any ``env.py``.
+
+    :param kw: Passed on to :class:`alembic.environment.EnvironmentContext`.
+    """
+    env_context = EnvironmentContext(config, script, **kw)
+    timer = config.attributes.get('timer')
+    hook = None
+    if timer is not None:
+        hook = _TimingHook(timer, env_context)
+
+    with env_context:
+        try:
+            yield env_context
+        finally:
+            if hook is not None:
+                hook.detach()
+
+
+class _TimingHook(object):
+
+    # Wraps the ``configure`` method of an environment context.  The
+    # method is replaced on the instance rather than in a subclass, as
+    # the ``alembic.context`` proxy is only set up for the
+    # ``EnvironmentContext`` class itself.
+
+    def __init__(self, timer, env_context):
+        self._timer = timer
+        self._env_context = env_context
+        self._configure = env_context.configure
+        self._connection = None
+        self._started = None
+        self._statements = 0
+        env_context.configure = self.configure
+
+    def configure(self, *args, **kw):
+        callbacks = kw.get('on_version_apply')
+        if callbacks is None:
+            callbacks = ()
+        elif callable(callbacks):
+            callbacks = (callbacks, )
+        kw['on_version_apply'] = (
+            tuple(callbacks) + (self._on_version_apply, ))
+
+        self._configure(*args, **kw)
+
+        # In offline mode this is a mock connection that never executes.
+        self._connection = self._env_context.get_context().connection
+        event.listen(
+            self._connection, 'before_cursor_execute', self._on_execute)
+        self._restart()
+
+    def detach(self):
+        if self._connection is not None:
+            event.remove(
+                self._connection, 'before_cursor_execute', self._on_execute)
+            self._connection = None
+
+    def _on_execute(self, *args):
+        self._statements += 1
+
+    def _on_version_apply(self, ctx, step, heads, run_args):
+        self._timer.record(RevisionTiming(
+            revision=step.up_revision_id,
+            direction='upgrade' if step.is_upgrade else 'downgrade',
+            duration=time.time() - self._started,
+            statements=self._statements,
+        ))
+        self._restart()
+
+    def _restart(self):
+        self._started = time.time()
+        self._statements = 0
@@ -1,10 +1,37 @@
 # -*- coding: utf-8 -*-
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
 
-from alembic import command
+import six
 from alembic.config import Config
 from alembic.environment import EnvironmentContext  # pylint: disable=E0401
+from alembic.migration import MigrationContext
 from alembic.script import ScriptDirectory
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+
+from alembicverify.cache import (
+    get_migration_folders,
+    get_snapshot_path,
+    iter_python_files,
+    load_snapshot,
+    save_snapshot,
+)
+from alembicverify.index import use_revision_index
+from alembicverify.timing import make_environment_context
+
+
+Revisions = namedtuple('Revisions', ['current', 'head'])
+"""The current and head revisions, as returned by :func:`get_revisions`.
+"""
+
+
+_engines = {}
+_connections = {}
+_scripts = {}
+_registry_lock = threading.Lock()
 
 
 def make_alembic_config(uri, folder):
@@ -15,37 +42,372 @@ def make_alembic_config(uri, folder):
     return config
 
 
-def prepare_schema_from_migrations(uri, config, revision="head"):
+def prepare_schema_from_migrations(
+        uri, config, revision="head", snapshot_dir=None):
     """Applies migrations to a database.
 
     :param string uri: The URI for the database.
     :param config: A :class:`alembic.config.Config` instance.
     :param revision: The revision we want to feed to the
-        ``command.upgrade`` call. Normally it's either "head" or "+1".
+        :func:`upgrade` call. Normally it's either "head" or "+1".
+    :param string snapshot_dir: Optional folder used to cache the
+        resulting schema.  When the database is at base, the migrations
+        are replaced by the snapshot of the target revision (for the
+        same migration files and dialect), if there is one, and it is
+        stored otherwise.  A database that is already past base is
+        upgraded as usual, and nothing is done if it is already at the
+        target revision.  It defaults to the ``snapshot_dir`` item of
+        ``config.attributes``, if any.  See
+        :func:`alembicverify.cache.save_snapshot` for what a snapshot
+        keeps.
+
+    The engine comes from :func:`get_engine`, and unless one is already
+    there, the connection returned by :func:`get_connection` is stored
+    in ``config.attributes['connection']``, so that an ``env.py`` that
+    honours it runs the migrations on that same connection.
     """
-    engine = create_engine(uri)
-    script = ScriptDirectory.from_config(config)
-    command.upgrade(config, revision)
+    engine = get_engine(uri)
+    script = load_script_directory(config)
+    if 'connection' not in config.attributes:
+        config.attributes['connection'] = get_connection(uri)
+    conn = config.attributes['connection']
+
+    if snapshot_dir is None:
+        snapshot_dir = config.attributes.get('snapshot_dir')
+
+    if snapshot_dir is None:
+        upgrade(config, revision, script=script)
+        return engine, script
+
+    current = MigrationContext.configure(
+        conn, opts={'version_table': 'alembic_version'}).get_current_heads()
+    steps = script._upgrade_revs(revision, current)
+    if not steps:
+        # Already at the target revision.
+        return engine, script
+    if current:
+        upgrade(config, revision, script=script)
+        return engine, script
+
+    path = get_snapshot_path(
+        snapshot_dir, script, _get_target(steps), engine.dialect.name)
+    if os.path.exists(path):
+        load_snapshot(conn, path)
+    else:
+        upgrade(config, revision, script=script)
+        save_snapshot(conn, path)
+
     return engine, script
 
 
+def _get_target(steps):
+    # The heads reached by the upgrade ``steps``, as a string.
+    revisions = set()
+    down_revisions = set()
+    for step in steps:
+        revisions.add(step.revision.revision)
+        down_revisions.update(step.from_revisions_no_deps)
+    return ' '.join(sorted(revisions - down_revisions))
+
+
+def load_script_directory(config, indexed=None):
+    """Return the :class:`alembic.script.ScriptDirectory` for ``config``.
+
+    Script directories are cached per location, so the revision files
+    are parsed only once per process.  A cached script directory is
+    discarded as soon as any Python file in its folders is added,
+    removed or modified.
+
+    :param bool indexed: Build the revision map from the on-disk
+        revision index (see :func:`alembicverify.index.use_revision_index`)
+        instead of importing every revision module.  It defaults to the
+        ``revision_index`` item of ``config.attributes``, if any.
+    """
+    if indexed is None:
+        indexed = config.attributes.get('revision_index', False)
+
+    script = ScriptDirectory.from_config(config)
+    folders = get_migration_folders(script)
+    key = (tuple(folders), bool(indexed))
+    signature = _get_files_signature(folders)
+
+    with _registry_lock:
+        cached = _scripts.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        if indexed:
+            use_revision_index(script)
+        _scripts[key] = (signature, script)
+    return script
+
+
+def upgrade(config, revision, script=None):
+    """Upgrade the database, like :func:`alembic.command.upgrade`.
+
+    ``env.py`` is run as usual, but the (cached) ``script`` is used
+    instead of loading the revision files again.
+    """
+    if script is None:
+        script = load_script_directory(config)
+
+    def fn(rev, context):
+        return script._upgrade_revs(revision, rev)
+
+    with make_environment_context(
+            config, script, fn=fn, destination_rev=revision):
+        script.run_env()
+
+
+def downgrade(config, revision, script=None):
+    """Downgrade the database, like :func:`alembic.command.downgrade`.
+
+    ``env.py`` is run as usual, but the (cached) ``script`` is used
+    instead of loading the revision files again.
+    """
+    if script is None:
+        script = load_script_directory(config)
+
+    def fn(rev, context):
+        return script._downgrade_revs(revision, rev)
+
+    with make_environment_context(
+            config, script, fn=fn, destination_rev=revision):
+        script.run_env()
+
+
+def _get_files_signature(folders):
+    signature = []
+    for folder in folders:
+        for path in iter_python_files(folder):
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime, stat.st_size))
+    return tuple(signature)
+
+
+def prepare_schemas_concurrently(
+        uri_left, config, uri_right, sqlalchemy_base, revision="head",
+        processes=False):
+    """Prepare the left schema from migrations and the right one from
+    models at the same time.
+
+    The two databases are independent, so the total time is bounded by
+    the slower of the two sides.
+
+    :param string uri_left: The URI for the database to migrate.
+    :param config: A :class:`alembic.config.Config` instance.
+    :param string uri_right: The URI for the database built from models.
+    :param sqlalchemy_base: The declarative base of the models.
+    :param revision: The revision to upgrade the left database to.
+    :param bool processes: Use worker processes instead of threads.
+        The configuration is rebuilt in the worker from its options, so
+        only picklable ``config.attributes`` are carried over.  With
+        threads, the migrations run on ``config.attributes
+        ['connection']`` if there is one, and otherwise on a connection
+        opened and closed by the worker thread.
+    :return: A ``((engine_left, script), engine_right)`` tuple.
+    """
+    # Imported here, as importing SQLAlchemy Diff and SQLAlchemy Utils
+    # is slow and this is the only helper needing them.
+    from sqlalchemydiff.util import prepare_schema_from_models
+
+    pool = make_pool(2, processes=processes)
+    try:
+        if processes:
+            left = pool.apply_async(
+                _prepare_schema_from_options,
+                (uri_left, get_config_options(config), revision)
+            )
+        else:
+            left = pool.apply_async(
+                _prepare_schema_in_thread, (uri_left, config, revision))
+        right = pool.apply_async(
+            prepare_schema_from_models, (uri_right, sqlalchemy_base))
+        left_result = left.get()
+        right.get()
+    finally:
+        pool.close()
+        pool.join()
+
+    if processes:
+        left_result = (get_engine(uri_left), load_script_directory(config))
+    return left_result, get_engine(uri_right)
+
+
+def get_engine(uri):
+    """Return the pooled engine for ``uri``, creating it on first use.
+
+    Engines are shared by all the helpers in this module until
+    :func:`dispose_engines` is called.
+    """
+    with _registry_lock:
+        if uri not in _engines:
+            _engines[uri] = create_engine(uri)
+        return _engines[uri]
+
+
+def get_connection(uri):
+    """Return the live connection for ``uri``, opening it on first use.
+    """
+    engine = get_engine(uri)
+    with _registry_lock:
+        if uri not in _connections:
+            _connections[uri] = engine.connect()
+        return _connections[uri]
+
+
+def use_schema(uri, schema):
+    """Make the registry engine for ``uri`` work in ``schema``.
+
+    The current engine for ``uri``, if any, is disposed, and the new one
+    sets the PostgreSQL ``search_path`` to ``schema`` on each new
+    connection, before the dialect reads the default schema.  The
+    migrations (through ``config.attributes['connection']``), the
+    version table and :func:`alembicverify.comparer.compare_to_metadata`
+    then all use ``schema``.  It lasts until :func:`dispose_engines`.
+
+    :return: The new engine.
+    """
+    dispose_engines(uri)
+    engine = get_engine(uri)
+    statement = 'SET search_path TO {}'.format(
+        engine.dialect.identifier_preparer.quote(schema))
+
+    def set_search_path(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(statement)
+        cursor.close()
+        # Otherwise the setting is lost when the pool rolls back.
+        dbapi_connection.commit()
+
+    event.listen(engine, 'connect', set_search_path, insert=True)
+    return engine
+
+
+def dispose_engines(uri=None):
+    """Close the connections and dispose the engines of the registry.
+
+    :param string uri: Only dispose the engine for this URI.  All of
+        them are disposed if it is not given.
+    """
+    with _registry_lock:
+        uris = list(_engines) if uri is None else [uri]
+        for key in uris:
+            connection = _connections.pop(key, None)
+            if connection is not None:
+                connection.close()
+            engine = _engines.pop(key, None)
+            if engine is not None:
+                engine.dispose()
+
+
+def make_pool(workers, processes=False):
+    """Return a pool of ``workers`` threads, or processes. """
+    if processes:
+        return multiprocessing.Pool(workers)
+    return ThreadPool(workers)
+
+
+def get_config_options(config):
+    """Return a picklable description of ``config``.
+
+    Use :func:`config_from_options` to rebuild the configuration, for
+    example in a worker process.
+    """
+    section = config.config_ini_section
+    options = dict(config.file_config.items(section, raw=True))
+    attributes = dict(
+        (name, value) for name, value in config.attributes.items()
+        if isinstance(value, six.string_types + (int, float, bool))
+    )
+    return {
+        'file': config.config_file_name,
+        'ini_section': section,
+        'options': options,
+        'attributes': attributes,
+    }
+
+
+def config_from_options(options):
+    """Build a :class:`alembic.config.Config` from the result of
+    :func:`get_config_options`. """
+    config = Config(options['file'], ini_section=options['ini_section'])
+    for name, value in options['options'].items():
+        config.set_main_option(name, value)
+    config.attributes.update(options['attributes'])
+    return config
+
+
+def _prepare_schema_in_thread(uri, config, revision):
+    # Some drivers (like SQLite) only use a connection in the thread that
+    # opened it, so unless one is given, the worker thread migrates on a
+    # connection of its own, which is closed instead of being kept in the
+    # registry or in ``config.attributes``.
+    if 'connection' in config.attributes:
+        return prepare_schema_from_migrations(uri, config, revision)
+    with get_engine(uri).connect() as conn:
+        config.attributes['connection'] = conn
+        try:
+            return prepare_schema_from_migrations(uri, config, revision)
+        finally:
+            del config.attributes['connection']
+
+
+def _prepare_schema_from_options(uri, options, revision):
+    prepare_schema_from_migrations(
+        uri, config_from_options(options), revision)
+    dispose_engines()
+
+
 def get_current_revision(config, engine, script):
     """Inspection helper. Get the current revision of a set of migrations. """
     return _get_revision(config, engine, script)
 
 
 def get_head_revision(config, engine, script):
-    """Inspection helper. Get the head revision of a set of migrations. """
+    """Inspection helper. Get the head revision of a set of migrations.
+
+    The head only depends on ``script``, so the database is not queried.
+    Migrations with several heads raise
+    :class:`alembic.util.CommandError`: use :func:`get_head_revisions`
+    instead, or :func:`alembicverify.branches.verify_heads` to verify
+    each head.
+    """
     return _get_revision(config, engine, script, revision_type='head')
 
 
+def get_head_revisions(script):
+    """Inspection helper. Get all the head revisions of a set of
+    migrations, as a tuple.  No database is needed. """
+    return tuple(script.get_heads())
+
+
+def get_revisions(config, engine, script):
+    """Inspection helper. Get both the current and the head revisions.
+
+    The current revision is read with a single migration context, and
+    the head revision is taken from ``script``.
+
+    :return: A :class:`Revisions` instance.
+    """
+    return Revisions(
+        current=_get_revision(config, engine, script),
+        head=script.as_revision_number('head'),
+    )
+
+
 def _get_revision(config, engine, script, revision_type='current'):
+    if revision_type == 'head':
+        return script.as_revision_number('head')
+
+    conn = config.attributes.get('connection')
+    if conn is not None:
+        return _read_revision(config, script, conn)
     with engine.connect() as conn:
-        with EnvironmentContext(config, script) as env_context:
-            env_context.configure(conn, version_table="alembic_version")
-            if revision_type == 'head':
-                revision = env_context.get_head_revision()
-            else:
-                migration_context = env_context.get_context()
-                revision = migration_context.get_current_revision()
-    return revision
+        return _read_revision(config, script, conn)
+
+
+def _read_revision(config, script, conn):
+    with EnvironmentContext(config, script) as env_context:
+        env_context.configure(conn, version_table="alembic_version")
+        migration_context = env_context.get_context()
+        return migration_context.get_current_revision()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import time
+
+import alembic
+import sqlalchemy
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from alembicverify.cache import (
+    get_migration_folders,
+    hash_migration_files,
+    open_atomically,
+)
+
+
+VERDICT_FORMAT = 1
+
+
+def get_fingerprint(script, metadata=None, dialect=None, extra=()):
+    """Return a digest of the migrations of ``script`` and of the models.
+
+    The models are fingerprinted through the DDL of ``metadata``
+    compiled for ``dialect``, with the whitespace normalized, so only
+    changes that affect the schema produce a different fingerprint.
+    The versions of Alembic and SQLAlchemy are included as well, as
+    they change what the comparisons report.
+
+    :param script: A :class:`alembic.script.ScriptDirectory` instance.
+    :param metadata: The :class:`sqlalchemy.MetaData` of the models, if
+        they are part of the verification.
+    :param dialect: The dialect to compile the DDL for.
+    :param iterable extra: Other JSON-serializable values that the
+        verdict depends on, like the name of the check and the ignored
+        tables.
+    """
+    digest = hashlib.sha1()
+    digest.update('alembic {} sqlalchemy {}'.format(
+        alembic.__version__, sqlalchemy.__version__).encode('utf-8'))
+    digest.update(hash_migration_files(get_migration_folders(script))
+                  .encode('utf-8'))
+    if metadata is not None:
+        digest.update(get_metadata_ddl(metadata, dialect).encode('utf-8'))
+    for item in extra:
+        digest.update(json.dumps(item, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def get_metadata_ddl(metadata, dialect):
+    """Return the normalized DDL creating the tables and indexes of
+    ``metadata``, followed by the table and column comments.
+
+    The comments are not part of ``CREATE TABLE`` on every dialect (like
+    PostgreSQL), but the comparisons report them.
+    """
+    statements = []
+    comments = []
+    for table in metadata.sorted_tables:
+        statements.append(CreateTable(table))
+        indexes = sorted(table.indexes, key=lambda index: index.name or '')
+        statements.extend(CreateIndex(index) for index in indexes)
+        comments.append([table.name, table.comment, [
+            [column.name, column.comment] for column in table.columns]])
+    lines = [
+        ' '.join(str(statement.compile(dialect=dialect)).split())
+        for statement in statements
+    ]
+    lines.append(json.dumps(comments))
+    return '\n'.join(lines)
+
+
+def get_dialect(uri):
+    """Return a dialect instance for ``uri``, without connecting. """
+    return make_url(uri).get_dialect()()
+
+
+class VerdictCache(object):
+
+    """Store the verdicts of verifications in a folder, by fingerprint.
+
+    A verdict is a dict with ``passed`` (a boolean) and ``errors`` (the
+    JSON-serializable differences found, if any).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get(self, fingerprint):
+        """Return the verdict for ``fingerprint``, or ``None``. """
+        try:
+            with open(self._get_path(fingerprint)) as stream:
+                data = json.load(stream)
+        except (IOError, OSError, ValueError):
+            return None
+        if data.get('format') != VERDICT_FORMAT:
+            return None
+        return {'passed': data['passed'], 'errors': data['errors']}
+
+    def put(self, fingerprint, passed, errors):
+        """Store a verdict for ``fingerprint``. """
+        data = {
+            'format': VERDICT_FORMAT,
+            'passed': passed,
+            'errors': errors,
+            'created': time.time(),
+        }
+        with open_atomically(self._get_path(fingerprint)) as stream:
+            json.dump(data, stream, indent=1, sort_keys=True)
+
+    def _get_path(self, fingerprint):
+        return os.path.join(self.directory, '{}.json'.format(fingerprint))
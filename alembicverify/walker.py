@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+
+from alembicverify.runner import MigrationRunner
+
+
+RevisionStep = namedtuple(
+    'RevisionStep', ['direction', 'source', 'destination'])
+"""Represent a single migration step performed by :func:`walk_revisions`.
+
+``source`` and ``destination`` are the current revisions of the database
+before and after the step (``None`` means the database is at base).
+"""
+
+
+UPGRADE = 'upgrade'
+DOWNGRADE = 'downgrade'
+
+
+def walk_revisions(config, engine, script, downgrade=True):
+    """Walk the revision chain one step at a time.
+
+    The database is upgraded one revision at a time until it reaches
+    the head revision and, unless ``downgrade`` is ``False``, it is then
+    downgraded one revision at a time back to base.  A
+    :class:`RevisionStep` is yielded after each step, so the caller can
+    inspect the database in between.
+
+    All the steps run on one connection (the one in
+    ``config.attributes['connection']`` if there is one) and on the
+    already loaded ``script``, without running ``env.py``, so the cost
+    of a full round trip grows linearly with the number of revisions.
+
+    The revision chain must have a single head.
+
+    :param config: A :class:`alembic.config.Config` instance.
+    :param engine: The engine for the database to migrate.
+    :param script: A :class:`alembic.script.ScriptDirectory` instance.
+    :param bool downgrade: Also walk back down to base.
+    """
+    conn = config.attributes.get('connection')
+    if conn is not None:
+        for step in _walk(config, script, conn, downgrade):
+            yield step
+        return
+
+    with engine.connect() as conn:
+        for step in _walk(config, script, conn, downgrade):
+            yield step
+
+
+def migrate(config, script, conn, direction, destination):
+    """Run the migrations from the current revision to ``destination``.
+
+    ``env.py`` is not run: see
+    :class:`alembicverify.runner.MigrationRunner`.
+
+    :param direction: Either ``UPGRADE`` or ``DOWNGRADE``.
+    :param destination: The target revision, which can be relative,
+        like "+1" or "-1".
+    :return: The current revision after the migration.
+    """
+    runner = MigrationRunner(config, conn, script=script)
+    if direction == UPGRADE:
+        return runner.upgrade(destination)
+    return runner.downgrade(destination)
+
+
+def _walk(config, script, conn, downgrade):
+    runner = MigrationRunner(config, conn, script=script)
+    head = script.get_current_head()
+    current = runner.get_current_revision()
+
+    while current != head:
+        revision = runner.upgrade('+1')
+        yield RevisionStep(UPGRADE, current, revision)
+        current = revision
+
+    while downgrade and current is not None:
+        revision = runner.downgrade('-1')
+        yield RevisionStep(DOWNGRADE, current, revision)
+        current = revision
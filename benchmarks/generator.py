@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""Generate synthetic Alembic histories for the benchmarks.
+
+A history is described by a list of :class:`Revision` objects, which
+can be written to disk as a migrations folder (with :func:`write_history`)
+and turned into the ``MetaData`` of the matching models (with
+:func:`build_metadata`).
+"""
+import os
+from collections import namedtuple
+
+from sqlalchemy import Column, Integer, MetaData, String, Table
+
+
+Revision = namedtuple(
+    'Revision', ['revision', 'down_revision', 'operations'])
+"""A revision of a synthetic history.  ``down_revision`` is ``None``, a
+revision id or a tuple of revision ids (for merges), and ``operations``
+is a list of ``('create_table', table, columns)`` or
+``('add_column', table, column)`` tuples. """
+
+
+SHAPES = ('wide', 'deep', 'branched')
+
+
+ENV_PY = '''\
+from alembic import context
+from sqlalchemy import create_engine
+
+
+config = context.config
+
+
+def run_migrations_on(connection):
+    context.configure(connection=connection)
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+connection = config.attributes.get('connection', None)
+if connection is not None:
+    run_migrations_on(connection)
+else:
+    engine = create_engine(config.get_main_option('sqlalchemy.url'))
+    with engine.connect() as connection:
+        run_migrations_on(connection)
+    engine.dispose()
+'''
+
+
+REVISION_PY = '''\
+"""Synthetic revision {revision}"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = {revision!r}
+down_revision = {down_revision!r}
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+{upgrade}
+
+
+def downgrade():
+{downgrade}
+'''
+
+
+def make_history(shape, revisions, columns=10, tables=10, branch_every=10):
+    """Return the list of :class:`Revision` of a synthetic history.
+
+    :param string shape: One of:
+
+        * ``wide``: each revision creates a table with ``columns``
+          columns.
+        * ``deep``: the first revision creates ``tables`` tables, and
+          each of the following revisions adds a column to one of them.
+        * ``branched``: like ``wide``, but every ``branch_every``
+          revisions the history forks into two branches that are merged
+          by the following revision.
+    :param int revisions: The number of revisions.
+    """
+    if shape not in SHAPES:
+        raise ValueError('Unknown shape: {}'.format(shape))
+
+    def operations(number):
+        if shape == 'deep' and number == 0:
+            return [
+                ('create_table', 't{:05d}'.format(table), 1)
+                for table in range(tables)
+            ]
+        if shape == 'deep':
+            return [(
+                'add_column',
+                't{:05d}'.format(number % tables),
+                'c{:05d}'.format(number),
+            )]
+        return [('create_table', 't{:05d}'.format(number), columns)]
+
+    def revision_id(number):
+        return 'r{:05d}'.format(number)
+
+    history = []
+    head = None
+    number = 0
+    while number < revisions:
+        if (shape == 'branched' and number > 0 and
+                number % branch_every == 0 and number + 3 <= revisions):
+            # Two revisions with the same parent, and a merge revision.
+            left, right = revision_id(number), revision_id(number + 1)
+            history.append(Revision(left, head, operations(number)))
+            history.append(Revision(right, head, operations(number + 1)))
+            head = revision_id(number + 2)
+            history.append(
+                Revision(head, (left, right), operations(number + 2)))
+            number += 3
+        else:
+            history.append(
+                Revision(revision_id(number), head, operations(number)))
+            head = revision_id(number)
+            number += 1
+
+    return history
+
+
+def write_history(folder, history):
+    """Write ``history`` as an Alembic migrations folder in ``folder``.
+    """
+    versions = os.path.join(folder, 'versions')
+    if not os.path.isdir(versions):
+        os.makedirs(versions)
+
+    with open(os.path.join(folder, 'env.py'), 'w') as stream:
+        stream.write(ENV_PY)
+
+    for revision in history:
+        upgrade, downgrade = [], []
+        for operation in revision.operations:
+            if operation[0] == 'create_table':
+                _, table, columns = operation
+                upgrade.append(_create_table(table, columns))
+                downgrade.insert(0, '    op.drop_table({!r})'.format(table))
+            else:
+                _, table, column = operation
+                upgrade.append(
+                    '    op.add_column({!r}, sa.Column({!r}, sa.Integer()))'
+                    .format(table, column))
+                downgrade.insert(0, _drop_column(table, column))
+
+        path = os.path.join(versions, '{}_synthetic.py'.format(
+            revision.revision))
+        with open(path, 'w') as stream:
+            stream.write(REVISION_PY.format(
+                revision=revision.revision,
+                down_revision=revision.down_revision,
+                upgrade='\n'.join(upgrade),
+                downgrade='\n'.join(downgrade),
+            ))
+
+
+def build_metadata(history):
+    """Return the ``MetaData`` of the models matching the head of
+    ``history``. """
+    metadata = MetaData()
+    for revision in history:
+        for operation in revision.operations:
+            if operation[0] == 'create_table':
+                _, table, columns = operation
+                Table(table, metadata, *_columns(columns))
+            else:
+                _, table, column = operation
+                metadata.tables[table].append_column(Column(column, Integer))
+    return metadata
+
+
+def _columns(count):
+    columns = [Column('id', Integer, primary_key=True)]
+    columns.extend(
+        Column('c{:03d}'.format(number), String(50))
+        for number in range(1, count))
+    return columns
+
+
+def _create_table(table, columns):
+    lines = [
+        '    op.create_table(',
+        '        {!r},'.format(table),
+        "        sa.Column('id', sa.Integer(), primary_key=True),",
+    ]
+    lines.extend(
+        "        sa.Column('c{:03d}', sa.String(50)),".format(number)
+        for number in range(1, columns))
+    lines.append('    )')
+    return '\n'.join(lines)
+
+
+def _drop_column(table, column):
+    # SQLite cannot drop columns without recreating the table.
+    return '\n'.join([
+        '    with op.batch_alter_table({!r}) as batch_op:'.format(table),
+        '        batch_op.drop_column({!r})'.format(column),
+    ])
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""Benchmark the alembic-verify helpers on synthetic histories.
+
+Usage::
+
+    python -m benchmarks.run --sizes 100 1000 --output results.json
+
+Each benchmark runs against SQLite databases in a temporary folder.  The
+results are written as JSON, so that they can be compared between runs
+to spot regressions.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import alembic
+import sqlalchemy
+from sqlalchemydiff import compare
+from sqlalchemydiff.util import prepare_schema_from_models
+
+from alembicverify import util
+from alembicverify.comparer import compare_to_metadata
+from alembicverify.index import INDEX_FILENAME
+from alembicverify.util import (
+    dispose_engines,
+    get_head_revision,
+    load_script_directory,
+    make_alembic_config,
+    prepare_schema_from_migrations,
+)
+from alembicverify.walker import walk_revisions
+from benchmarks.generator import (
+    SHAPES,
+    build_metadata,
+    make_history,
+    write_history,
+)
+
+
+DEFAULT_SIZES = (100, 1000, 5000)
+
+
+def run_benchmarks(shape, size, folder, repeat=1):
+    """Run all the benchmarks for one synthetic history.
+
+    :return: A list of ``{'benchmark': name, 'seconds': best_time}``
+        dicts.
+    """
+    history = make_history(shape, size)
+    alembic_root = os.path.join(folder, 'alembic')
+    write_history(alembic_root, history)
+    metadata = build_metadata(history)
+
+    counter = [0]
+
+    def new_uri():
+        counter[0] += 1
+        return 'sqlite:///{}'.format(
+            os.path.join(folder, 'db_{}.sqlite'.format(counter[0])))
+
+    def prepare():
+        uri = new_uri()
+        prepare_schema_from_migrations(
+            uri, make_alembic_config(uri, alembic_root))
+        return uri
+
+    def head_lookup(indexed, cold_index):
+        # Start from an empty script directory cache every time.
+        util._scripts.clear()
+        if cold_index:
+            index = os.path.join(alembic_root, 'versions', INDEX_FILENAME)
+            if os.path.exists(index):
+                os.remove(index)
+        config = make_alembic_config(new_uri(), alembic_root)
+        script = load_script_directory(config, indexed=indexed)
+        get_head_revision(config, None, script)
+
+    def walk():
+        uri = new_uri()
+        config = make_alembic_config(uri, alembic_root)
+        config.attributes['connection'] = util.get_connection(uri)
+        script = load_script_directory(config)
+        for _ in walk_revisions(config, util.get_engine(uri), script):
+            pass
+
+    def compare_metadata():
+        compare_to_metadata(prepared_uri, metadata)
+
+    def compare_databases():
+        uri = new_uri()
+        prepare_schema_from_models(uri, _Base(metadata))
+        compare(prepared_uri, uri, ['alembic_version'])
+
+    benchmarks = [
+        ('prepare_schema_from_migrations', prepare),
+        ('head_lookup', lambda: head_lookup(False, False)),
+        ('head_lookup_indexed_cold', lambda: head_lookup(True, True)),
+        ('head_lookup_indexed_warm', lambda: head_lookup(True, False)),
+    ]
+    if shape != 'branched':
+        # The walker needs a linear history.
+        benchmarks.append(('walk_revisions_round_trip', walk))
+
+    results = []
+    for name, function in benchmarks:
+        results.append({
+            'benchmark': name, 'seconds': _best_time(function, repeat)})
+        dispose_engines()
+
+    prepared_uri = prepare()
+    for name, function in [
+            ('compare_to_metadata', compare_metadata),
+            ('compare_two_databases', compare_databases)]:
+        results.append({
+            'benchmark': name, 'seconds': _best_time(function, repeat)})
+    dispose_engines()
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+        help='Numbers of revisions of the synthetic histories.')
+    parser.add_argument(
+        '--shapes', nargs='+', choices=SHAPES, default=list(SHAPES),
+        help='Shapes of the synthetic histories.')
+    parser.add_argument(
+        '--repeat', type=int, default=1,
+        help='Run each benchmark this many times and keep the best time.')
+    parser.add_argument(
+        '--output', default='benchmark-results.json',
+        help='File to write the JSON results to.')
+    args = parser.parse_args(argv)
+
+    results = []
+    for shape in args.shapes:
+        for size in args.sizes:
+            folder = tempfile.mkdtemp(prefix='alembicverify-bench-')
+            try:
+                for result in run_benchmarks(shape, size, folder, args.repeat):
+                    result.update({'shape': shape, 'revisions': size})
+                    results.append(result)
+                    print('{shape:>8} {revisions:>6} {benchmark:<32} '
+                          '{seconds:.4f}s'.format(**result))
+            finally:
+                shutil.rmtree(folder)
+
+    with open(args.output, 'w') as stream:
+        json.dump(
+            {'environment': _environment(), 'results': results},
+            stream, indent=2, sort_keys=True)
+
+
+class _Base(object):
+    # ``prepare_schema_from_models`` only needs a ``metadata`` attribute.
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+
+
+def _best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.time()
+        function()
+        times.append(time.time() - started)
+    return min(times)
+
+
+def _environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'alembic': alembic.__version__,
+        'sqlalchemy': sqlalchemy.__version__,
+        'timestamp': time.time(),
+    }
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Benchmark the time the pytest plugin adds to the startup of pytest.
+
+Usage::
+
+    python -m benchmarks.startup --repeat 20 --output startup.json
+
+Each measurement runs a new Python interpreter, importing pytest alone
+and then pytest with the plugin, so the difference is the cost of
+loading the plugin in projects that do not use its fixtures.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from benchmarks.run import _environment
+
+
+IMPORTS = (
+    ('pytest', 'import pytest'),
+    ('pytest_with_plugin', 'import pytest, alembicverify.pyfixtures'),
+)
+
+
+def measure(code, repeat):
+    """Return the best time, in seconds, of ``repeat`` runs of ``code``
+    in a new interpreter. """
+    times = []
+    for _ in range(repeat):
+        started = time.time()
+        subprocess.check_call([sys.executable, '-c', code])
+        times.append(time.time() - started)
+    return min(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--repeat', type=int, default=10,
+        help='Run each import this many times and keep the best time.')
+    parser.add_argument(
+        '--output', default='startup-results.json',
+        help='File to write the JSON results to.')
+    args = parser.parse_args(argv)
+
+    results = []
+    for name, code in IMPORTS:
+        result = {'benchmark': name, 'seconds': measure(code, args.repeat)}
+        results.append(result)
+        print('{benchmark:<32} {seconds:.4f}s'.format(**result))
+
+    with open(args.output, 'w') as stream:
+        json.dump(
+            {'environment': _environment(), 'results': results},
+            stream, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -61,20 +61,32 @@ def run_migrations_online():
     In this scenario we need to create an Engine
     and associate a connection with the context.
 
+    If a connection is given in ``config.attributes``, as alembic-verify
+    does, it is used instead of creating a new Engine.
+
     """
+    connection = config.attributes.get('connection', None)
+    if connection is not None:
+        run_migrations_on(connection)
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section),
         prefix='sqlalchemy.',
         poolclass=pool.NullPool)
 
     with connectable.connect() as connection:
-        context.configure(
-            connection=connection,
-            target_metadata=target_metadata
-        )
+        run_migrations_on(connection)
 
-        with context.begin_transaction():
-            context.run_migrations()
+
+def run_migrations_on(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
 
 
 if context.is_offline_mode():
@@ -12,6 +12,7 @@ from sqlalchemydiff.util import (
 )
 
 from alembicverify.util import (
+    dispose_engines,
     get_current_revision,
     get_head_revision,
     make_alembic_config,
@@ -42,6 +43,9 @@ class TestExample(unittest.TestCase):
         new_db(self.uri_right)
 
     def tearDown(self):
+        # Close the connections the helpers keep, or the databases
+        # cannot be dropped.
+        dispose_engines()
         destroy_database(self.uri_left)
         destroy_database(self.uri_right)
 
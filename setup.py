@@ -19,7 +19,8 @@ setup(
     author='student.com',
     author_email='wearehiring@student.com',
     url='https://github.com/gianchub/alembic-verify',
-    packages=find_packages(exclude=['test', 'test.*']),
+    packages=find_packages(
+        exclude=['test', 'test.*', 'benchmarks', 'benchmarks.*']),
     install_requires=[
         "six>=1.10.0",
         "sqlalchemy-diff>=0.1.3",
@@ -29,6 +30,7 @@ setup(
         'dev': [
             "mock==2.0.0",
             "pytest==3.0.3",
+            "pytest-xdist==1.22.0",
             "pylint==1.5.1",
             "flake8==3.0.4",
             "coverage==4.2",
@@ -36,11 +38,17 @@ setup(
         'docs': [
             "Sphinx==1.3.1",
         ],
+        'asyncio': [
+            "sqlalchemy[asyncio]>=1.4",
+        ],
     },
     entry_points={
         'pytest11': [
             'pytest_alembic_verify=alembicverify.pyfixtures'
-        ]
+        ],
+        'console_scripts': [
+            'alembic-verify=alembicverify.cli:main',
+        ],
     },
     zip_safe=True,
     license='Apache License, Version 2.0',
@@ -1,7 +1,10 @@
 # -*- coding: utf-8 -*-
+import os
 from unittest import TestCase
 
 import six
+from sqlalchemy import (
+    Column, ForeignKey, Index, Integer, MetaData, Table, Unicode)
 
 
 if six.PY2:
@@ -15,3 +18,42 @@ if six.PY2:
 else:
 
     assert_items_equal = TestCase().assertCountEqual
+
+
+alembic_root = os.path.join(os.path.dirname(__file__), 'migrations')
+"""The test migrations, for SQLite: ``aaa111``, ``bbb222`` and
+``ccc333``. """
+
+
+def make_metadata():
+    """The models matching the head revision of the test migrations. """
+    metadata = MetaData()
+    Table('companies', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', Unicode(200), nullable=False))
+    Table('employees', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('name', Unicode(200), nullable=True),
+          Column('company_id', Integer, ForeignKey('companies.id'),
+                 nullable=False),
+          Index('ix_employees_name', 'name', unique=True))
+    return metadata
+
+
+STOCK_ENV = """
+from alembic import context
+from sqlalchemy import engine_from_config, pool
+
+
+config = context.config
+connectable = engine_from_config(
+    config.get_section(config.config_ini_section),
+    prefix='sqlalchemy.', poolclass=pool.NullPool)
+
+with connectable.connect() as connection:
+    context.configure(connection=connection)
+    with context.begin_transaction():
+        context.run_migrations()
+"""
+"""An ``env.py`` like the one generated by Alembic, which ignores
+``config.attributes['connection']``. """
@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+import sys
+
+
+collect_ignore = []
+if sys.version_info < (3, 7):
+    # The asyncio helpers need Python 3 and ``asyncio.run``.
+    collect_ignore.append('unit/test_aio.py')
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from alembic import context
+from sqlalchemy import create_engine
+
+
+config = context.config
+
+
+def run_migrations_on(connection):
+    context.configure(connection=connection)
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+connection = config.attributes.get('connection', None)
+if connection is not None:
+    run_migrations_on(connection)
+else:
+    engine = create_engine(config.get_main_option('sqlalchemy.url'))
+    with engine.connect() as connection:
+        run_migrations_on(connection)
+    engine.dispose()
@@ -0,0 +1,27 @@
+"""Companies
+
+Revision ID: aaa111
+Revises:
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'aaa111'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'companies',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.Unicode(length=200), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade():
+    op.drop_table('companies')
@@ -0,0 +1,29 @@
+"""Employees
+
+Revision ID: bbb222
+Revises: aaa111
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'bbb222'
+down_revision = 'aaa111'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'employees',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.Unicode(length=200), nullable=True),
+        sa.Column('company_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['company_id'], ['companies.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade():
+    op.drop_table('employees')
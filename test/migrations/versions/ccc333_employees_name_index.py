@@ -0,0 +1,21 @@
+"""Employees name index
+
+Revision ID: ccc333
+Revises: bbb222
+
+"""
+from alembic import op
+
+
+revision = 'ccc333'
+down_revision = 'bbb222'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_employees_name', 'employees', ['name'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_employees_name', table_name='employees')
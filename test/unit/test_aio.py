@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from alembicverify import util
+from alembicverify.aio import (
+    get_current_revision,
+    get_head_revision,
+    prepare_schema_from_migrations,
+)
+from alembicverify.util import make_alembic_config
+
+from test import alembic_root
+
+
+@pytest.yield_fixture(autouse=True)
+def clear_scripts():
+    yield
+    util._scripts.clear()
+
+
+def make_uri(tmpdir, name):
+    return 'sqlite+aiosqlite:///{}'.format(tmpdir.join(name))
+
+
+def test_prepare_schema_from_migrations(tmpdir):
+    uri = make_uri(tmpdir, 'db.sqlite')
+    config = make_alembic_config(uri, alembic_root)
+
+    async def run():
+        engine, script = await prepare_schema_from_migrations(uri, config)
+        try:
+            current = await get_current_revision(config, engine, script)
+            head = await get_head_revision(config, engine, script)
+        finally:
+            await engine.dispose()
+        return current, head
+
+    assert ('ccc333', 'ccc333') == asyncio.run(run())
+    assert 'connection' not in config.attributes
+
+
+def test_prepare_schema_from_migrations_revision(tmpdir):
+    uri = make_uri(tmpdir, 'db.sqlite')
+    config = make_alembic_config(uri, alembic_root)
+    config.attributes['connection'] = 'previous'
+
+    async def run():
+        engine, script = await prepare_schema_from_migrations(
+            uri, config, revision='aaa111')
+        try:
+            return await get_current_revision(config, engine, script)
+        finally:
+            await engine.dispose()
+
+    assert 'aaa111' == asyncio.run(run())
+    assert 'previous' == config.attributes['connection']
+
+
+def test_gather(tmpdir):
+    uris = [make_uri(tmpdir, 'db{}.sqlite'.format(i)) for i in range(3)]
+    revisions = ['aaa111', 'bbb222', 'head']
+
+    async def prepare(uri, revision):
+        config = make_alembic_config(uri, alembic_root)
+        engine, script = await prepare_schema_from_migrations(
+            uri, config, revision=revision)
+        return config, engine, script
+
+    async def run():
+        prepared = await asyncio.gather(*[
+            prepare(uri, revision) for uri, revision in zip(uris, revisions)])
+        try:
+            return await asyncio.gather(*[
+                get_current_revision(*args) for args in prepared])
+        finally:
+            for _, engine, _ in prepared:
+                await engine.dispose()
+
+    assert ['aaa111', 'bbb222', 'ccc333'] == asyncio.run(run())
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+from alembic.util import CommandError
+from mock import patch
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine
+
+from alembicverify import bisection, util
+from alembicverify.bisection import (
+    Divergence,
+    bisect_revisions,
+    is_prefix_compatible,
+)
+from alembicverify.util import dispose_engines, make_alembic_config
+
+from test import alembic_root, make_metadata
+
+
+TRANSIENT_REVISIONS = [
+    ('r1', None, "op.create_table('a', sa.Column('id', sa.Integer()))"),
+    ('r2', 'r1', "op.create_table('tmp', sa.Column('id', sa.Integer()))"),
+    ('r3', 'r2', "op.drop_table('tmp')"),
+]
+
+
+CREATE_REVISIONS = [
+    ('r1', None, "op.create_table('a', sa.Column('id', sa.Integer()))"),
+    ('r2', 'r1', "op.create_table('b', sa.Column('id', sa.Integer()))"),
+    ('r3', 'r2', "op.create_table('c', sa.Column('id', sa.Integer()))"),
+    ('r4', 'r3', "op.create_table('d', sa.Column('id', sa.Integer()))"),
+]
+
+
+REVISION = '''
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = {revision!r}
+down_revision = {down_revision!r}
+
+
+def upgrade():
+    {operation}
+
+
+def downgrade():
+    pass
+'''
+
+
+@pytest.yield_fixture
+def uri(tmpdir):
+    yield 'sqlite:///{}'.format(tmpdir.join('bisect.db'))
+    dispose_engines()
+    util._scripts.clear()
+
+
+@pytest.fixture
+def config(uri):
+    return make_alembic_config(uri, alembic_root)
+
+
+def test_bisect_revisions_match(uri, config):
+    assert bisect_revisions(uri, config, make_metadata()) is None
+
+
+def test_bisect_revisions_first_divergence(uri, config):
+    metadata = make_metadata()
+    metadata.tables['employees'].c.name.nullable = False
+
+    divergence = bisect_revisions(uri, config, metadata)
+
+    assert isinstance(divergence, Divergence)
+    assert 'bbb222' == divergence.revision
+    assert 'aaa111' == divergence.previous
+    assert 3 == divergence.probes
+    assert [{
+        'key': 'name',
+        'left': {'nullable': True},
+        'right': {'nullable': False},
+    }] == divergence.result.errors['tables_data']['employees']['columns'][
+        'diff']
+
+
+def test_bisect_revisions_divergence_at_base(uri, config):
+    metadata = make_metadata()
+    metadata.tables['companies'].append_column(Column('size', Integer))
+    metadata.tables['companies'].c.name.nullable = True
+
+    divergence = bisect_revisions(uri, config, metadata)
+
+    assert 'aaa111' == divergence.revision
+    assert divergence.previous is None
+
+
+def test_bisect_revisions_head_must_match(uri, config):
+    metadata = make_metadata()
+    metadata.tables['employees'].append_column(Column('age', Integer))
+
+    divergence = bisect_revisions(uri, config, metadata)
+
+    assert 'ccc333' == divergence.revision
+    assert 'bbb222' == divergence.previous
+
+
+def make_linear_config(uri, tmpdir, revisions):
+    root = tmpdir.mkdir('migrations')
+    root.join('env.py').write(
+        open(os.path.join(alembic_root, 'env.py')).read())
+    versions = root.mkdir('versions')
+    for revision, down_revision, operation in revisions:
+        versions.join('{}.py'.format(revision)).write(
+            REVISION.format(
+                revision=revision, down_revision=down_revision,
+                operation=operation))
+    return make_alembic_config(uri, str(root))
+
+
+def make_tables_metadata(*names):
+    metadata = MetaData()
+    for name in names:
+        Table(name, metadata, Column('id', Integer))
+    return metadata
+
+
+def test_bisect_revisions_transient_table(uri, tmpdir):
+    config = make_linear_config(uri, tmpdir, TRANSIENT_REVISIONS)
+    metadata = make_tables_metadata('a')
+
+    # The table only exists in the middle revision: the head matches.
+    assert bisect_revisions(uri, config, metadata) is None
+
+
+def test_bisect_revisions_moves_forward(uri, tmpdir):
+    config = make_linear_config(uri, tmpdir, CREATE_REVISIONS)
+    metadata = make_tables_metadata('a', 'b', 'c')
+
+    divergence = bisect_revisions(uri, config, metadata)
+
+    assert 'r4' == divergence.revision
+    assert 'r3' == divergence.previous
+    assert 3 == divergence.probes
+
+
+def test_bisect_revisions_given_connection(uri, config):
+    engine = create_engine(uri)
+    try:
+        with engine.connect() as conn:
+            config.attributes['connection'] = conn
+            with patch.object(bisection, 'get_connection') as get_connection:
+                assert bisect_revisions(uri, config, make_metadata()) is None
+    finally:
+        engine.dispose()
+
+    assert not get_connection.called
+
+
+def test_bisect_revisions_ignores(uri, config):
+    metadata = make_metadata()
+    metadata.tables['employees'].c.name.nullable = False
+
+    assert bisect_revisions(
+        uri, config, metadata, ignores=['employees']) is None
+
+
+def test_bisect_revisions_reuses_snapshots(uri, config, tmpdir):
+    snapshot_dir = str(tmpdir.join('snapshots'))
+    config.attributes['snapshot_dir'] = snapshot_dir
+    bisect_revisions(uri, config, make_metadata())
+    assert 1 == len(os.listdir(snapshot_dir))
+
+    dispose_engines()
+    os.remove(str(tmpdir.join('bisect.db')))
+    config = make_alembic_config(uri, alembic_root)
+    config.attributes['snapshot_dir'] = snapshot_dir
+
+    with patch.object(
+            bisection, 'migrate', wraps=bisection.migrate) as migrate:
+        assert bisect_revisions(uri, config, make_metadata()) is None
+
+    # The head is restored, nothing is migrated.
+    assert not migrate.called
+    assert 1 == len(os.listdir(snapshot_dir))
+
+
+def test_bisect_revisions_reuses_snapshots_on_divergence(
+        uri, config, tmpdir):
+    metadata = make_metadata()
+    metadata.tables['employees'].c.name.nullable = False
+    config.attributes['snapshot_dir'] = str(tmpdir.join('snapshots'))
+    first = bisect_revisions(uri, config, metadata)
+
+    with patch.object(
+            bisection, 'migrate', wraps=bisection.migrate) as migrate:
+        second = bisect_revisions(uri, config, metadata)
+
+    assert not migrate.called
+    assert first.revision == second.revision == 'bbb222'
+    assert 3 == len(tmpdir.join('snapshots').listdir())
+
+
+def test_bisect_revisions_uses_temporary_snapshots(uri, config, tmpdir):
+    with patch.object(bisection.tempfile, 'mkdtemp') as mkdtemp:
+        mkdtemp.return_value = str(tmpdir.mkdir('temp'))
+        bisect_revisions(uri, config, make_metadata())
+
+    assert not tmpdir.join('temp').check()
+
+
+def test_bisect_revisions_multiple_heads(uri, config):
+    with patch.object(bisection, 'load_script_directory') as load_script:
+        load_script.return_value.get_current_head.side_effect = (
+            CommandError('multiple heads'))
+
+        with pytest.raises(CommandError):
+            bisect_revisions(uri, config, make_metadata())
+
+
+@pytest.mark.parametrize('errors', [
+    {},
+    {'tables': {'right_only': ['companies']}},
+    {'tables_data': {'employees': {'columns': {'right_only': [{}]}}},
+     'uris': {'left': 'uri', 'right': None}},
+])
+def test_is_prefix_compatible(errors):
+    assert is_prefix_compatible(errors)
+
+
+@pytest.mark.parametrize('errors', [
+    {'tables': {'left_only': ['companies']}},
+    {'tables_data': {'employees': {'columns': {'diff': [{}]}}}},
+    {'tables_data': {'employees': {'indexes': {'right_only': [{}],
+                                               'left_only': [{}]}}}},
+    {'other': ['diff']},
+])
+def test_is_not_prefix_compatible(errors):
+    assert not is_prefix_compatible(errors)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+
+import pytest
+from mock import patch
+from sqlalchemy import Column, Integer, MetaData, Table
+
+from alembicverify import branches, util
+from alembicverify.branches import BranchResult, HeadsReport, verify_heads
+from alembicverify.util import make_alembic_config
+
+from test import alembic_root as migrations_root, make_metadata, STOCK_ENV
+
+
+AUDIT_REVISION = '''
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'xxx999'
+down_revision = None
+branch_labels = ('audit', )
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'audit_log', sa.Column('id', sa.Integer(), primary_key=True))
+
+
+def downgrade():
+    op.drop_table('audit_log')
+'''
+
+
+@pytest.yield_fixture
+def alembic_root(tmpdir):
+    root = str(tmpdir.join('migrations'))
+    shutil.copytree(
+        migrations_root, root, ignore=shutil.ignore_patterns('__pycache__'))
+    with open(os.path.join(root, 'versions', 'xxx999_audit.py'), 'w') as f:
+        f.write(AUDIT_REVISION)
+    yield root
+    util._scripts.clear()
+
+
+@pytest.fixture
+def uri(tmpdir):
+    return 'sqlite:///{}'.format(tmpdir.join('db.sqlite'))
+
+
+@pytest.fixture
+def config(uri, alembic_root):
+    return make_alembic_config(uri, alembic_root)
+
+
+def make_audit_metadata():
+    metadata = MetaData()
+    Table('audit_log', metadata, Column('id', Integer, primary_key=True))
+    return metadata
+
+
+@pytest.mark.parametrize('processes', [False, True])
+def test_verify_heads(uri, config, tmpdir, processes):
+    metadata = {'ccc333': make_metadata(), 'audit': make_audit_metadata()}
+
+    report = verify_heads(uri, config, metadata, processes=processes)
+
+    assert isinstance(report, HeadsReport)
+    assert [('ccc333', ()), ('xxx999', ('audit', ))] == [
+        (result.head, result.branch_labels) for result in report.results]
+    assert report.is_match
+    assert {} == report.errors
+    # The temporary databases are destroyed.
+    assert [] == tmpdir.listdir(lambda path: path.basename != 'migrations')
+
+
+def test_verify_heads_shared_metadata(uri, config):
+    report = verify_heads(uri, config, make_metadata(), processes=False)
+
+    assert not report.is_match
+    assert ['xxx999'] == list(report.errors)
+    assert {
+        'left_only': ['audit_log'],
+        'right_only': ['companies', 'employees'],
+    } == {
+        key: sorted(value)
+        for key, value in report.errors['xxx999']['tables'].items()
+    }
+
+
+def test_verify_heads_ignores(uri, config):
+    metadata = make_metadata()
+    Table('legacy', metadata, Column('id', Integer, primary_key=True))
+
+    report = verify_heads(
+        uri, config, {'ccc333': metadata, 'xxx999': make_audit_metadata()},
+        processes=False, ignores=['legacy'])
+
+    assert report.is_match
+
+
+def test_verify_heads_env_py_ignoring_connection(
+        uri, config, alembic_root, tmpdir):
+    with open(os.path.join(alembic_root, 'env.py'), 'w') as stream:
+        stream.write(STOCK_ENV)
+    metadata = {'ccc333': make_metadata(), 'audit': make_audit_metadata()}
+
+    report = verify_heads(uri, config, metadata, processes=False)
+
+    assert report.is_match, report.errors
+    # The migrations ran in the temporary databases only.
+    assert ['migrations'] == [path.basename for path in tmpdir.listdir()]
+
+
+def test_verify_heads_missing_metadata(uri, config):
+    with pytest.raises(KeyError):
+        verify_heads(uri, config, {'audit': make_audit_metadata()})
+
+
+@patch.object(branches, 'prepare_schema_from_migrations')
+def test_verify_heads_error(prepare_schema, uri, config):
+    prepare_schema.side_effect = ValueError('broken')
+
+    report = verify_heads(
+        uri, config, make_audit_metadata(), processes=False)
+
+    assert not report.is_match
+    assert [
+        BranchResult('ccc333', (), None, 'ValueError: broken'),
+        BranchResult('xxx999', ('audit', ), None, 'ValueError: broken'),
+    ] == report.results
+    assert {
+        'ccc333': 'ValueError: broken',
+        'xxx999': 'ValueError: broken',
+    } == report.errors
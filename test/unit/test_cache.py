@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+from mock import ANY, Mock, patch
+from sqlalchemy import (
+    Column, Integer, MetaData, String, Table, create_engine, inspect,
+    text)
+from sqlalchemy.dialects import postgresql
+
+from alembicverify.cache import (
+    get_migration_folders,
+    get_snapshot_path,
+    hash_migration_files,
+    load_snapshot,
+    open_atomically,
+    reset_sequences,
+    save_snapshot,
+)
+
+
+@pytest.fixture
+def migrations(tmpdir):
+    tmpdir.join('env.py').write('env')
+    versions = tmpdir.mkdir('versions')
+    versions.join('1_first.py').write('first')
+    versions.join('README').write('not hashed')
+    versions.mkdir('__pycache__').join('1_first.py').write('cached')
+    return tmpdir
+
+
+@pytest.fixture
+def script(migrations):
+    return Mock(dir=str(migrations), version_locations=None)
+
+
+def test_hash_migration_files_is_stable(migrations):
+    folders = [str(migrations)]
+
+    assert hash_migration_files(folders) == hash_migration_files(folders)
+
+
+def test_hash_migration_files_ignores_non_python_files(migrations):
+    digest = hash_migration_files([str(migrations)])
+
+    migrations.join('versions', 'README').write('changed')
+    migrations.join('versions', '__pycache__', '1_first.py').write('new')
+
+    assert digest == hash_migration_files([str(migrations)])
+
+
+def test_hash_migration_files_changes_with_content(migrations):
+    digest = hash_migration_files([str(migrations)])
+
+    migrations.join('versions', '1_first.py').write('edited')
+
+    assert digest != hash_migration_files([str(migrations)])
+
+
+def test_hash_migration_files_changes_with_new_files(migrations):
+    digest = hash_migration_files([str(migrations)])
+
+    migrations.join('versions', '2_second.py').write('second')
+
+    assert digest != hash_migration_files([str(migrations)])
+
+
+def test_get_migration_folders(script, tmpdir):
+    other = tmpdir.mkdir('other')
+    script.version_locations = [str(other), str(other), 'missing']
+
+    assert [script.dir, str(other)] == get_migration_folders(script)
+
+
+def test_get_migration_folders_no_version_locations(script):
+    assert [script.dir] == get_migration_folders(script)
+
+
+def test_get_snapshot_path(script):
+    path = get_snapshot_path('snapshots', script, 'head', 'sqlite')
+
+    assert 'snapshots' == os.path.dirname(path)
+    assert path.endswith('.snapshot')
+    assert path == get_snapshot_path('snapshots', script, 'head', 'sqlite')
+    assert path != get_snapshot_path('snapshots', script, '+1', 'sqlite')
+    assert path != get_snapshot_path('snapshots', script, 'head', 'mysql')
+
+
+def _make_schema(engine, revision):
+    metadata = MetaData()
+    employees = Table('employees', metadata,
+                      Column('id', Integer, primary_key=True),
+                      Column('name', String(50), nullable=False))
+    version = Table('alembic_version', metadata,
+                    Column('version_num', String(32), nullable=False))
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        # Like data written by a migration.
+        conn.execute(employees.insert(), [{'id': 1, 'name': 'admin'}])
+        if revision is not None:
+            conn.execute(version.insert(), [{'version_num': revision}])
+
+
+def _get_version_rows(engine):
+    with engine.connect() as conn:
+        return [
+            tuple(row) for row in
+            conn.execute(Table(
+                'alembic_version', MetaData(),
+                Column('version_num', String(32))).select())
+        ]
+
+
+@pytest.mark.parametrize('revision', ['abc123', None])
+def test_save_and_load_snapshot(tmpdir, revision):
+    source = create_engine('sqlite:///{}'.format(tmpdir.join('source.db')))
+    target = create_engine('sqlite:///{}'.format(tmpdir.join('target.db')))
+    _make_schema(source, revision)
+    path = str(tmpdir.join('snapshots', 'schema.snapshot'))
+
+    save_snapshot(source, path)
+    load_snapshot(target, path)
+
+    assert os.path.exists(path)
+    assert sorted(inspect(source).get_table_names()) == sorted(
+        inspect(target).get_table_names())
+    assert inspect(source).get_columns('employees')[1]['name'] == 'name'
+    assert _get_version_rows(source) == _get_version_rows(target)
+    with target.connect() as conn:
+        assert [(1, 'admin')] == [
+            tuple(row) for row in
+            conn.execute(text('SELECT id, name FROM employees'))]
+
+
+def test_save_and_load_snapshot_in_transaction(tmpdir):
+    source = create_engine('sqlite:///{}'.format(tmpdir.join('source.db')))
+    target = create_engine('sqlite:///{}'.format(tmpdir.join('target.db')))
+    _make_schema(source, None)
+    path = str(tmpdir.join('schema.snapshot'))
+
+    with source.connect() as conn:
+        with conn.begin() as transaction:
+            conn.execute(text("INSERT INTO employees VALUES (2, 'new')"))
+            # The row is not committed, only the connection sees it.
+            save_snapshot(conn, path)
+            transaction.rollback()
+
+    with target.connect() as conn:
+        with conn.begin():
+            load_snapshot(conn, path)
+            assert 2 == conn.execute(
+                text('SELECT COUNT(*) FROM employees')).scalar()
+
+
+@patch('alembicverify.cache.reset_sequences')
+def test_load_snapshot_postgresql(reset_sequences, tmpdir):
+    source = create_engine('sqlite:///{}'.format(tmpdir.join('source.db')))
+    _make_schema(source, None)
+    path = str(tmpdir.join('schema.snapshot'))
+    save_snapshot(source, path)
+    conn = Mock(dialect=postgresql.dialect())
+
+    load_snapshot(conn, path)
+
+    # Only the employees table has rows, the version table is empty.
+    reset_sequences.assert_called_once_with(conn, [ANY])
+    assert 'employees' == reset_sequences.call_args[0][1][0].name
+
+
+def test_reset_sequences():
+    metadata = MetaData()
+    Table('employees', metadata, Column('id', Integer, primary_key=True),
+          Column('name', String(20)), Column('rank', Integer))
+    conn = Mock(dialect=postgresql.dialect())
+    conn.execute.return_value.scalar.side_effect = ['employees_id_seq', None]
+
+    reset_sequences(conn, metadata.sorted_tables)
+
+    statements = [
+        (str(args[0]), args[1]) for args, _ in conn.execute.call_args_list]
+    assert [
+        ('SELECT pg_get_serial_sequence(:table, :column)',
+         {'table': 'employees', 'column': 'id'}),
+        ('SELECT setval(:sequence, COALESCE(MAX(id), 1), '
+         'MAX(id) IS NOT NULL) FROM employees',
+         {'sequence': 'employees_id_seq'}),
+        ('SELECT pg_get_serial_sequence(:table, :column)',
+         {'table': 'employees', 'column': 'rank'}),
+    ] == statements
+
+
+def test_save_snapshot_without_version_table(tmpdir):
+    source = create_engine('sqlite:///{}'.format(tmpdir.join('source.db')))
+    target = create_engine('sqlite:///{}'.format(tmpdir.join('target.db')))
+    path = str(tmpdir.join('schema.snapshot'))
+
+    save_snapshot(source, path)
+    load_snapshot(target, path)
+
+    assert [] == inspect(target).get_table_names()
+
+
+def test_open_atomically(tmpdir):
+    path = str(tmpdir.join('folder', 'file.json'))
+
+    with open_atomically(path) as stream:
+        stream.write('content')
+        assert not os.path.exists(path)
+
+    assert 'content' == tmpdir.join('folder', 'file.json').read()
+    assert ['file.json'] == os.listdir(str(tmpdir.join('folder')))
+
+
+def test_open_atomically_error(tmpdir):
+    tmpdir.join('file.json').write('old')
+
+    with pytest.raises(ValueError):
+        with open_atomically(str(tmpdir.join('file.json'))) as stream:
+            stream.write('new')
+            raise ValueError('boom')
+
+    assert 'old' == tmpdir.join('file.json').read()
+    assert ['file.json'] == os.listdir(str(tmpdir))
+
+
+def test_open_atomically_open_error(tmpdir):
+    with patch('alembicverify.cache.open', create=True, side_effect=IOError):
+        with pytest.raises(IOError):
+            with open_atomically(str(tmpdir.join('file.json'))):
+                pass
+
+    assert [] == tmpdir.listdir()
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import runpy
+import shutil
+
+import pytest
+from mock import patch
+from sqlalchemy import Column, Integer, MetaData, Table
+from sqlalchemy.ext.declarative import declarative_base
+
+from alembicverify import cli, util
+from alembicverify.cli import check_upgrade, load_metadata, main
+from alembicverify.util import make_alembic_config
+
+from test import STOCK_ENV, alembic_root, make_metadata
+
+
+metadata = make_metadata()
+
+Base = declarative_base(metadata=metadata)
+
+wrong_metadata = MetaData()
+Table('roles', wrong_metadata, Column('id', Integer, primary_key=True))
+
+
+@pytest.yield_fixture
+def uri(tmpdir):
+    yield 'sqlite:///{}'.format(tmpdir.join('cli.db'))
+    util._scripts.clear()
+
+
+def run_main(args, capsys):
+    status = main(args)
+    return status, json.loads(capsys.readouterr()[0])
+
+
+@pytest.mark.parametrize('jobs', ['1', '3'])
+def test_main(uri, tmpdir, capsys, jobs):
+    status, report = run_main([
+        '--script-location', alembic_root,
+        '--uri', uri,
+        '--models', 'test.unit.test_cli:metadata',
+        '--jobs', jobs,
+    ], capsys)
+
+    assert 0 == status
+    assert report['passed']
+    assert ['models', 'round-trip', 'upgrade'] == sorted(report['checks'])
+    for result in report['checks'].values():
+        assert result['passed']
+        assert {} == result['errors']
+        assert result['duration'] >= 0
+    # The temporary databases are destroyed.
+    assert [] == tmpdir.listdir()
+
+
+def test_main_as_script(uri, tmpdir):
+    output = str(tmpdir.join('results.json'))
+    argv = [
+        cli.__file__,
+        '--script-location', alembic_root,
+        '--uri', uri,
+        '--models', 'test.unit.test_cli:wrong_metadata',
+        '--check', 'models',
+        '--output', output,
+    ]
+
+    with patch('sys.argv', argv):
+        with pytest.raises(SystemExit) as exc_info:
+            runpy.run_path(cli.__file__, run_name='__main__')
+
+    assert 1 == exc_info.value.code
+    with open(output) as stream:
+        assert not json.load(stream)['passed']
+
+
+def test_main_failed_check(uri, tmpdir):
+    output = str(tmpdir.join('results.json'))
+
+    status = main([
+        '--script-location', alembic_root,
+        '--uri', uri,
+        '--models', 'test.unit.test_cli:wrong_metadata',
+        '--ignore', 'companies',
+        '--check', 'models',
+        '--output', output,
+    ])
+
+    assert 1 == status
+    with open(output) as stream:
+        report = json.load(stream)
+    assert not report['passed']
+    assert ['models'] == list(report['checks'])
+    errors = report['checks']['models']['errors']
+    assert {'left_only': ['employees'], 'right_only': ['roles']} == (
+        errors['tables'])
+
+
+def test_main_error(uri, tmpdir, capsys):
+    status, report = run_main([
+        '--script-location', str(tmpdir.join('missing')),
+        '--uri', uri,
+        '--check', 'upgrade',
+    ], capsys)
+
+    assert 1 == status
+    result = report['checks']['upgrade']
+    assert not result['passed']
+    assert result['error'].startswith('CommandError: ')
+
+
+def test_main_models_needed(uri):
+    with pytest.raises(SystemExit) as exc_info:
+        main(['--script-location', alembic_root, '--uri', uri])
+
+    assert 2 == exc_info.value.code
+
+
+@patch.object(cli, 'read_database_revisions')
+def test_check_upgrade_wrong_revision(read_revisions, uri):
+    read_revisions.return_value.revisions = None
+
+    errors = check_upgrade(
+        uri, make_alembic_config(uri, alembic_root), None, [])
+
+    assert {'current': [], 'heads': ['ccc333']} == errors
+    util.dispose_engines()
+
+
+@pytest.mark.parametrize('path', [
+    'test.unit.test_cli:metadata',
+    'test.unit.test_cli:Base',
+])
+def test_load_metadata(path):
+    assert ['companies', 'employees'] == sorted(load_metadata(path).tables)
+
+
+def test_load_metadata_nested_attribute():
+    loaded = load_metadata('test.unit.test_cli:wrong_metadata.tables')
+
+    assert ['roles'] == list(loaded)
+
+
+def test_main_verdict_cache(uri, tmpdir, capsys):
+    args = [
+        '--script-location', alembic_root,
+        '--uri', uri,
+        '--models', 'test.unit.test_cli:wrong_metadata',
+        '--cache-dir', str(tmpdir.join('verdicts')),
+    ]
+    status, report = run_main(args, capsys)
+    assert 1 == status
+    assert [False, False, False] == [
+        result['cached'] for result in report['checks'].values()]
+    assert 3 == len(tmpdir.join('verdicts').listdir())
+
+    with patch.object(cli, '_run_check') as run_check:
+        status, cached_report = run_main(args, capsys)
+    assert not run_check.called
+
+    assert 1 == status
+    for check, result in cached_report['checks'].items():
+        assert result['cached']
+        assert 0.0 == result['duration']
+        assert report['checks'][check]['passed'] == result['passed']
+        assert report['checks'][check]['errors'] == result['errors']
+
+    status, report = run_main(args + ['--force', '--jobs', '2'], capsys)
+    assert 1 == status
+    assert [False, False, False] == [
+        result['cached'] for result in report['checks'].values()]
+
+
+def test_main_verdict_cache_skips_errors(uri, tmpdir, capsys):
+    status, report = run_main([
+        '--script-location', alembic_root,
+        '--uri', 'sqlite:///{}'.format(tmpdir.join('no', 'such', 'db')),
+        '--check', 'upgrade',
+        '--cache-dir', str(tmpdir.join('verdicts')),
+    ], capsys)
+
+    assert 1 == status
+    assert 'error' in report['checks']['upgrade']
+    assert not tmpdir.join('verdicts').check()
+
+
+def test_main_env_py_ignoring_connection(uri, tmpdir, capsys):
+    root = str(tmpdir.join('migrations'))
+    shutil.copytree(
+        alembic_root, root, ignore=shutil.ignore_patterns('__pycache__'))
+    with open(os.path.join(root, 'env.py'), 'w') as stream:
+        stream.write(STOCK_ENV)
+
+    status, report = run_main([
+        '--script-location', root,
+        '--uri', uri,
+        '--models', 'test.unit.test_cli:metadata',
+    ], capsys)
+
+    assert 0 == status
+    assert report['passed']
+    # The migrations ran in the temporary databases only.
+    assert ['migrations'] == [path.basename for path in tmpdir.listdir()]
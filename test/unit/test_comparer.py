@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+import pytest
+from sqlalchemy import (
+    Column, DefaultClause, ForeignKeyConstraint, Index, Integer, MetaData,
+    String, Table, UniqueConstraint, create_engine, text)
+
+from alembicverify import util
+from alembicverify.comparer import compare_to_metadata, get_errors
+from alembicverify.util import (
+    dispose_engines,
+    make_alembic_config,
+    prepare_schema_from_migrations,
+)
+
+from test import alembic_root, make_metadata
+
+
+@pytest.yield_fixture
+def uri(tmpdir):
+    uri = 'sqlite:///{}'.format(tmpdir.join('db.sqlite'))
+    prepare_schema_from_migrations(uri, make_alembic_config(uri, alembic_root))
+    yield uri
+    dispose_engines()
+
+
+def test_compare_to_metadata_match(uri):
+    result = compare_to_metadata(uri, make_metadata())
+
+    assert result.is_match
+    assert {} == result.errors
+    assert {'uris': {'left': uri, 'right': None}, 'diffs': []} == result.info
+
+
+def test_compare_to_metadata_differences(uri):
+    metadata = make_metadata()
+    employees = metadata.tables['employees']
+    metadata.remove(metadata.tables['companies'])
+    employees.append_column(Column('age', Integer, nullable=False))
+    employees.c.name.nullable = False
+    Table('roles', metadata, Column('id', Integer, primary_key=True))
+
+    result = compare_to_metadata(uri, metadata)
+
+    assert not result.is_match
+    errors = result.errors
+    assert {'left_only': ['companies'], 'right_only': ['roles']} == (
+        errors['tables'])
+    assert {
+        'right_only': [{
+            'name': 'age',
+            'type': 'INTEGER',
+            'nullable': False,
+            'default': None,
+        }],
+        'diff': [{
+            'key': 'name',
+            'left': {'nullable': True},
+            'right': {'nullable': False},
+        }],
+    } == errors['tables_data']['employees']['columns']
+    assert {'left': uri, 'right': None} == errors['uris']
+    assert 4 == len(result.info['diffs'])
+
+
+def test_compare_to_metadata_ignores(uri):
+    metadata = make_metadata()
+    metadata.remove(metadata.tables['companies'])
+
+    result = compare_to_metadata(
+        uri, metadata, ignores=['companies'], connection=util.get_connection(
+            uri))
+
+    assert result.is_match
+
+
+def test_compare_to_metadata_type_differences(uri):
+    metadata = make_metadata()
+    metadata.tables['companies'].c.name.type = String(10)
+
+    assert not compare_to_metadata(uri, metadata).is_match
+    assert compare_to_metadata(uri, metadata, compare_type=False).is_match
+
+
+def test_get_errors_indexes_foreign_keys_and_constraints():
+    metadata = MetaData()
+    other = Table('other', metadata, Column('id', Integer, primary_key=True))
+    fk = ForeignKeyConstraint(['other_id'], ['other.id'], name='fk_other')
+    unique = UniqueConstraint('other_id', name='uq')
+    table = Table('table', metadata,
+                  Column('id', Integer, primary_key=True),
+                  Column('other_id', Integer), fk, unique)
+    index = Index('ix', table.c.other_id)
+    dialect = create_engine('sqlite://').dialect
+
+    errors = get_errors([
+        ('add_index', index),
+        ('remove_fk', fk),
+        ('add_constraint', unique),
+        ('remove_table_comment', other),
+        [('modify_type', None, 'table', 'id', {}, Integer(), String(5)),
+         ('modify_default', None, 'table', 'other_id', {},
+          None, DefaultClause(text("'1'")))],
+    ], dialect)
+
+    table_errors = errors['tables_data']['table']
+    assert {'right_only': [{
+        'name': 'ix', 'column_names': ['other_id'], 'unique': False,
+    }]} == table_errors['indexes']
+    assert {'left_only': [{
+        'name': 'fk_other',
+        'constrained_columns': ['other_id'],
+        'referred_table': 'other',
+        'referred_columns': ['id'],
+    }]} == table_errors['foreign_keys']
+    assert {'right_only': [{
+        'name': 'uq', 'column_names': ['other_id'],
+    }]} == table_errors['unique_constraints']
+    assert [
+        {'key': 'id', 'left': {'type': 'INTEGER'},
+         'right': {'type': 'VARCHAR(5)'}},
+        {'key': 'other_id', 'left': {'default': None},
+         'right': {'default': "'1'"}},
+    ] == table_errors['columns']['diff']
+    assert [repr(('remove_table_comment', other))] == errors['other']
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+from mock import Mock, call, patch
+from sqlalchemy import (
+    Column, ForeignKey, Integer, MetaData, Table, create_engine, inspect, text)
+
+from alembicverify.database import (
+    clone_database,
+    create_schema,
+    drop_schema,
+    get_database_name,
+    get_server_uri,
+    get_table_rows,
+    get_temporary_uri,
+    get_worker_uri,
+    rename_database,
+    replace_database_name,
+    supports_renaming,
+    supports_transactional_ddl,
+    truncate_tables,
+)
+
+
+@pytest.yield_fixture
+def create_engine_mock():
+    with patch('alembicverify.database.create_engine') as m:
+        yield m
+
+
+@pytest.yield_fixture
+def destroy_database_mock():
+    with patch('alembicverify.database.destroy_database') as m:
+        yield m
+
+
+def _executed_sql(engine):
+    conn = engine.connect.return_value.__enter__.return_value
+    return [str(c[0][0]) for c in conn.execute.call_args_list]
+
+
+def test_get_database_name():
+    assert 'name' == get_database_name('postgresql://user@host:5432/name')
+
+
+@pytest.mark.parametrize('uri,expected', [
+    ('mysql://root@localhost/name', 'mysql://root@localhost/other'),
+    ('mysql://root@localhost/name?charset=utf8',
+     'mysql://root@localhost/other?charset=utf8'),
+    ('postgresql://user:secret@/name?host=/var/run/postgresql',
+     'postgresql://user:secret@/other?host=%2Fvar%2Frun%2Fpostgresql'),
+    ('sqlite:////tmp/left.db', 'sqlite:///other'),
+])
+def test_replace_database_name(uri, expected):
+    assert expected == replace_database_name(uri, 'other')
+
+
+@patch('alembicverify.database.make_url')
+def test_replace_database_name_mutable_url(make_url):
+    # Before SQLAlchemy 1.4, URLs have no ``set`` method.
+    url = make_url.return_value = Mock(spec=['database'])
+
+    replace_database_name('mysql://root@localhost/name', 'other')
+
+    assert 'other' == url.database
+
+
+@pytest.mark.parametrize('uri,expected', [
+    ('mysql://root@localhost/name?charset=utf8',
+     'mysql://root@localhost/?charset=utf8'),
+    ('postgresql://user@/name?host=/var/run/postgresql',
+     'postgresql://user@/?host=%2Fvar%2Frun%2Fpostgresql'),
+    ('sqlite:////tmp/left.db', 'sqlite:////tmp'),
+    ('sqlite://', 'sqlite:///'),
+])
+def test_get_server_uri(uri, expected):
+    assert expected == get_server_uri(uri)
+
+
+@pytest.mark.parametrize('uri', [
+    'postgresql://user@/name?host=/var/run/postgresql',
+    'sqlite:////tmp/left.db',
+])
+def test_get_temporary_uri(uri):
+    temp_uri = get_temporary_uri(uri)
+
+    assert get_server_uri(uri) == get_server_uri(temp_uri)
+    assert os.path.basename(get_database_name(temp_uri)).startswith('temp_')
+    assert temp_uri != get_temporary_uri(uri)
+
+
+@pytest.mark.parametrize('uri,expected', [
+    ('postgresql://user@host/name', 'postgresql://user@host/name_gw1'),
+    ('mysql://root@localhost/name?charset=utf8',
+     'mysql://root@localhost/name_gw1?charset=utf8'),
+    ('sqlite:////tmp/left.db', 'sqlite:////tmp/left_gw1.db'),
+    ('postgresql://user@/name?host=/var/run/postgresql',
+     'postgresql://user@/name_gw1?host=%2Fvar%2Frun%2Fpostgresql'),
+    ('sqlite://', 'sqlite://'),
+])
+def test_get_worker_uri(uri, expected):
+    assert expected == get_worker_uri(uri, 'gw1')
+
+
+def test_get_worker_uri_without_worker():
+    uri = 'postgresql://user@host/name'
+
+    assert uri == get_worker_uri(uri, None)
+
+
+def test_rename_sqlite(tmpdir):
+    uri = 'sqlite:///{}'.format(tmpdir.join('pooled.db'))
+    new_uri = 'sqlite:///{}'.format(tmpdir.join('left.db'))
+    metadata = MetaData()
+    Table('employees', metadata, Column('id', Integer, primary_key=True))
+    metadata.create_all(create_engine(uri))
+
+    rename_database(uri, new_uri)
+
+    assert ['left.db'] == [path.basename for path in tmpdir.listdir()]
+    assert ['employees'] == inspect(create_engine(new_uri)).get_table_names()
+
+
+def test_rename_postgresql(create_engine_mock, destroy_database_mock):
+    engine = create_engine_mock.return_value
+    engine.dialect.identifier_preparer.quote.side_effect = '"{}"'.format
+
+    rename_database(
+        'postgresql://user@host/temp_1', 'postgresql://user@host/left')
+
+    destroy_database_mock.assert_called_once_with(
+        'postgresql://user@host/left')
+    create_engine_mock.assert_called_once_with(
+        'postgresql://user@host/postgres', isolation_level='AUTOCOMMIT')
+    assert ['ALTER DATABASE "temp_1" RENAME TO "left"'] == _executed_sql(
+        engine)
+    engine.dispose.assert_called_once_with()
+
+
+def test_rename_unsupported_backend(destroy_database_mock):
+    with pytest.raises(NotImplementedError):
+        rename_database('mysql://root@host/temp_1', 'mysql://root@host/left')
+
+    assert not destroy_database_mock.called
+
+
+@pytest.mark.parametrize('function,statement', [
+    (create_schema, 'CREATE SCHEMA "test_1"'),
+    (drop_schema, 'DROP SCHEMA "test_1" CASCADE'),
+])
+def test_schema_postgresql(create_engine_mock, function, statement):
+    engine = create_engine_mock.return_value
+    engine.dialect.identifier_preparer.quote.side_effect = '"{}"'.format
+
+    function('postgresql://user@host/name', 'test_1')
+
+    create_engine_mock.assert_called_once_with(
+        'postgresql://user@host/name', isolation_level='AUTOCOMMIT')
+    assert [statement] == _executed_sql(engine)
+    engine.dispose.assert_called_once_with()
+
+
+@pytest.mark.parametrize('function', [create_schema, drop_schema])
+def test_schema_unsupported_backend(create_engine_mock, function):
+    with pytest.raises(NotImplementedError):
+        function('mysql://root@localhost/name', 'test_1')
+
+    assert not create_engine_mock.called
+
+
+@pytest.mark.parametrize('uri,expected', [
+    ('postgresql://user@host/name', True),
+    ('postgresql+psycopg2://user@host/name', True),
+    ('mysql://root@localhost/name', False),
+    ('sqlite:///file.db', False),
+])
+def test_supports_transactional_ddl(uri, expected):
+    assert expected is supports_transactional_ddl(uri)
+
+
+@pytest.mark.parametrize('uri,expected', [
+    ('postgresql+psycopg2://user@host/name', True),
+    ('mysql://root@localhost/name', False),
+    ('sqlite:///file.db', True),
+])
+def test_supports_renaming(uri, expected):
+    assert expected is supports_renaming(uri)
+
+
+def test_clone_sqlite(tmpdir):
+    template_uri = 'sqlite:///{}'.format(tmpdir.join('template.db'))
+    uri = 'sqlite:///{}'.format(tmpdir.join('clone.db'))
+    metadata = MetaData()
+    Table('employees', metadata, Column('id', Integer, primary_key=True))
+    metadata.create_all(create_engine(template_uri))
+
+    clone_database(template_uri, uri)
+
+    assert ['employees'] == inspect(create_engine(uri)).get_table_names()
+
+
+def test_clone_postgresql(create_engine_mock, destroy_database_mock):
+    engine = create_engine_mock.return_value
+    engine.dialect.identifier_preparer.quote.side_effect = '"{}"'.format
+
+    clone_database(
+        'postgresql://user@host/template', 'postgresql://user@host/clone')
+
+    destroy_database_mock.assert_called_once_with(
+        'postgresql://user@host/clone')
+    create_engine_mock.assert_called_once_with(
+        'postgresql://user@host/postgres', isolation_level='AUTOCOMMIT')
+    assert ['CREATE DATABASE "clone" TEMPLATE "template"'] == _executed_sql(
+        engine)
+    engine.dispose.assert_called_once_with()
+
+
+def test_clone_mysql(create_engine_mock, destroy_database_mock):
+    engine = create_engine_mock.return_value
+    engine.dialect.identifier_preparer.quote.side_effect = '`{}`'.format
+    conn = engine.connect.return_value.__enter__.return_value
+    show_create = conn.execute.return_value
+    show_create.__iter__.return_value = [('roles', 'BASE TABLE')]
+    show_create.fetchone.return_value = (
+        'roles', "CREATE TABLE `roles` (`name` varchar(10) DEFAULT ':x')")
+
+    clone_database('mysql://root@host/template', 'mysql://root@host/clone')
+
+    create_engine_mock.assert_called_once_with('mysql://root@host/template')
+    assert [
+        'SHOW FULL TABLES',
+        'CREATE DATABASE `clone`',
+        'SET FOREIGN_KEY_CHECKS = 0',
+        'USE `clone`',
+        'SHOW CREATE TABLE `template`.`roles`',
+        "CREATE TABLE `roles` (`name` varchar(10) DEFAULT ':x')",
+        'INSERT INTO `roles` SELECT * FROM `template`.`roles`',
+        'SET FOREIGN_KEY_CHECKS = 1',
+    ] == _executed_sql(engine)
+    assert [call()] == engine.dispose.call_args_list
+
+
+def test_clone_mysql_views(create_engine_mock, destroy_database_mock):
+    engine = create_engine_mock.return_value
+    conn = engine.connect.return_value.__enter__.return_value
+    conn.execute.return_value.__iter__.return_value = [
+        ('roles', 'BASE TABLE'), ('admins', 'VIEW')]
+
+    with pytest.raises(NotImplementedError):
+        clone_database(
+            'mysql://root@host/template', 'mysql://root@host/clone')
+
+    assert ['SHOW FULL TABLES'] == _executed_sql(engine)
+    assert [call()] == engine.dispose.call_args_list
+
+
+def test_clone_mysql_error(create_engine_mock, destroy_database_mock):
+    engine = create_engine_mock.return_value
+    engine.dialect.identifier_preparer.quote.side_effect = '`{}`'.format
+    conn = engine.connect.return_value.__enter__.return_value
+    conn.execute.return_value.__iter__.return_value = [
+        ('roles', 'BASE TABLE')]
+    conn.execute.return_value.fetchone.side_effect = ValueError('boom')
+
+    with pytest.raises(ValueError):
+        clone_database(
+            'mysql://root@host/template', 'mysql://root@host/clone')
+
+    # The foreign key checks are enabled again.
+    assert 'SET FOREIGN_KEY_CHECKS = 1' == _executed_sql(engine)[-1]
+
+
+def test_clone_unsupported_backend(destroy_database_mock):
+    with pytest.raises(NotImplementedError):
+        clone_database('oracle://host/template', 'oracle://host/clone')
+
+    assert not destroy_database_mock.called
+
+
+def _make_tables():
+    metadata = MetaData()
+    Table('companies', metadata, Column('id', Integer, primary_key=True))
+    Table('employees', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('company_id', Integer, ForeignKey('companies.id')))
+    Table('alembic_version', metadata, Column('version_num', Integer))
+    return metadata
+
+
+def test_truncate_tables(tmpdir):
+    uri = 'sqlite:///{}'.format(tmpdir.join('db.sqlite'))
+    engine = create_engine(uri)
+    _make_tables().create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text('INSERT INTO companies VALUES (1)'))
+        conn.execute(text('INSERT INTO employees VALUES (1, 1)'))
+        conn.execute(text('INSERT INTO alembic_version VALUES (2)'))
+
+    truncate_tables(uri)
+
+    with engine.connect() as conn:
+        assert [0, 0, 1] == [
+            conn.execute(text('SELECT COUNT(*) FROM {}'.format(table)))
+            .scalar()
+            for table in ('companies', 'employees', 'alembic_version')
+        ]
+    assert ['alembic_version', 'companies', 'employees'] == sorted(
+        inspect(engine).get_table_names())
+    engine.dispose()
+
+
+def test_truncate_tables_rows(tmpdir):
+    uri = 'sqlite:///{}'.format(tmpdir.join('db.sqlite'))
+    engine = create_engine(uri)
+    _make_tables().create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text('INSERT INTO companies VALUES (1)'))
+        conn.execute(text('INSERT INTO alembic_version VALUES (2)'))
+
+    rows = get_table_rows(uri)
+    with engine.begin() as conn:
+        conn.execute(text('INSERT INTO companies VALUES (2)'))
+        conn.execute(text('INSERT INTO employees VALUES (1, 2)'))
+    truncate_tables(uri, rows=rows)
+
+    # The version table and the empty tables are left out.
+    assert {'companies': [{'id': 1}]} == rows
+    with engine.connect() as conn:
+        assert [(1, )] == [
+            tuple(row) for row in
+            conn.execute(text('SELECT id FROM companies'))]
+        assert 0 == conn.execute(
+            text('SELECT COUNT(*) FROM employees')).scalar()
+    engine.dispose()
+
+
+def test_truncate_tables_empty_database(tmpdir):
+    uri = 'sqlite:///{}'.format(tmpdir.join('db.sqlite'))
+
+    truncate_tables(uri, exclude=())
+
+    assert [] == inspect(create_engine(uri)).get_table_names()
+
+
+def _mock_truncate(create_engine_mock, dialect_name, quote, rows=None):
+    engine = create_engine_mock.return_value
+    engine.dialect.name = dialect_name
+    conn = engine.begin.return_value.__enter__.return_value
+    conn.dialect.name = dialect_name
+    conn.dialect.identifier_preparer.quote.side_effect = quote.format
+    metadata = _make_tables()
+    with patch('alembicverify.database.MetaData') as metadata_mock:
+        metadata_mock.return_value = Mock(
+            sorted_tables=metadata.sorted_tables)
+        truncate_tables('{}://host/name'.format(dialect_name), rows=rows)
+    engine.dispose.assert_called_once_with()
+    return [str(c[0][0]) for c in conn.execute.call_args_list]
+
+
+def test_truncate_tables_postgresql(create_engine_mock):
+    assert [
+        'TRUNCATE TABLE "companies", "employees" RESTART IDENTITY CASCADE',
+    ] == _mock_truncate(create_engine_mock, 'postgresql', '"{}"')
+
+
+@patch('alembicverify.database.reset_sequences')
+def test_truncate_tables_postgresql_rows(reset_sequences, create_engine_mock):
+    assert [
+        'TRUNCATE TABLE "companies", "employees" RESTART IDENTITY CASCADE',
+        'INSERT INTO companies (id) VALUES (:id)',
+    ] == _mock_truncate(
+        create_engine_mock, 'postgresql', '"{}"',
+        rows={'companies': [{'id': 1}]})
+
+    (_, tables), _ = reset_sequences.call_args
+    assert ['companies'] == [table.name for table in tables]
+
+
+def test_truncate_tables_mysql(create_engine_mock):
+    assert [
+        'SET FOREIGN_KEY_CHECKS = 0',
+        'TRUNCATE TABLE `companies`',
+        'TRUNCATE TABLE `employees`',
+        'SET FOREIGN_KEY_CHECKS = 1',
+    ] == _mock_truncate(create_engine_mock, 'mysql', '`{}`')
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+
+import pytest
+from alembic.script import ScriptDirectory
+from mock import Mock, patch
+from sqlalchemy import create_engine
+
+from alembicverify.index import (
+    INDEX_FILENAME,
+    get_version_folders,
+    load_index,
+    use_revision_index,
+)
+from alembicverify.util import make_alembic_config
+from alembicverify.walker import walk_revisions
+
+from test import alembic_root as migrations_root
+
+
+@pytest.fixture
+def alembic_root(tmpdir):
+    root = str(tmpdir.join('migrations'))
+    shutil.copytree(
+        migrations_root, root, ignore=shutil.ignore_patterns('__pycache__'))
+    return root
+
+
+@pytest.fixture
+def versions(alembic_root):
+    return os.path.join(alembic_root, 'versions')
+
+
+@pytest.fixture
+def config(alembic_root, tmpdir):
+    return make_alembic_config(
+        'sqlite:///{}'.format(tmpdir.join('db.sqlite')), alembic_root)
+
+
+def _write(folder, filename, content):
+    with open(os.path.join(folder, filename), 'w') as stream:
+        stream.write(content)
+
+
+def _read_index_file(folder):
+    with open(os.path.join(folder, INDEX_FILENAME)) as stream:
+        return json.load(stream)
+
+
+def test_load_index(versions):
+    index = load_index(versions)
+
+    assert ['aaa111_companies.py', 'bbb222_employees.py',
+            'ccc333_employees_name_index.py'] == sorted(index)
+    entry = index['bbb222_employees.py']
+    assert 'bbb222' == entry['revision']
+    assert 'aaa111' == entry['down_revision']
+    assert None is entry['branch_labels']
+    assert None is entry['depends_on']
+    assert 40 == len(entry['sha1'])
+
+    stored = _read_index_file(versions)
+    assert 1 == stored['format']
+    assert sorted(index) == sorted(stored['files'])
+
+
+def test_load_index_reuses_stored_entries(versions):
+    load_index(versions)
+
+    with patch('alembicverify.index._build_entry') as build_entry:
+        load_index(versions)
+
+    assert not build_entry.called
+
+
+def test_load_index_touched_file_is_not_parsed_again(versions):
+    load_index(versions)
+    path = os.path.join(versions, 'aaa111_companies.py')
+    os.utime(path, (1, 1))
+
+    with patch('alembicverify.index._parse_identifiers') as parse:
+        index = load_index(versions)
+
+    assert not parse.called
+    assert 1 == index['aaa111_companies.py']['mtime']
+    assert 'aaa111' == index['aaa111_companies.py']['revision']
+    assert 1 == _read_index_file(versions)['files'][
+        'aaa111_companies.py']['mtime']
+
+
+def test_load_index_modified_file_is_parsed_again(versions):
+    load_index(versions)
+
+    _write(versions, 'aaa111_companies.py',
+           'revision = "zzz999"\ndown_revision = None\n')
+    index = load_index(versions)
+
+    assert 'zzz999' == index['aaa111_companies.py']['revision']
+
+
+def test_load_index_removed_file(versions):
+    load_index(versions)
+
+    os.remove(os.path.join(versions, 'ccc333_employees_name_index.py'))
+    index = load_index(versions)
+
+    assert 'ccc333_employees_name_index.py' not in index
+    assert 'ccc333_employees_name_index.py' not in _read_index_file(
+        versions)['files']
+
+
+def test_load_index_ignores_other_files(tmpdir):
+    folder = str(tmpdir)
+    _write(folder, '__init__.py', '')
+    _write(folder, 'README', '')
+    _write(folder, 'a.py', 'revision = "a"\ndown_revision = None\n')
+
+    assert ['a.py'] == list(load_index(folder))
+
+
+def test_load_index_annotated_and_merge_revisions(tmpdir):
+    folder = str(tmpdir)
+    _write(folder, 'm.py', '\n'.join([
+        'from typing import Tuple',
+        'revision: str = "m"',
+        'down_revision: Tuple[str, str] = ("a", "b")',
+        'branch_labels = ["label"]',
+        'depends_on: str',
+        'other = 1',
+        'x = y = 2',
+        '',
+    ]))
+
+    entry = load_index(folder)['m.py']
+    assert ('m', ('a', 'b'), ('label',), None) == (
+        entry['revision'], entry['down_revision'], entry['branch_labels'],
+        entry['depends_on'])
+
+    # Values read back from the stored index are tuples as well.
+    entry = load_index(folder)['m.py']
+    assert ('a', 'b') == entry['down_revision']
+
+
+@pytest.mark.parametrize('content', [
+    'revision = "c" + "d"\ndown_revision = None\n',
+    'import os\nrevision = os.environ.get("X", "cd")\ndown_revision = None\n',
+])
+def test_load_index_non_literal_identifiers_are_imported(tmpdir, content):
+    folder = str(tmpdir)
+    _write(folder, 'cd.py', content)
+
+    assert 'cd' == load_index(folder)['cd.py']['revision']
+
+
+def test_load_index_missing_identifiers_are_imported(tmpdir):
+    folder = str(tmpdir)
+    _write(folder, 'x.py', 'exec("revision = \'x\'")\n')
+
+    entry = load_index(folder)['x.py']
+    assert ('x', None) == (entry['revision'], entry['down_revision'])
+
+
+@pytest.mark.parametrize('content', ['not json', '{"format": 0}'])
+def test_load_index_invalid_index_is_rebuilt(versions, content):
+    _write(versions, INDEX_FILENAME, content)
+
+    index = load_index(versions)
+
+    assert 3 == len(index)
+    assert 1 == _read_index_file(versions)['format']
+
+
+def test_load_index_read_only_folder(versions):
+    with patch('alembicverify.cache.os.rename', side_effect=OSError):
+        index = load_index(versions)
+
+    assert 3 == len(index)
+    assert not os.path.exists(os.path.join(versions, INDEX_FILENAME))
+    assert not [name for name in os.listdir(versions) if '.tmp' in name]
+
+
+def test_get_version_folders(tmpdir):
+    other = tmpdir.mkdir('other')
+    script = Mock(version_locations=[str(other), str(tmpdir.join('no'))])
+
+    assert [str(other)] == get_version_folders(script)
+
+
+def test_get_version_folders_default():
+    script = Mock(version_locations=None)
+
+    assert [script.versions] == get_version_folders(script)
+
+
+def test_use_revision_index_imports_lazily(config):
+    script = use_revision_index(ScriptDirectory.from_config(config))
+
+    assert 'ccc333' == script.get_current_head()
+    revisions = [rev.revision for rev in script.walk_revisions()]
+    assert ['ccc333', 'bbb222', 'aaa111'] == revisions
+
+    module = script.get_revision('aaa111').module
+    assert None is module._module
+    assert callable(module.upgrade)
+    assert None is not module._module
+    assert 'Companies' == script.get_revision('aaa111').doc
+
+    with pytest.raises(AttributeError):
+        module.__wrapped__
+
+
+def test_use_revision_index_runs_migrations(config, tmpdir):
+    script = use_revision_index(ScriptDirectory.from_config(config))
+    engine = create_engine('sqlite:///{}'.format(tmpdir.join('db.sqlite')))
+
+    steps = list(walk_revisions(config, engine, script))
+
+    assert 6 == len(steps)
+    assert None is steps[-1].destination
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+import pytest
+from mock import Mock, patch
+from sqlalchemy import inspect, text
+from sqlalchemydiff.util import new_db
+
+from alembicverify.database import get_database_name
+from alembicverify.pool import DatabasePool
+from alembicverify.util import dispose_engines, get_engine
+
+
+@pytest.yield_fixture(autouse=True)
+def poll_interval():
+    with patch.object(DatabasePool, 'poll_interval', 0.01):
+        yield
+
+
+@pytest.fixture
+def uri(tmpdir):
+    return 'sqlite:///{}'.format(tmpdir.join('left.db'))
+
+
+def wait_until_full(pool):
+    while not pool._ready.full():
+        time.sleep(0.01)
+    # Let the thread wait for a free slot.
+    time.sleep(0.05)
+
+
+def test_pool(uri, tmpdir):
+    pool = DatabasePool(uri, 2)
+    try:
+        assert uri == pool.acquire(uri)
+        assert [] == inspect(get_engine(uri)).get_table_names()
+        dispose_engines(uri)
+
+        # The database in place is replaced.
+        pool.acquire(uri)
+        wait_until_full(pool)
+    finally:
+        pool.close()
+
+    assert ['left.db'] == [path.basename for path in tmpdir.listdir()]
+
+
+def test_pool_create(uri, tmpdir):
+    def create(temp_uri):
+        time.sleep(0.05)
+        new_db(temp_uri)
+        with get_engine(temp_uri).begin() as conn:
+            conn.execute(text('CREATE TABLE t (id INT)'))
+        dispose_engines(temp_uri)
+
+    pool = DatabasePool(uri, 1, create=create)
+    try:
+        pool.acquire(uri)
+    finally:
+        pool.close()
+
+    assert ['t'] == inspect(get_engine(uri)).get_table_names()
+    dispose_engines(uri)
+    assert ['left.db'] == [path.basename for path in tmpdir.listdir()]
+
+
+def test_pool_rename_error(uri):
+    pool = DatabasePool(uri, 1)
+    try:
+        with patch('alembicverify.pool.rename_database') as rename:
+            rename.side_effect = OSError('busy')
+            with pytest.raises(OSError):
+                pool.acquire(uri)
+    finally:
+        spares = list(pool._ready.queue)
+        pool.close()
+
+    # The spare database goes back to the pool.
+    assert [rename.call_args[0][0]] == spares
+
+
+def test_pool_rename_error_full(uri):
+    pool = DatabasePool(uri, 1)
+
+    def rename_database(temp_uri, new_uri):
+        # The thread fills the slot meanwhile.
+        wait_until_full(pool)
+        taken.append(temp_uri)
+        raise OSError('busy')
+
+    taken = []
+    try:
+        with patch('alembicverify.pool.rename_database', rename_database):
+            with pytest.raises(OSError):
+                pool.acquire(uri)
+        spares = list(pool._ready.queue)
+    finally:
+        pool.close()
+
+    # There are enough spare databases, the one taken is destroyed.
+    assert 1 == len(spares)
+    assert taken != spares
+    assert not os.path.exists(get_database_name(taken[0]))
+
+
+def test_pool_error(uri):
+    create = Mock(side_effect=ValueError('no server'))
+
+    pool = DatabasePool(uri, 1, create=create)
+    with pytest.raises(ValueError):
+        pool.acquire(uri)
+    pool.close()
+
+    assert 1 == create.call_count
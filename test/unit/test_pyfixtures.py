@@ -1,5 +1,20 @@
-from mock import patch, call
+import os
+import shutil
+import subprocess
+import sys
+
+from mock import Mock, call, patch
 import pytest
+import sqlalchemydiff.util
+
+# Imported before ``testdir`` snapshots ``sys.modules``, so the modules
+# patched by the tests are not dropped and imported again in between.
+import alembicverify.bisection  # noqa: F401
+import alembicverify.database  # noqa: F401
+import alembicverify.pool  # noqa: F401
+import alembicverify.util  # noqa: F401
+
+from test import alembic_root
 
 
 pytest_plugins = "pytester"
@@ -28,7 +43,7 @@ def conftest(testdir):
     )
 
 
-@patch('alembicverify.pyfixtures.make_alembic_config')
+@patch('alembicverify.util.make_alembic_config')
 def test_alembic_config_left(make_config, testdir, conftest):
 
     testdir.makepyfile(
@@ -43,7 +58,7 @@ def test_alembic_config_left(make_config, testdir, conftest):
     assert make_config.call_args_list == [call("left", "root")]
 
 
-@patch('alembicverify.pyfixtures.make_alembic_config')
+@patch('alembicverify.util.make_alembic_config')
 def test_alembic_config_right(make_config, testdir, conftest):
 
     testdir.makepyfile(
@@ -58,10 +73,30 @@ def test_alembic_config_right(make_config, testdir, conftest):
     assert make_config.call_args_list == [call("right", "root")]
 
 
-@patch('alembicverify.pyfixtures.new_db')
-@patch('alembicverify.pyfixtures.destroy_database')
+@patch('alembicverify.util.make_alembic_config')
+def test_alembic_config_snapshot_dir(make_config, testdir, conftest):
+
+    testdir.makepyfile(
+        """
+        def test_config(alembic_config_left, alembic_config_right):
+            pass
+        """
+    )
+    result = testdir.runpytest("--alembic-snapshot-dir", "snapshots")
+    assert result.ret == 0
+
+    config = make_config.return_value
+    assert config.attributes.__setitem__.call_args_list == [
+        call("snapshot_dir", "snapshots"),
+        call("snapshot_dir", "snapshots"),
+    ]
+
+
+@patch('alembicverify.util.dispose_engines')
+@patch('sqlalchemydiff.util.new_db')
+@patch('sqlalchemydiff.util.destroy_database')
 def test_new_db_left(
-    new_db, destroy_database, conftest, testdir
+    new_db, destroy_database, dispose_engines, conftest, testdir
 ):
     testdir.makepyfile(
         """
@@ -74,12 +109,14 @@ def test_new_db_left(
 
     assert new_db.call_args_list == [call("left")]
     assert destroy_database.call_args_list == [call("left")]
+    assert dispose_engines.call_args_list == [call("left")]
 
 
-@patch('alembicverify.pyfixtures.new_db')
-@patch('alembicverify.pyfixtures.destroy_database')
+@patch('alembicverify.util.dispose_engines')
+@patch('sqlalchemydiff.util.new_db')
+@patch('sqlalchemydiff.util.destroy_database')
 def test_new_db_right(
-    new_db, destroy_database, conftest, testdir
+    new_db, destroy_database, dispose_engines, conftest, testdir
 ):
     testdir.makepyfile(
         """
@@ -92,3 +129,807 @@ def test_new_db_right(
 
     assert new_db.call_args_list == [call("right")]
     assert destroy_database.call_args_list == [call("right")]
+    assert dispose_engines.call_args_list == [call("right")]
+
+
+@patch('alembicverify.util.dispose_engines')
+@patch('alembicverify.util.make_alembic_config')
+@patch('alembicverify.util.prepare_schema_from_migrations')
+@patch('alembicverify.database.get_server_uri')
+@patch('alembicverify.database.get_temporary_uri')
+@patch('alembicverify.database.clone_database')
+@patch('sqlalchemydiff.util.new_db')
+@patch('sqlalchemydiff.util.destroy_database')
+def test_new_db_left_from_template(
+    destroy_database, new_db, clone_database, get_temporary_uri,
+    get_server_uri, prepare_schema, make_config, dispose_engines, conftest,
+    testdir
+):
+    get_temporary_uri.return_value = "template"
+    testdir.makepyfile(
+        """
+        def test_one(new_db_left):
+            pass
+
+        def test_two(new_db_left):
+            pass
+        """
+    )
+    result = testdir.runpytest("--alembic-template")
+    assert result.ret == 0
+
+    get_temporary_uri.assert_called_once_with("left")
+    assert new_db.call_args_list == [call("template")]
+    make_config.assert_called_once_with("template", "root")
+    prepare_schema.assert_called_once_with(
+        "template", make_config.return_value)
+    assert dispose_engines.call_args_list == [
+        call("template"), call("left"), call("left")]
+    assert clone_database.call_args_list == [
+        call("template", "left"), call("template", "left")]
+    assert destroy_database.call_args_list == [
+        call("left"), call("left"), call("template")]
+
+
+def test_alembic_timing(testdir):
+    testdir.makeconftest(
+        """
+        import os
+
+        import pytest
+
+
+        @pytest.fixture
+        def uri_left(tmpdir):
+            return 'sqlite:///{{}}'.format(tmpdir.join('left.db'))
+
+
+        @pytest.fixture
+        def alembic_root():
+            return {!r}
+        """.format(alembic_root)
+    )
+    testdir.makepyfile(
+        """
+        from alembicverify.util import prepare_schema_from_migrations
+
+        def test_migrations(uri_left, alembic_config_left):
+            prepare_schema_from_migrations(uri_left, alembic_config_left)
+        """
+    )
+    result = testdir.runpytest("--alembic-timing", "2")
+    assert result.ret == 0
+
+    result.stdout.fnmatch_lines([
+        "*slowest 2 alembic migrations*",
+        "*s upgrade * statements)",
+        "*s upgrade * statements)",
+    ])
+    assert 2 == len([
+        line for line in result.stdout.lines if " statements)" in line])
+
+
+def test_alembic_timing_disabled(testdir, conftest):
+    testdir.makepyfile(
+        """
+        def test_nothing():
+            pass
+        """
+    )
+    result = testdir.runpytest()
+    assert result.ret == 0
+
+    assert "alembic migrations" not in result.stdout.str()
+
+
+@patch('alembicverify.bisection.bisect_revisions')
+def test_alembic_bisect_skipped(bisect_revisions, testdir, conftest):
+    testdir.makepyfile(
+        """
+        def test_bisect(alembic_bisect):
+            pass
+        """
+    )
+    result = testdir.runpytest("-rs")
+    assert result.ret == 0
+
+    result.stdout.fnmatch_lines(["*run with --alembic-bisect*"])
+    assert not bisect_revisions.called
+
+
+@patch('alembicverify.bisection.bisect_revisions')
+@patch('alembicverify.util.make_alembic_config')
+@patch('alembicverify.util.dispose_engines')
+@patch('sqlalchemydiff.util.new_db')
+@patch('sqlalchemydiff.util.destroy_database')
+def test_alembic_bisect(
+    destroy_database, new_db, dispose_engines, make_config,
+    bisect_revisions, testdir, conftest
+):
+    bisect_revisions.return_value = None
+    testdir.makepyfile(
+        """
+        def test_bisect(alembic_bisect):
+            assert alembic_bisect("metadata", ignores=["t"]) is None
+        """
+    )
+    result = testdir.runpytest("--alembic-bisect")
+    assert result.ret == 0
+
+    assert new_db.call_args_list == [call("left")]
+    bisect_revisions.assert_called_once_with(
+        "left", make_config.return_value, "metadata", ignores=["t"])
+
+
+def test_alembic_compare_models_verdict_cache(testdir, tmpdir):
+    testdir.makeconftest(
+        """
+        import pytest
+
+
+        @pytest.fixture
+        def uri_left(tmpdir):
+            return 'sqlite:///{{}}'.format(tmpdir.join('left.db'))
+
+
+        @pytest.fixture
+        def alembic_root():
+            return {!r}
+        """.format(alembic_root)
+    )
+    test_file = """
+        import os
+
+        from test import make_metadata
+
+        def test_models(alembic_compare_models, tmpdir):
+            result = alembic_compare_models(make_metadata(), ignores=['x'])
+
+            assert result.is_match
+            assert {cached} == result.info['cached']
+            assert {cached} != tmpdir.join('left.db').check()
+        """
+    verdicts = str(tmpdir.join('verdicts'))
+
+    testdir.makepyfile(test_file.format(cached=False))
+    result = testdir.runpytest("--alembic-verdict-cache", verdicts)
+    assert result.ret == 0
+    assert 1 == len(tmpdir.join('verdicts').listdir())
+
+    testdir.makepyfile(test_file.format(cached=True))
+    result = testdir.runpytest("--alembic-verdict-cache", verdicts)
+    assert result.ret == 0
+
+    testdir.makepyfile(test_file.format(cached=False))
+    result = testdir.runpytest(
+        "--alembic-verdict-cache", verdicts, "--alembic-force-verify")
+    assert result.ret == 0
+
+
+def test_alembic_compare_models(testdir):
+    testdir.makeconftest(
+        """
+        import pytest
+
+
+        @pytest.fixture
+        def uri_left(tmpdir):
+            return 'sqlite:///{{}}'.format(tmpdir.join('left.db'))
+
+
+        @pytest.fixture
+        def alembic_root():
+            return {!r}
+        """.format(alembic_root)
+    )
+    testdir.makepyfile(
+        """
+        from sqlalchemy import MetaData
+
+        def test_models(alembic_compare_models):
+            result = alembic_compare_models(MetaData())
+
+            assert ['companies', 'employees'] == sorted(
+                result.errors['tables']['left_only'])
+            assert not result.info['cached']
+            assert 'fingerprint' not in result.info
+        """
+    )
+    result = testdir.runpytest()
+    assert result.ret == 0
+
+
+def test_plugin_does_not_import_heavy_modules():
+    # The plugin is loaded by every pytest run, fixtures used or not.
+    code = (
+        "import sys, alembicverify.pyfixtures; "
+        "print(' '.join(sorted(sys.modules)))"
+    )
+    output = subprocess.check_output([sys.executable, '-c', code])
+    modules = set(output.decode('utf-8').split())
+
+    for name in ('alembic', 'sqlalchemy', 'sqlalchemydiff',
+                 'sqlalchemy_utils', 'alembicverify.util'):
+        assert name not in modules
+
+
+@pytest.mark.parametrize('snapshot', [False, True])
+@pytest.mark.parametrize('scope,created', [
+    ('function', 4), ('module', 2), ('session', 1)])
+def test_alembic_db_scope(testdir, tmpdir, scope, created, snapshot):
+    testdir.makeconftest(
+        """
+        import pytest
+
+
+        @pytest.fixture
+        def uri_left():
+            return 'sqlite:///{left}'
+
+
+        @pytest.fixture
+        def uri_right():
+            return 'sqlite:///{right}'
+
+
+        @pytest.fixture
+        def alembic_root():
+            return {root!r}
+        """.format(
+            left=tmpdir.join('left.db'), right=tmpdir.join('right.db'),
+            root=alembic_root)
+    )
+    test_module = """
+        from sqlalchemy import create_engine, text
+
+
+        def check(uri_left, uri_right):
+            left = create_engine(uri_left)
+            with left.begin() as conn:
+                assert 'ccc333' == conn.execute(
+                    text('SELECT version_num FROM alembic_version')).scalar()
+                assert 0 == conn.execute(
+                    text('SELECT COUNT(*) FROM companies')).scalar()
+                conn.execute(text("INSERT INTO companies VALUES (1, 'a')"))
+            left.dispose()
+
+            right = create_engine(uri_right)
+            with right.begin() as conn:
+                conn.execute(text('CREATE TABLE IF NOT EXISTS t (id INT)'))
+                assert 0 == conn.execute(
+                    text('SELECT COUNT(*) FROM t')).scalar()
+                conn.execute(text('INSERT INTO t VALUES (1)'))
+            right.dispose()
+
+
+        def test_one(new_db_left, new_db_right, uri_left, uri_right,
+                     alembic_config_left):
+            {migrate}
+            check(uri_left, uri_right)
+
+
+        def test_two(new_db_left, new_db_right, uri_left, uri_right,
+                     alembic_config_left):
+            {migrate}
+            check(uri_left, uri_right)
+        """
+    migrate = (
+        'from alembicverify.util import prepare_schema_from_migrations; '
+        'prepare_schema_from_migrations(uri_left, alembic_config_left)'
+    )
+    testdir.makepyfile(
+        test_a=test_module.format(migrate=migrate),
+        test_b=test_module.format(migrate=migrate),
+    )
+
+    with patch('sqlalchemydiff.util.new_db',
+               wraps=sqlalchemydiff.util.new_db) as new_db:
+        args = ['--alembic-db-scope', scope]
+        if snapshot:
+            args += ['--alembic-snapshot-dir', str(tmpdir.join('snapshots'))]
+        result = testdir.runpytest(*args)
+    assert result.ret == 0
+
+    assert 2 * created == new_db.call_count
+    assert not tmpdir.join('left.db').check()
+    assert not tmpdir.join('right.db').check()
+
+
+SEED_REVISION = '''
+from alembic import op
+
+
+revision = 'ddd444'
+down_revision = 'ccc333'
+
+
+def upgrade():
+    op.execute("INSERT INTO companies VALUES (1, 'seed')")
+
+
+def downgrade():
+    op.execute("DELETE FROM companies")
+'''
+
+
+def test_alembic_db_scope_keeps_migration_rows(testdir, tmpdir):
+    root = str(tmpdir.join('migrations'))
+    shutil.copytree(
+        alembic_root, root, ignore=shutil.ignore_patterns('__pycache__'))
+    with open(os.path.join(root, 'versions', 'ddd444_seed.py'), 'w') as f:
+        f.write(SEED_REVISION)
+    testdir.makeconftest(
+        """
+        import pytest
+
+
+        @pytest.fixture
+        def uri_left():
+            return 'sqlite:///{left}'
+
+
+        @pytest.fixture
+        def alembic_root():
+            return {root!r}
+        """.format(left=tmpdir.join('left.db'), root=root)
+    )
+    testdir.makepyfile(
+        """
+        from sqlalchemy import create_engine, text
+
+
+        def check(uri_left):
+            left = create_engine(uri_left)
+            with left.begin() as conn:
+                assert [(1, 'seed')] == [
+                    tuple(row) for row in
+                    conn.execute(text('SELECT * FROM companies'))]
+                conn.execute(text("INSERT INTO companies VALUES (2, 'a')"))
+            left.dispose()
+
+
+        def test_one(new_db_left, uri_left):
+            check(uri_left)
+
+
+        def test_two(new_db_left, uri_left):
+            check(uri_left)
+        """
+    )
+
+    result = testdir.runpytest('--alembic-db-scope', 'session')
+    assert result.ret == 0
+    result.assert_outcomes(passed=2)
+
+
+def test_alembic_isolation_transaction(testdir, tmpdir):
+    testdir.makeconftest(
+        """
+        import pytest
+        from sqlalchemy import create_engine, event
+
+        from alembicverify import util
+
+
+        @pytest.fixture
+        def uri_left():
+            uri = 'sqlite:///{left}'
+            # pysqlite only begins transactions before DML statements.
+            engine = create_engine(
+                uri, connect_args={{'isolation_level': None}})
+
+            @event.listens_for(engine, 'begin')
+            def begin(conn):
+                conn.exec_driver_sql('BEGIN')
+
+            util._engines[uri] = engine
+            return uri
+
+
+        @pytest.fixture
+        def uri_right():
+            return 'sqlite:///{right}'
+
+
+        @pytest.fixture
+        def alembic_root():
+            return {root!r}
+        """.format(
+            left=tmpdir.join('left.db'), right=tmpdir.join('right.db'),
+            root=alembic_root)
+    )
+    test_module = """
+        from sqlalchemy import inspect, text
+
+        from alembicverify.util import (
+            get_connection,
+            prepare_schema_from_migrations,
+        )
+
+
+        def test_{name}(new_db_left, uri_left, alembic_config_left):
+            conn = get_connection(uri_left)
+            assert [] == inspect(conn).get_table_names()
+
+            prepare_schema_from_migrations(uri_left, alembic_config_left)
+
+            assert alembic_config_left.attributes['connection'] is conn
+            assert 0 == conn.execute(
+                text('SELECT COUNT(*) FROM companies')).scalar()
+            conn.execute(text("INSERT INTO companies VALUES (1, 'a')"))
+        """
+    testdir.makepyfile(
+        test_a=test_module.format(name='one'),
+        test_b=test_module.format(name='two'),
+    )
+
+    with patch('sqlalchemydiff.util.new_db',
+               wraps=sqlalchemydiff.util.new_db) as new_db, \
+            patch('alembicverify.database.supports_transactional_ddl',
+                  return_value=True):
+        result = testdir.runpytest('--alembic-isolation', 'transaction')
+    assert result.ret == 0
+
+    assert 1 == new_db.call_count
+    assert not tmpdir.join('left.db').check()
+
+
+def test_alembic_isolation_transaction_right(testdir, tmpdir):
+    testdir.makeconftest(
+        """
+        import pytest
+
+
+        @pytest.fixture
+        def uri_right():
+            return 'sqlite:///{right}'
+        """.format(right=tmpdir.join('right.db'))
+    )
+    testdir.makepyfile(
+        """
+        def test_one(new_db_right):
+            pass
+
+
+        def test_two(new_db_right):
+            pass
+        """
+    )
+
+    with patch('sqlalchemydiff.util.new_db',
+               wraps=sqlalchemydiff.util.new_db) as new_db:
+        result = testdir.runpytest('--alembic-isolation', 'transaction')
+    assert result.ret == 0
+
+    assert 1 == new_db.call_count
+    assert not tmpdir.join('right.db').check()
+
+
+@patch('sqlalchemydiff.util.new_db')
+def test_alembic_isolation_transaction_unsupported(new_db, testdir, tmpdir):
+    testdir.makeconftest(
+        """
+        import pytest
+
+
+        @pytest.fixture
+        def uri_left():
+            return 'mysql://root@localhost/left'
+        """
+    )
+    testdir.makepyfile(
+        """
+        def test_left(new_db_left):
+            pass
+        """
+    )
+
+    result = testdir.runpytest('--alembic-isolation', 'transaction')
+    assert result.ret == 1
+
+    result.stdout.fnmatch_lines([
+        '*--alembic-isolation=transaction needs a backend with '
+        'transactional DDL*'])
+    assert not new_db.called
+
+
+@patch('alembicverify.util.use_schema')
+@patch('alembicverify.database.drop_schema')
+@patch('alembicverify.database.create_schema')
+@patch('sqlalchemydiff.util.destroy_database')
+@patch('sqlalchemydiff.util.new_db')
+def test_alembic_isolation_schema(
+        new_db, destroy_database, create_schema, drop_schema, use_schema,
+        testdir):
+    uri = 'postgresql://user@host/left'
+    testdir.makeconftest(
+        """
+        import pytest
+
+
+        @pytest.fixture
+        def uri_left():
+            return {uri!r}
+        """.format(uri=uri)
+    )
+    testdir.makepyfile(
+        """
+        def test_one(new_db_left):
+            pass
+
+
+        def test_two(new_db_left):
+            pass
+        """
+    )
+
+    result = testdir.runpytest('--alembic-isolation', 'schema')
+    assert result.ret == 0
+
+    assert [call(uri)] == new_db.call_args_list
+    assert [call(uri)] == destroy_database.call_args_list
+    schemas = [args[1] for args, _ in create_schema.call_args_list]
+    assert 2 == len(set(schemas))
+    assert all(schema.startswith('test_') for schema in schemas)
+    assert [call(uri, schema) for schema in schemas] == (
+        use_schema.call_args_list)
+    assert [call(uri, schema) for schema in schemas] == (
+        drop_schema.call_args_list)
+
+
+@patch('sqlalchemydiff.util.new_db')
+def test_alembic_isolation_schema_unsupported(new_db, testdir, tmpdir):
+    testdir.makeconftest(
+        """
+        import pytest
+
+
+        @pytest.fixture
+        def uri_left():
+            return 'sqlite:///left.db'
+        """
+    )
+    testdir.makepyfile(
+        """
+        def test_left(new_db_left):
+            pass
+        """
+    )
+
+    result = testdir.runpytest('--alembic-isolation', 'schema')
+    assert result.ret == 1
+
+    result.stdout.fnmatch_lines(['*--alembic-isolation=schema needs*'])
+    assert not new_db.called
+
+
+@pytest.mark.parametrize('template', [False, True])
+def test_alembic_pool_size(testdir, tmpdir, template):
+    testdir.makeconftest(
+        """
+        import pytest
+
+
+        @pytest.fixture
+        def uri_left():
+            return 'sqlite:///{left}'
+
+
+        @pytest.fixture
+        def uri_right():
+            return 'sqlite:///{right}'
+
+
+        @pytest.fixture
+        def alembic_root():
+            return {root!r}
+        """.format(
+            left=tmpdir.join('left.db'), right=tmpdir.join('right.db'),
+            root=alembic_root)
+    )
+    testdir.makepyfile(
+        """
+        from sqlalchemy import create_engine, inspect
+
+
+        def test_one(new_db_left, new_db_right, uri_left, uri_right):
+            left = create_engine(uri_left)
+            assert {tables!r} == sorted(inspect(left).get_table_names())
+            left.dispose()
+            assert [] == inspect(create_engine(uri_right)).get_table_names()
+
+
+        def test_two(new_db_left, new_db_right):
+            pass
+        """.format(tables=(
+            ['alembic_version', 'companies', 'employees'] if template
+            else []))
+    )
+
+    args = ['--alembic-pool-size', '2']
+    if template:
+        args.append('--alembic-template')
+    with patch('alembicverify.pool.rename_database',
+               wraps=alembicverify.pool.rename_database) as rename:
+        result = testdir.runpytest(*args)
+    assert result.ret == 0
+
+    assert 4 == rename.call_count
+    # The spare databases and the template are destroyed.
+    assert [] == tmpdir.listdir()
+
+
+@patch('alembicverify.pool.DatabasePool')
+def test_alembic_pool_size_unsupported(DatabasePool, testdir):
+    testdir.makeconftest(
+        """
+        import pytest
+
+
+        @pytest.fixture
+        def uri_right():
+            return 'mysql://root@localhost/right'
+        """
+    )
+    testdir.makepyfile(
+        """
+        def test_right(new_db_right):
+            pass
+        """
+    )
+
+    result = testdir.runpytest('--alembic-pool-size', '2')
+    assert result.ret == 1
+
+    result.stdout.fnmatch_lines(['*--alembic-pool-size needs*'])
+    assert not DatabasePool.called
+
+
+def test_alembic_xdist(testdir, tmpdir):
+    testdir.makeconftest(
+        """
+        import pytest
+
+        from alembicverify.database import get_worker_uri
+
+
+        @pytest.fixture
+        def uri_left(alembic_worker_id):
+            assert alembic_worker_id.startswith('gw')
+            return get_worker_uri('sqlite:///{left}', alembic_worker_id)
+
+
+        @pytest.fixture
+        def alembic_root():
+            return {root!r}
+        """.format(left=tmpdir.join('left.db'), root=alembic_root)
+    )
+    testdir.makepyfile(
+        """
+        import glob
+        import os
+
+        import pytest
+        from sqlalchemy import create_engine, inspect
+
+
+        @pytest.mark.parametrize('index', range(4))
+        def test_left(new_db_left, uri_left, alembic_worker_id, request,
+                      index):
+            assert uri_left.endswith('left_{}.db'.format(alembic_worker_id))
+            shared_dir = request.config.alembic_shared_dir
+            assert 1 == len(glob.glob(os.path.join(shared_dir, '*.template')))
+
+            engine = create_engine(uri_left)
+            assert 'companies' in inspect(engine).get_table_names()
+            engine.dispose()
+        """
+    )
+
+    result = testdir.runpytest('-n', '2', '--alembic-template')
+    assert result.ret == 0
+    result.assert_outcomes(passed=4)
+
+    # The databases and the shared template are destroyed.
+    assert [] == tmpdir.listdir(lambda path: path.ext == '.db')
+    assert [] == tmpdir.listdir(lambda path: path.basename.startswith('temp_'))
+
+
+def test_alembic_worker_id(testdir, monkeypatch):
+    testdir.makepyfile(
+        """
+        def test_worker_id(alembic_worker_id):
+            assert 'gw3' == alembic_worker_id
+
+
+        def test_worker_uri(alembic_worker_id):
+            from alembicverify.database import get_worker_uri
+
+            assert 'sqlite:///left_gw3.db' == get_worker_uri(
+                'sqlite:///left.db', alembic_worker_id)
+        """
+    )
+    monkeypatch.setenv('PYTEST_XDIST_WORKER', 'gw3')
+
+    result = testdir.runpytest()
+    assert result.ret == 0
+
+
+def test_shared_template(tmpdir):
+    from alembicverify import pyfixtures
+
+    config = Mock(alembic_shared_dir=str(tmpdir))
+    templates = {}
+
+    with patch.object(pyfixtures, '_create_template',
+                      return_value='sqlite:///temp_1') as create:
+        first = pyfixtures._get_template(
+            'sqlite:///left_gw0.db', 'root', templates, config)
+        second = pyfixtures._get_template(
+            'sqlite:///left_gw1.db', 'root', templates, config)
+
+    assert 'sqlite:///temp_1' == first == second
+    create.assert_called_once_with('sqlite:///left_gw0.db', 'root', config)
+    # The workers do not destroy the shared templates.
+    assert {} == templates
+
+
+def test_configure_node(tmpdir):
+    from alembicverify import pyfixtures
+
+    config = Mock(alembic_shared_dir=None)
+    nodes = [Mock(config=config, workerinput={}) for _ in range(2)]
+
+    with patch('tempfile.mkdtemp', return_value=str(tmpdir)) as mkdtemp:
+        for node in nodes:
+            pyfixtures.pytest_configure_node(node)
+
+    assert 1 == mkdtemp.call_count
+    assert [str(tmpdir)] * 2 == [
+        node.workerinput['alembic_shared_dir'] for node in nodes]
+
+
+def test_configure_node_without_fcntl():
+    from alembicverify import pyfixtures
+
+    node = Mock(workerinput={})
+    node.config.alembic_shared_dir = None
+
+    with patch.dict(sys.modules, {'fcntl': None}):
+        pyfixtures.pytest_configure_node(node)
+
+    assert {} == node.workerinput
+    assert node.config.alembic_shared_dir is None
+
+
+@patch('sqlalchemydiff.util.destroy_database')
+def test_unconfigure_destroys_shared_templates(destroy_database, tmpdir):
+    from alembicverify import pyfixtures
+
+    shared_dir = tmpdir.mkdir('shared')
+    shared_dir.join('abc.template').write('sqlite:///temp_1')
+    shared_dir.join('abc.template.lock').write('')
+
+    worker_config = Mock(alembic_shared_dir=str(shared_dir), workerinput={})
+    pyfixtures.pytest_unconfigure(worker_config)
+    assert not destroy_database.called
+
+    config = Mock(spec=['alembic_shared_dir'])
+    config.alembic_shared_dir = str(shared_dir)
+    pyfixtures.pytest_unconfigure(config)
+
+    destroy_database.assert_called_once_with('sqlite:///temp_1')
+    assert not shared_dir.check()
+
+
+def test_configure_worker():
+    from alembicverify import pyfixtures
+
+    config = Mock(workerinput={
+        'workerid': 'gw2', 'alembic_shared_dir': '/tmp/shared'})
+    config.getoption.return_value = None
+
+    pyfixtures.pytest_configure(config)
+
+    assert '/tmp/shared' == config.alembic_shared_dir
+    assert 'gw2' == pyfixtures._get_worker_id(config)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+
+import pytest
+from alembic.script import ScriptDirectory
+from mock import patch
+from sqlalchemy import create_engine
+
+from alembicverify import reversibility
+from alembicverify.reversibility import (
+    ReversibilityError,
+    check_reversibility,
+    diff_schemas,
+    reflect_schema,
+)
+from alembicverify.util import make_alembic_config
+from alembicverify.walker import DOWNGRADE, UPGRADE, migrate
+
+from test import alembic_root as migrations_root
+
+
+LEAKY_REVISION = '''
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'ddd444'
+down_revision = 'ccc333'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('roles', sa.Column('id', sa.Integer(), primary_key=True))
+
+
+def downgrade():
+    op.drop_table('roles')
+    op.create_table('leftover', sa.Column('id', sa.Integer()))
+'''
+
+
+@pytest.fixture
+def alembic_root(tmpdir):
+    root = str(tmpdir.join('migrations'))
+    shutil.copytree(
+        migrations_root, root, ignore=shutil.ignore_patterns('__pycache__'))
+    return root
+
+
+@pytest.fixture
+def config(alembic_root, tmpdir):
+    return make_alembic_config(
+        'sqlite:///{}'.format(tmpdir.join('db.sqlite')), alembic_root)
+
+
+@pytest.fixture
+def script(config):
+    return ScriptDirectory.from_config(config)
+
+
+@pytest.yield_fixture
+def engine(config):
+    engine = create_engine(config.get_main_option('sqlalchemy.url'))
+    yield engine
+    engine.dispose()
+
+
+def test_check_reversibility(config, engine, script):
+    assert [] == check_reversibility(config, engine, script)
+
+    with engine.connect() as conn:
+        assert ['companies', 'employees'] == sorted(reflect_schema(conn))
+
+
+def test_check_reversibility_from_current(config, engine, script):
+    with engine.connect() as conn:
+        migrate(config, script, conn, UPGRADE, 'bbb222')
+
+    with patch.object(
+            reversibility, 'migrate', wraps=reversibility.migrate) as wrapped:
+        assert [] == check_reversibility(config, engine, script)
+
+    assert 3 == wrapped.call_count
+
+
+def test_check_reversibility_uses_connection_from_config(
+        config, engine, script):
+    with engine.connect() as conn:
+        config.attributes['connection'] = conn
+        assert [] == check_reversibility(config, None, script)
+        assert ['companies', 'employees'] == sorted(reflect_schema(conn))
+
+
+def test_check_reversibility_leaky_downgrade(
+        alembic_root, config, engine):
+    with open(os.path.join(alembic_root, 'versions', 'ddd444.py'), 'w') as f:
+        f.write(LEAKY_REVISION)
+    script = ScriptDirectory.from_config(config)
+
+    errors = check_reversibility(config, engine, script)
+
+    leftover = {
+        'columns': [{
+            'name': 'id', 'type': 'INTEGER', 'nullable': True,
+            'default': None,
+        }],
+        'primary_key': [],
+        'foreign_keys': [],
+        'indexes': [],
+        'unique_constraints': [],
+    }
+    assert [
+        ReversibilityError('ddd444', DOWNGRADE, {
+            'leftover': {'expected': None, 'actual': leftover}}),
+        ReversibilityError('ddd444', UPGRADE, {
+            'leftover': {'expected': None, 'actual': leftover}}),
+    ] == errors
+
+
+def test_reflect_schema(config, engine, script):
+    with engine.connect() as conn:
+        migrate(config, script, conn, UPGRADE, 'head')
+        schema = reflect_schema(conn)
+
+    assert {
+        'columns': [
+            {'name': 'id', 'type': 'INTEGER', 'nullable': False,
+             'default': None},
+            {'name': 'name', 'type': 'VARCHAR(200)', 'nullable': True,
+             'default': None},
+            {'name': 'company_id', 'type': 'INTEGER', 'nullable': False,
+             'default': None},
+        ],
+        'primary_key': ['id'],
+        'foreign_keys': [{
+            'name': None,
+            'constrained_columns': ['company_id'],
+            'referred_table': 'companies',
+            'referred_columns': ['id'],
+        }],
+        'indexes': [{
+            'name': 'ix_employees_name',
+            'column_names': ['name'],
+            'unique': True,
+        }],
+        'unique_constraints': [],
+    } == schema['employees']
+    assert 'alembic_version' not in schema
+
+
+def test_diff_schemas():
+    expected = {'a': {'columns': []}, 'b': {'columns': []}}
+    actual = {'b': {'columns': [{}]}, 'c': {'columns': []}}
+
+    assert {
+        'a': {'expected': {'columns': []}, 'actual': None},
+        'b': {'expected': {'columns': []}, 'actual': {'columns': [{}]}},
+        'c': {'expected': None, 'actual': {'columns': []}},
+    } == diff_schemas(expected, actual)
+    assert {} == diff_schemas(expected, dict(expected))
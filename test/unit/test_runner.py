@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from alembic.script import ScriptDirectory
+from mock import Mock, patch
+from sqlalchemy import create_engine, inspect
+
+from alembicverify import util
+from alembicverify.runner import MigrationRunner
+from alembicverify.timing import MigrationTimer
+from alembicverify.util import make_alembic_config
+
+from test import alembic_root, make_metadata
+
+
+@pytest.fixture
+def uri(tmpdir):
+    return 'sqlite:///{}'.format(tmpdir.join('runner.db'))
+
+
+@pytest.fixture
+def config(uri):
+    return make_alembic_config(uri, alembic_root)
+
+
+@pytest.yield_fixture
+def engine(uri):
+    engine = create_engine(uri)
+    yield engine
+    engine.dispose()
+
+
+@pytest.yield_fixture
+def conn(engine):
+    with engine.connect() as conn:
+        yield conn
+
+
+def test_runner(config, conn):
+    script = ScriptDirectory.from_config(config)
+    runner = MigrationRunner(config, conn, script=script)
+
+    assert runner.get_current_revision() is None
+    assert 'bbb222' == runner.upgrade('+2')
+    assert 'bbb222' == runner.get_current_revision()
+    assert 'ccc333' == runner.upgrade()
+    assert 'aaa111' == runner.downgrade('aaa111')
+    assert runner.downgrade('base') is None
+    assert ['alembic_version'] == inspect(conn).get_table_names()
+
+
+@patch.object(ScriptDirectory, 'run_env')
+def test_runner_does_not_run_env_py(run_env, config, conn):
+    runner = MigrationRunner(config, conn)
+
+    assert 'ccc333' == runner.upgrade()
+    assert not run_env.called
+    # The script directory comes from the cache.
+    assert runner.script is util.load_script_directory(config)
+    util._scripts.clear()
+
+
+def test_runner_context_options(config, conn):
+    metadata = make_metadata()
+    callback = Mock()
+    runner = MigrationRunner(
+        config, conn, target_metadata=metadata,
+        script=ScriptDirectory.from_config(config),
+        on_version_apply=callback)
+
+    runner.upgrade('aaa111')
+
+    assert 1 == callback.call_count
+    context = callback.call_args[1]['ctx']
+    assert metadata is context.opts['target_metadata']
+    assert 'alembic_version' == context.opts['version_table']
+
+
+def test_runner_timer(config, conn):
+    config.attributes['timer'] = timer = MigrationTimer()
+    runner = MigrationRunner(
+        config, conn, script=ScriptDirectory.from_config(config))
+
+    runner.upgrade()
+    runner.downgrade('-1')
+
+    assert [
+        ('aaa111', 'upgrade'),
+        ('bbb222', 'upgrade'),
+        ('ccc333', 'upgrade'),
+        ('ccc333', 'downgrade'),
+    ] == [(timing.revision, timing.direction) for timing in timer.timings]
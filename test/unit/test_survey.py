@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from mock import patch
+from sqlalchemy import create_engine, text
+
+from alembicverify import survey, util
+from alembicverify.survey import (
+    DatabaseRevision,
+    read_database_revisions,
+    survey_revisions,
+)
+from alembicverify.util import (
+    dispose_engines,
+    make_alembic_config,
+    prepare_schema_from_migrations,
+)
+
+from test import alembic_root
+
+
+@pytest.yield_fixture(autouse=True)
+def cleanup():
+    yield
+    dispose_engines()
+    util._scripts.clear()
+
+
+def make_database(tmpdir, name, revision=None):
+    uri = 'sqlite:///{}'.format(tmpdir.join(name))
+    if revision is not None:
+        prepare_schema_from_migrations(
+            uri, make_alembic_config(uri, alembic_root), revision)
+    return uri
+
+
+def test_survey_revisions(tmpdir):
+    head = make_database(tmpdir, 'head.db', 'head')
+    behind = make_database(tmpdir, 'behind.db', 'aaa111')
+    base = make_database(tmpdir, 'base.db')
+    stranger = make_database(tmpdir, 'stranger.db', 'aaa111')
+    engine = create_engine(stranger)
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE alembic_version SET version_num='zzz999'"))
+    engine.dispose()
+    missing = 'sqlite:///{}'.format(tmpdir.join('no', 'such', 'file.db'))
+
+    report = survey_revisions(
+        [head, behind, base, stranger, missing],
+        make_alembic_config(head, alembic_root),
+        workers=2,
+    )
+
+    assert ('ccc333', ) == report.heads
+    assert [(head, ('ccc333', ))] == [
+        (result.uri, result.revisions) for result in report.at_head]
+    assert [(behind, ('aaa111', )), (base, ())] == [
+        (result.uri, result.revisions) for result in report.behind]
+    assert [stranger, missing] == [result.uri for result in report.unknown]
+    assert ('zzz999', ) == report.unknown[0].revisions
+    assert report.unknown[0].error is None
+    assert report.unknown[1].revisions is None
+    assert report.unknown[1].error.startswith('OperationalError: ')
+    for result in report.at_head + report.behind + report.unknown:
+        assert result.latency >= 0
+
+
+@patch.object(survey, 'make_pool')
+def test_survey_revisions_pool_size(make_pool, tmpdir):
+    make_pool.return_value.map.return_value = []
+    config = make_alembic_config('sqlite://', alembic_root)
+
+    survey_revisions(['a', 'b'], config, workers=8)
+    survey_revisions([], config, workers=8)
+
+    assert [((2, ), {}), ((1, ), {})] == make_pool.call_args_list
+    assert 2 == make_pool.return_value.close.call_count
+    assert 2 == make_pool.return_value.join.call_count
+
+
+def test_read_database_revisions(tmpdir):
+    uri = make_database(tmpdir, 'db.sqlite', 'bbb222')
+
+    result = read_database_revisions(uri)
+
+    assert isinstance(result, DatabaseRevision)
+    assert (uri, ('bbb222', ), None) == (
+        result.uri, result.revisions, result.error)
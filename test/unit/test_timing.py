@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from alembic.environment import EnvironmentContext
+from alembic.script import ScriptDirectory
+from mock import Mock
+from sqlalchemy import create_engine
+
+from alembicverify.timing import (
+    MigrationTimer,
+    RevisionTiming,
+    make_environment_context,
+)
+from alembicverify.util import make_alembic_config, upgrade
+from alembicverify.walker import walk_revisions
+
+from test import alembic_root
+
+
+@pytest.fixture
+def uri(tmpdir):
+    return 'sqlite:///{}'.format(tmpdir.join('db.sqlite'))
+
+
+@pytest.fixture
+def timer():
+    return MigrationTimer()
+
+
+@pytest.fixture
+def config(uri, timer):
+    config = make_alembic_config(uri, alembic_root)
+    config.attributes['timer'] = timer
+    return config
+
+
+def test_timer_slowest_and_report(timer):
+    fast = RevisionTiming('a', 'upgrade', 0.1, 2)
+    slow = RevisionTiming('b', 'downgrade', 1.5, 3)
+    timer.record(fast)
+    timer.record(slow)
+
+    assert [slow, fast] == timer.slowest()
+    assert [slow] == timer.slowest(1)
+    assert [
+        '1.5000s downgrade b (3 statements)',
+        '0.1000s upgrade a (2 statements)',
+    ] == timer.report()
+
+
+def test_make_environment_context(config, timer):
+    script = ScriptDirectory.from_config(config)
+
+    with make_environment_context(config, script, tag='tag') as env:
+        assert isinstance(env, EnvironmentContext)
+        assert 'tag' == env.get_tag_argument()
+        assert env.configure.__self__ is not env
+
+    del config.attributes['timer']
+    with make_environment_context(config, script) as env:
+        assert env.configure.__self__ is env
+
+
+def test_timer_with_walker(config, timer, uri):
+    engine = create_engine(uri)
+    script = ScriptDirectory.from_config(config)
+
+    list(walk_revisions(config, engine, script))
+
+    assert [
+        ('aaa111', 'upgrade'),
+        ('bbb222', 'upgrade'),
+        ('ccc333', 'upgrade'),
+        ('ccc333', 'downgrade'),
+        ('bbb222', 'downgrade'),
+        ('aaa111', 'downgrade'),
+    ] == [(timing.revision, timing.direction) for timing in timer.timings]
+    assert all(timing.duration >= 0 for timing in timer.timings)
+    # One statement for the migration and one for the version table, at
+    # least.
+    assert all(timing.statements >= 2 for timing in timer.timings)
+
+
+def test_timer_with_env_py(config, timer):
+    upgrade(config, 'head')
+
+    assert ['aaa111', 'bbb222', 'ccc333'] == [
+        timing.revision for timing in timer.timings]
+
+
+def test_timer_keeps_other_callbacks(config, timer, uri):
+    engine = create_engine(uri)
+    script = ScriptDirectory.from_config(config)
+    single, multiple = Mock(), Mock()
+
+    for callbacks in (single, [multiple]):
+        with engine.connect() as conn:
+            with make_environment_context(
+                    config, script,
+                    fn=lambda rev, context: script._upgrade_revs('+1', rev),
+            ) as env:
+                env.configure(connection=conn, on_version_apply=callbacks)
+                with env.begin_transaction():
+                    env.run_migrations()
+
+    assert 1 == single.call_count
+    assert 1 == multiple.call_count
+    assert 2 == len(timer.timings)
+
+
+def test_timer_offline_mode(config, timer, uri):
+    script = ScriptDirectory.from_config(config)
+
+    with make_environment_context(
+            config, script, as_sql=True,
+            fn=lambda rev, context: script._upgrade_revs('head', None),
+    ) as env:
+        env.configure(url=uri, output_buffer=Mock())
+        with env.begin_transaction():
+            env.run_migrations()
+
+    assert [0, 0, 0] == [timing.statements for timing in timer.timings]
+
+
+def test_timer_removes_listener(config, timer, uri):
+    engine = create_engine(uri)
+    script = ScriptDirectory.from_config(config)
+
+    with engine.connect() as conn:
+        config.attributes['connection'] = conn
+        upgrade(config, '+1', script=script)
+        upgrade(config, '+1', script=script)
+
+        assert 0 == len(conn.dispatch.before_cursor_execute)
+
+    assert 2 == len(timer.timings)
@@ -1,16 +1,44 @@
 # -*- coding: utf-8 -*-
+from multiprocessing.pool import ThreadPool
+
 import pytest
+from alembic.script import ScriptDirectory
 from mock import MagicMock, Mock, patch, call
+from sqlalchemy import Column, Integer, Table
+from sqlalchemy.ext.declarative import declarative_base
 
+from alembicverify import util
 from alembicverify.util import (
+    Revisions,
     _get_revision,
+    config_from_options,
+    dispose_engines,
+    downgrade,
+    get_config_options,
+    get_connection,
     get_current_revision,
+    get_engine,
     get_head_revision,
+    get_head_revisions,
+    get_revisions,
     make_alembic_config,
+    load_script_directory,
+    make_pool,
     prepare_schema_from_migrations,
+    prepare_schemas_concurrently,
+    upgrade,
+    use_schema,
 )
 
-from test import assert_items_equal
+from test import alembic_root as migrations_root, assert_items_equal
+
+
+@pytest.yield_fixture(autouse=True)
+def clear_engine_registry():
+    yield
+    util._engines.clear()
+    util._connections.clear()
+    util._scripts.clear()
 
 
 @pytest.yield_fixture
@@ -26,14 +54,14 @@ def Config_mock():
 
 
 @pytest.yield_fixture
-def script_directory_mock():
-    with patch('alembicverify.util.ScriptDirectory') as m:
+def load_script_mock():
+    with patch('alembicverify.util.load_script_directory') as m:
         yield m
 
 
 @pytest.yield_fixture
-def command_mock():
-    with patch('alembicverify.util.command') as m:
+def upgrade_mock():
+    with patch('alembicverify.util.upgrade') as m:
         yield m
 
 
@@ -43,6 +71,12 @@ def EnvironmentContext_mock():
         yield m
 
 
+@pytest.yield_fixture
+def make_environment_context_mock():
+    with patch('alembicverify.util.make_environment_context') as m:
+        yield m
+
+
 @pytest.yield_fixture
 def _get_revision_mock():
     with patch('alembicverify.util._get_revision') as m:
@@ -65,34 +99,237 @@ def test_make_alembic_config(Config_mock):
 
 
 def test_prepare_schema_for_migrations(
-        Config_mock, create_engine_mock, script_directory_mock, command_mock):
+        Config_mock, create_engine_mock, load_script_mock, upgrade_mock):
     uri = "Migrations URI"
     config = Config_mock.return_value
+    config.attributes = {}
 
     engine, script = prepare_schema_from_migrations(
         uri, config, revision="some revision")
 
     assert create_engine_mock.return_value == engine
-    assert script_directory_mock.from_config.return_value == script
+    assert load_script_mock.return_value == script
 
     create_engine_mock.assert_called_once_with(uri)
-    script_directory_mock.from_config.assert_called_once_with(config)
-    command_mock.upgrade.assert_called_once_with(config, "some revision")
+    load_script_mock.assert_called_once_with(config)
+    upgrade_mock.assert_called_once_with(
+        config, "some revision", script=load_script_mock.return_value)
 
 
 def test_prepare_schema_for_migrations_default_revision_value(
-        Config_mock, create_engine_mock, script_directory_mock, command_mock):
+        Config_mock, create_engine_mock, load_script_mock, upgrade_mock):
     uri = "Migrations URI"
     config = Config_mock.return_value
+    config.attributes = {}
 
     engine, script = prepare_schema_from_migrations(uri, config)
 
     assert create_engine_mock.return_value == engine
-    assert script_directory_mock.from_config.return_value == script
+    assert load_script_mock.return_value == script
 
     create_engine_mock.assert_called_once_with(uri)
-    script_directory_mock.from_config.assert_called_once_with(config)
-    command_mock.upgrade.assert_called_once_with(config, "head")
+    load_script_mock.assert_called_once_with(config)
+    upgrade_mock.assert_called_once_with(
+        config, "head", script=load_script_mock.return_value)
+
+
+def test_prepare_schema_for_migrations_given_connection(
+        Config_mock, create_engine_mock, load_script_mock, upgrade_mock):
+    config = Config_mock.return_value
+    config.attributes = {'connection': 'connection'}
+
+    with patch('alembicverify.util.get_connection') as get_connection:
+        prepare_schema_from_migrations("Migrations URI", config)
+
+    assert not get_connection.called
+    assert 'connection' == config.attributes['connection']
+
+
+@pytest.fixture
+def snapshot_config(tmpdir):
+    def make_config(name):
+        uri = 'sqlite:///{}'.format(tmpdir.join(name))
+        config = make_alembic_config(uri, migrations_root)
+        config.attributes['snapshot_dir'] = str(tmpdir.join('snapshots'))
+        return uri, config
+    return make_config
+
+
+def _current_revision(uri, config):
+    return get_current_revision(config, get_engine(uri), None)
+
+
+def test_prepare_schema_for_migrations_snapshot(snapshot_config, tmpdir):
+    uri, config = snapshot_config('first.db')
+
+    with patch('alembicverify.util.upgrade', wraps=upgrade) as upgrade_mock:
+        prepare_schema_from_migrations(
+            uri, config, snapshot_dir=config.attributes.pop('snapshot_dir'))
+        assert 1 == upgrade_mock.call_count
+        assert 1 == len(tmpdir.join('snapshots').listdir())
+
+        # Restored from the snapshot.
+        other_uri, other_config = snapshot_config('second.db')
+        prepare_schema_from_migrations(other_uri, other_config)
+        assert 1 == upgrade_mock.call_count
+
+        # Already at head.
+        prepare_schema_from_migrations(other_uri, other_config)
+        assert 1 == upgrade_mock.call_count
+
+    assert 'ccc333' == _current_revision(other_uri, other_config)
+    dispose_engines()
+
+
+def test_prepare_schema_for_migrations_snapshot_relative(
+        snapshot_config, tmpdir):
+    uri, config = snapshot_config('first.db')
+
+    prepare_schema_from_migrations(uri, config, revision='+1')
+    prepare_schema_from_migrations(uri, config, revision='+1')
+    assert 'bbb222' == _current_revision(uri, config)
+
+    # The snapshot of "+1" from base is the one of aaa111.
+    other_uri, other_config = snapshot_config('second.db')
+    prepare_schema_from_migrations(other_uri, other_config, revision='aaa111')
+    assert 'aaa111' == _current_revision(other_uri, other_config)
+    assert 1 == len(tmpdir.join('snapshots').listdir())
+    dispose_engines()
+
+
+def test_prepare_schema_for_migrations_snapshot_not_at_base(
+        snapshot_config, tmpdir):
+    uri, config = snapshot_config('first.db')
+    prepare_schema_from_migrations(uri, config)
+    other_uri, other_config = snapshot_config('second.db')
+    prepare_schema_from_migrations(other_uri, other_config, revision='+1')
+
+    with patch('alembicverify.util.load_snapshot') as load:
+        prepare_schema_from_migrations(other_uri, other_config)
+
+    assert not load.called
+    assert 'ccc333' == _current_revision(other_uri, other_config)
+    assert 2 == len(tmpdir.join('snapshots').listdir())
+    dispose_engines()
+
+
+@pytest.yield_fixture
+def prepare_mocks():
+    with patch('alembicverify.util.prepare_schema_from_migrations') as left, \
+            patch('sqlalchemydiff.util.prepare_schema_from_models') as right:
+        yield left, right
+
+
+def test_prepare_schemas_concurrently(create_engine_mock, prepare_mocks):
+    prepare_left, prepare_right = prepare_mocks
+    config = make_alembic_config("left", "root")
+
+    left, right = prepare_schemas_concurrently(
+        "left", config, "right", "Base", revision="+1")
+
+    assert prepare_left.return_value == left
+    assert create_engine_mock.return_value == right
+    prepare_left.assert_called_once_with("left", config, "+1")
+    prepare_right.assert_called_once_with("right", "Base")
+    assert [call("left"), call("right")] == (
+        create_engine_mock.call_args_list)
+    # The connection of the worker thread is not kept.
+    assert 'connection' not in config.attributes
+
+
+def test_prepare_schemas_concurrently_given_connection(
+        create_engine_mock, prepare_mocks):
+    prepare_left, _ = prepare_mocks
+    config = make_alembic_config("left", "root")
+    config.attributes['connection'] = connection = Mock()
+
+    prepare_schemas_concurrently("left", config, "right", "Base")
+
+    assert connection is config.attributes['connection']
+    create_engine_mock.assert_called_once_with("right")
+
+
+def test_prepare_schemas_concurrently_sqlite(tmpdir):
+    Base = declarative_base()
+    Table('items', Base.metadata, Column('id', Integer, primary_key=True))
+    uri_left = 'sqlite:///{}'.format(tmpdir.join('left.db'))
+    uri_right = 'sqlite:///{}'.format(tmpdir.join('right.db'))
+    config = make_alembic_config(uri_left, migrations_root)
+
+    (engine, script), _ = prepare_schemas_concurrently(
+        uri_left, config, uri_right, Base)
+
+    # The connection used in the worker thread is not reused here.
+    assert uri_left not in util._connections
+    assert 'ccc333' == get_current_revision(config, engine, script)
+    prepare_schema_from_migrations(
+        uri_left, make_alembic_config(uri_left, migrations_root))
+    dispose_engines()
+
+
+def test_prepare_schemas_concurrently_with_processes(
+        create_engine_mock, load_script_mock, prepare_mocks):
+    prepare_left, prepare_right = prepare_mocks
+    config = make_alembic_config("left", "root")
+    config.attributes['snapshot_dir'] = "snapshots"
+
+    with patch('alembicverify.util.multiprocessing.Pool', ThreadPool), \
+            patch('alembicverify.util.dispose_engines') as dispose_engines:
+        left, right = prepare_schemas_concurrently(
+            "left", config, "right", "Base", processes=True)
+
+    assert (create_engine_mock.return_value,
+            load_script_mock.return_value) == left
+    assert create_engine_mock.return_value == right
+    assert [call("left"), call("right")] == (
+        create_engine_mock.call_args_list)
+
+    (uri, worker_config, revision), _ = prepare_left.call_args
+    assert ("left", "head") == (uri, revision)
+    assert worker_config is not config
+    assert "root" == worker_config.get_main_option("script_location")
+    assert {'snapshot_dir': "snapshots"} == worker_config.attributes
+    dispose_engines.assert_called_once_with()
+    prepare_right.assert_called_once_with("right", "Base")
+
+
+def test_prepare_schemas_concurrently_propagates_errors(
+        create_engine_mock, prepare_mocks):
+    prepare_left, _ = prepare_mocks
+    prepare_left.side_effect = ValueError("boom")
+
+    with pytest.raises(ValueError):
+        prepare_schemas_concurrently(
+            "left", make_alembic_config("left", "root"), "right", "Base")
+
+
+def test_make_pool():
+    pool = make_pool(1)
+    try:
+        assert isinstance(pool, ThreadPool)
+    finally:
+        pool.close()
+
+
+def test_make_pool_with_processes():
+    with patch('alembicverify.util.multiprocessing') as multiprocessing:
+        pool = make_pool(3, processes=True)
+
+    assert multiprocessing.Pool.return_value == pool
+    multiprocessing.Pool.assert_called_once_with(3)
+
+
+def test_config_options_round_trip():
+    config = make_alembic_config("sqlite:///%(here)s/db", "root")
+    config.attributes.update({'snapshot_dir': "snapshots", 'engine': Mock()})
+
+    options = get_config_options(config)
+    rebuilt = config_from_options(options)
+
+    assert "root" == rebuilt.get_main_option("script_location")
+    assert "sqlite:///%(here)s/db" == rebuilt.file_config.get(
+        "alembic", "sqlalchemy.url", raw=True)
+    assert {'snapshot_dir': "snapshots"} == rebuilt.attributes
 
 
 def test_get_current_revision(_get_revision_mock):
@@ -115,26 +352,47 @@ def test_get_head_revision(_get_revision_mock):
 
 
 def test__get_revision_head(EnvironmentContext_mock):
-    config, engine, script = Mock(), MagicMock(), Mock()
+    config, engine, script = Mock(attributes={}), MagicMock(), Mock()
 
     revision = _get_revision(config, engine, script, revision_type='head')
 
-    engine.connect.assert_called_once_with()
-    EnvironmentContext_mock.assert_called_once_with(config, script)
+    assert not engine.connect.called
+    assert not EnvironmentContext_mock.called
+    script.as_revision_number.assert_called_once_with('head')
+    assert script.as_revision_number.return_value == revision
 
-    env_context = EnvironmentContext_mock().__enter__.return_value
-    conn = engine.connect().__enter__.return_value
 
-    env_context.configure.assert_called_once_with(
-        conn, version_table='alembic_version')
+def test_get_head_revision_without_database():
+    config = make_alembic_config(
+        'sqlite:///missing/path.db', migrations_root)
+    script = ScriptDirectory.from_config(config)
 
-    env_context.get_head_revision.assert_called_once_with()
+    assert 'ccc333' == get_head_revision(config, None, script)
+    assert ('ccc333',) == get_head_revisions(script)
 
-    assert env_context.get_head_revision.return_value == revision
+
+def test_get_head_revisions():
+    script = Mock()
+    script.get_heads.return_value = ['b', 'a']
+
+    assert ('b', 'a') == get_head_revisions(script)
+
+
+def test_get_revisions(_get_revision_mock):
+    config, engine, script = Mock(), Mock(), Mock()
+
+    revisions = get_revisions(config, engine, script)
+
+    assert Revisions(
+        current=_get_revision_mock.return_value,
+        head=script.as_revision_number.return_value,
+    ) == revisions
+    _get_revision_mock.assert_called_once_with(config, engine, script)
+    script.as_revision_number.assert_called_once_with('head')
 
 
 def test__get_revision_current(EnvironmentContext_mock):
-    config, engine, script = Mock(), MagicMock(), Mock()
+    config, engine, script = Mock(attributes={}), MagicMock(), Mock()
 
     revision = _get_revision(config, engine, script)
 
@@ -152,3 +410,179 @@ def test__get_revision_current(EnvironmentContext_mock):
     migration_context = env_context.get_context.return_value
 
     assert migration_context.get_current_revision.return_value == revision
+
+
+def test__get_revision_uses_connection_from_config(EnvironmentContext_mock):
+    conn = Mock()
+    config = Mock(attributes={'connection': conn})
+    engine, script = Mock(), Mock()
+
+    revision = _get_revision(config, engine, script)
+
+    assert not engine.connect.called
+    env_context = EnvironmentContext_mock().__enter__.return_value
+    env_context.configure.assert_called_once_with(
+        conn, version_table='alembic_version')
+    migration_context = env_context.get_context.return_value
+    assert migration_context.get_current_revision.return_value == revision
+
+
+def test_get_engine_is_cached(create_engine_mock):
+    create_engine_mock.side_effect = lambda uri: Mock(uri=uri)
+
+    engine = get_engine("uri")
+
+    assert engine is get_engine("uri")
+    assert engine is not get_engine("other")
+    assert [call("uri"), call("other")] == create_engine_mock.call_args_list
+
+
+def test_get_connection_is_cached(create_engine_mock):
+    engine = create_engine_mock.return_value
+
+    conn = get_connection("uri")
+
+    assert engine.connect.return_value == conn
+    assert conn is get_connection("uri")
+    engine.connect.assert_called_once_with()
+
+
+def test_dispose_engines(create_engine_mock):
+    create_engine_mock.side_effect = lambda uri: Mock(uri=uri)
+    left, right = get_engine("left"), get_engine("right")
+    conn = get_connection("left")
+
+    dispose_engines()
+
+    conn.close.assert_called_once_with()
+    left.dispose.assert_called_once_with()
+    right.dispose.assert_called_once_with()
+    assert get_engine("left") is not left
+
+
+def test_dispose_engines_for_uri(create_engine_mock):
+    create_engine_mock.side_effect = lambda uri: Mock(uri=uri)
+    left, right = get_engine("left"), get_engine("right")
+
+    dispose_engines("left")
+    dispose_engines("missing")
+
+    left.dispose.assert_called_once_with()
+    assert not right.dispose.called
+    assert get_engine("right") is right
+
+
+@patch('alembicverify.util.event')
+def test_use_schema(event_mock, create_engine_mock):
+    create_engine_mock.side_effect = lambda uri: Mock(uri=uri)
+    previous = get_engine("uri")
+    dbapi_connection = Mock()
+
+    engine = use_schema("uri", "test_1")
+
+    previous.dispose.assert_called_once_with()
+    assert engine is get_engine("uri")
+    (listened, name, listener), kwargs = event_mock.listen.call_args
+    assert (engine, 'connect', {'insert': True}) == (listened, name, kwargs)
+
+    listener(dbapi_connection, None)
+
+    cursor = dbapi_connection.cursor.return_value
+    assert [call('SET search_path TO {}'.format(
+        engine.dialect.identifier_preparer.quote.return_value))] == (
+            cursor.execute.call_args_list)
+    cursor.close.assert_called_once_with()
+    dbapi_connection.commit.assert_called_once_with()
+
+
+@pytest.fixture
+def alembic_root(tmpdir):
+    root = tmpdir.mkdir('alembic')
+    root.join('env.py').write('')
+    root.mkdir('versions').join('aaa_first.py').write(
+        'revision = "aaa"\ndown_revision = None\n')
+    return root
+
+
+def test_load_script_directory_is_cached(alembic_root):
+    config = make_alembic_config("sqlite://", str(alembic_root))
+
+    script = load_script_directory(config)
+
+    assert script is load_script_directory(config)
+    assert script is load_script_directory(
+        make_alembic_config("sqlite://", str(alembic_root)))
+    assert 'aaa' == script.get_current_head()
+
+
+def test_load_script_directory_indexed(alembic_root):
+    config = make_alembic_config("sqlite://", str(alembic_root))
+    config.attributes['revision_index'] = True
+
+    with patch('alembicverify.util.use_revision_index') as use_index:
+        script = load_script_directory(config)
+        assert script is load_script_directory(config)
+        assert script is not load_script_directory(config, indexed=False)
+
+    use_index.assert_called_once_with(script)
+
+
+def test_load_script_directory_is_invalidated(alembic_root):
+    config = make_alembic_config("sqlite://", str(alembic_root))
+    script = load_script_directory(config)
+    assert 'aaa' == script.get_current_head()
+
+    alembic_root.join('versions', 'bbb_second.py').write(
+        'revision = "bbb"\ndown_revision = "aaa"\n')
+
+    new_script = load_script_directory(config)
+    assert new_script is not script
+    assert 'bbb' == new_script.get_current_head()
+    assert new_script is load_script_directory(config)
+
+
+@pytest.mark.parametrize('function,method', [
+    (upgrade, '_upgrade_revs'),
+    (downgrade, '_downgrade_revs'),
+])
+def test_upgrade_and_downgrade(
+        make_environment_context_mock, load_script_mock, function, method):
+    config = Mock()
+    script = load_script_mock.return_value
+
+    function(config, "revision")
+
+    load_script_mock.assert_called_once_with(config)
+    script.run_env.assert_called_once_with()
+    (context_config, context_script), kwargs = (
+        make_environment_context_mock.call_args)
+    assert (config, script) == (context_config, context_script)
+    assert "revision" == kwargs['destination_rev']
+
+    assert getattr(script, method).return_value == kwargs['fn']("rev", None)
+    getattr(script, method).assert_called_once_with("revision", "rev")
+
+
+@pytest.mark.parametrize('function', [upgrade, downgrade])
+def test_upgrade_and_downgrade_with_script(
+        make_environment_context_mock, load_script_mock, function):
+    script = Mock()
+
+    function(Mock(), "head", script=script)
+
+    assert not load_script_mock.called
+    script.run_env.assert_called_once_with()
+
+
+def test_upgrade_and_downgrade_run_env(tmpdir):
+    uri = 'sqlite:///{}'.format(tmpdir.join('db.sqlite'))
+    config = make_alembic_config(uri, migrations_root)
+    engine = get_engine(uri)
+    script = load_script_directory(config)
+
+    upgrade(config, "bbb222")
+    assert 'bbb222' == get_current_revision(config, engine, script)
+
+    downgrade(config, "base")
+    assert None is get_current_revision(config, engine, script)
+    dispose_engines()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+
+import alembic
+import pytest
+import sqlalchemy
+from alembic.script import ScriptDirectory
+from mock import patch
+from sqlalchemy import Column, Index, Integer, MetaData, Table
+from sqlalchemy.dialects import sqlite
+
+from alembicverify.util import make_alembic_config
+from alembicverify.verdicts import (
+    VERDICT_FORMAT,
+    VerdictCache,
+    get_dialect,
+    get_fingerprint,
+    get_metadata_ddl,
+)
+
+from test import alembic_root as migrations_root, make_metadata
+
+
+@pytest.fixture
+def alembic_root(tmpdir):
+    root = str(tmpdir.join('migrations'))
+    shutil.copytree(
+        migrations_root, root, ignore=shutil.ignore_patterns('__pycache__'))
+    return root
+
+
+@pytest.fixture
+def script(alembic_root):
+    return ScriptDirectory.from_config(
+        make_alembic_config('sqlite://', alembic_root))
+
+
+@pytest.fixture
+def dialect():
+    return sqlite.dialect()
+
+
+def test_get_fingerprint_is_stable(script, dialect):
+    assert (
+        get_fingerprint(script, make_metadata(), dialect, extra=['a']) ==
+        get_fingerprint(script, make_metadata(), dialect, extra=['a'])
+    )
+
+
+def test_get_fingerprint_models(script, dialect):
+    metadata = make_metadata()
+    fingerprint = get_fingerprint(script, metadata, dialect)
+
+    metadata.tables['companies'].append_column(Column('size', Integer))
+
+    assert fingerprint != get_fingerprint(script, metadata, dialect)
+    assert fingerprint != get_fingerprint(script)
+
+
+@pytest.mark.parametrize('name', ['postgresql', 'sqlite'])
+def test_get_fingerprint_comments(script, name):
+    dialect = get_dialect('{}://'.format(name))
+    metadata = make_metadata()
+    fingerprint = get_fingerprint(script, metadata, dialect)
+
+    metadata.tables['companies'].c.name.comment = 'The name'
+    column_fingerprint = get_fingerprint(script, metadata, dialect)
+    metadata.tables['companies'].comment = 'The companies'
+
+    assert fingerprint != column_fingerprint
+    assert column_fingerprint != get_fingerprint(script, metadata, dialect)
+
+
+@pytest.mark.parametrize('library', [alembic, sqlalchemy])
+def test_get_fingerprint_library_versions(script, library):
+    fingerprint = get_fingerprint(script)
+
+    with patch.object(library, '__version__', '0.0.1'):
+        assert fingerprint != get_fingerprint(script)
+
+
+def test_get_fingerprint_migrations(script, alembic_root, dialect):
+    fingerprint = get_fingerprint(script, make_metadata(), dialect)
+
+    path = os.path.join(
+        alembic_root, 'versions', 'ccc333_employees_name_index.py')
+    with open(path, 'a') as stream:
+        stream.write('# changed\n')
+
+    assert fingerprint != get_fingerprint(script, make_metadata(), dialect)
+
+
+def test_get_fingerprint_extra(script):
+    assert get_fingerprint(script, extra=['models', []]) != get_fingerprint(
+        script, extra=['models', ['companies']])
+
+
+def test_get_metadata_ddl(dialect):
+    metadata = MetaData()
+    Table('b', metadata, Column('id', Integer, primary_key=True),
+          Column('x', Integer), Index('ix_b_x', 'x'))
+    Table('a', metadata, Column('id', Integer, primary_key=True),
+          comment='The a table')
+
+    assert (
+        'CREATE TABLE a ( id INTEGER NOT NULL, PRIMARY KEY (id) )\n'
+        'CREATE TABLE b ( id INTEGER NOT NULL, x INTEGER, PRIMARY KEY (id) )'
+        '\nCREATE INDEX ix_b_x ON b (x)\n'
+        '[["a", "The a table", [["id", null]]], '
+        '["b", null, [["id", null], ["x", null]]]]'
+    ) == get_metadata_ddl(metadata, dialect)
+
+
+def test_get_dialect():
+    dialect = get_dialect('sqlite:///some/file.db')
+
+    assert 'sqlite' == dialect.name
+
+
+def test_verdict_cache(tmpdir):
+    cache = VerdictCache(str(tmpdir.join('verdicts')))
+
+    assert cache.get('abc') is None
+
+    cache.put('abc', False, {'tables': {'left_only': ['t']}})
+
+    assert {
+        'passed': False, 'errors': {'tables': {'left_only': ['t']}},
+    } == cache.get('abc')
+    assert ['abc.json'] == [
+        path.basename for path in tmpdir.join('verdicts').listdir()]
+
+
+def test_verdict_cache_existing_folder(tmpdir):
+    cache = VerdictCache(str(tmpdir))
+
+    cache.put('abc', True, {})
+
+    assert {'passed': True, 'errors': {}} == cache.get('abc')
+
+
+@pytest.mark.parametrize('content', [
+    'not json',
+    json.dumps({'format': VERDICT_FORMAT + 1, 'passed': True, 'errors': {}}),
+])
+def test_verdict_cache_invalid_file(tmpdir, content):
+    tmpdir.join('abc.json').write(content)
+
+    assert VerdictCache(str(tmpdir)).get('abc') is None
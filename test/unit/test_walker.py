@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, inspect
+
+from alembicverify.util import make_alembic_config
+from alembicverify.walker import (
+    DOWNGRADE,
+    UPGRADE,
+    RevisionStep,
+    migrate,
+    walk_revisions,
+)
+
+from test import alembic_root
+
+
+@pytest.fixture
+def uri(tmpdir):
+    return 'sqlite:///{}'.format(tmpdir.join('walker.db'))
+
+
+@pytest.fixture
+def config(uri):
+    return make_alembic_config(uri, alembic_root)
+
+
+@pytest.fixture
+def script(config):
+    return ScriptDirectory.from_config(config)
+
+
+@pytest.yield_fixture
+def engine(uri):
+    engine = create_engine(uri)
+    yield engine
+    engine.dispose()
+
+
+def test_walk_revisions(config, engine, script):
+    steps = []
+    for step in walk_revisions(config, engine, script):
+        steps.append((step, sorted(inspect(engine).get_table_names())))
+
+    assert [
+        (RevisionStep(UPGRADE, None, 'aaa111'),
+         ['alembic_version', 'companies']),
+        (RevisionStep(UPGRADE, 'aaa111', 'bbb222'),
+         ['alembic_version', 'companies', 'employees']),
+        (RevisionStep(UPGRADE, 'bbb222', 'ccc333'),
+         ['alembic_version', 'companies', 'employees']),
+        (RevisionStep(DOWNGRADE, 'ccc333', 'bbb222'),
+         ['alembic_version', 'companies', 'employees']),
+        (RevisionStep(DOWNGRADE, 'bbb222', 'aaa111'),
+         ['alembic_version', 'companies']),
+        (RevisionStep(DOWNGRADE, 'aaa111', None),
+         ['alembic_version']),
+    ] == steps
+
+
+def test_walk_revisions_upgrade_only_from_current(config, engine, script):
+    with engine.connect() as conn:
+        migrate(config, script, conn, UPGRADE, 'aaa111')
+
+    steps = list(walk_revisions(config, engine, script, downgrade=False))
+
+    assert [
+        RevisionStep(UPGRADE, 'aaa111', 'bbb222'),
+        RevisionStep(UPGRADE, 'bbb222', 'ccc333'),
+    ] == steps
+
+
+def test_walk_revisions_uses_connection_from_config(config, engine, script):
+    with engine.connect() as conn:
+        config.attributes['connection'] = conn
+        steps = list(walk_revisions(config, None, script))
+
+    assert 6 == len(steps)
+
+
+def test_migrate(config, engine, script):
+    with engine.connect() as conn:
+        assert 'bbb222' == migrate(config, script, conn, UPGRADE, 'bbb222')
+        assert 'aaa111' == migrate(config, script, conn, DOWNGRADE, '-1')
+        assert 'ccc333' == migrate(config, script, conn, UPGRADE, 'head')
+        assert None is migrate(config, script, conn, DOWNGRADE, 'base')